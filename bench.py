@@ -0,0 +1,759 @@
+'''
+Timing benchmarks for lifesim.
+
+Run "python bench.py" for every benchmark, or name the ones you
+want, e.g. "python bench.py regrowth".
+'''
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import checkpoint
+from chunked import ChunkedGrid
+from dstarlite import ReplanningPathFinder
+from engine import Engine
+from flowfield import FoodField
+import hpastar
+import lifesim as ls
+import pathfinder
+from population import Population
+from priorityqueueset import PriorityQueueSet, IndexedPriorityQueueSet
+from recorder import Recorder, read_ticks
+
+
+def time_ticks(tick, ticks):
+    '''
+    Call tick() the given number of times and return ticks/second.
+    '''
+    start = time.time()
+    for i in range(ticks):
+        tick()
+    return ticks / (time.time() - start)
+
+
+def bench_regrowth():
+    '''
+    Vegetation stage of Grid.update on large maps. Uses a bare
+    VegetationLayer, since a Grid this size would spend all its
+    time building Node objects.
+    '''
+    for size, ticks in [(1000, 50), (4000, 5)]:
+        layer = ls.VegetationLayer(size, size)
+        layer.fill(5, 1, 10)
+        layer.amount[::7, ::3] = 0
+        layer.growth_rate = .1
+        layer.decay_rate = .01
+        print "regrowth %sx%s: %.1f ticks/s" % (
+            size, size, time_ticks(layer.grow, ticks))
+        layer.diffusion_rate = .2
+        print "regrowth+diffusion %sx%s: %.1f ticks/s" % (
+            size, size, time_ticks(layer.grow, ticks))
+
+
+def queue_workload(open_size, steps):
+    '''
+    An A*-like sequence of queue operations: each step pops the
+    best item and pushes 8 successors drawn from a pool of about
+    open_size keys, so most pushes hit an item already queued and
+    a fair share of those improve its priority.
+    '''
+    rand = random.Random(0)
+    ops = []
+    for i in range(steps):
+        ops.append(None)
+        for j in range(8):
+            ops.append((rand.randrange(open_size), rand.random() * i))
+    return ops
+
+
+def run_queue_workload(queue_class, ops):
+    queue = queue_class()
+    updates = 0
+    start = time.time()
+    for op in ops:
+        if op is None:
+            if len(queue):
+                queue.pop_smallest()
+        else:
+            item = pathfinder.PathFinder._Node(op[0], f_cost=op[1])
+            queued = queue.has_item(item)
+            if queue.add(item) and queued:
+                updates += 1
+    return time.time() - start, updates
+
+
+def bench_queue():
+    '''
+    PriorityQueueSet against IndexedPriorityQueueSet on
+    update-heavy workloads with growing open sets.
+    '''
+    for open_size in [100, 1000, 4000]:
+        ops = queue_workload(open_size, 2000)
+        for queue_class in [PriorityQueueSet, IndexedPriorityQueueSet]:
+            elapsed, updates = run_queue_workload(queue_class, ops)
+            print "%s open~%s: %.3fs (%s priority updates)" % (
+                queue_class.__name__, open_size, elapsed, updates)
+
+
+def rough_grid(width, height, rough=.3, seed=0):
+    '''
+    Plains where a fraction rough of the cells cost more to enter.
+    '''
+    rand = random.Random(seed)
+    grid = ls.Grid(width, height)
+    for row in grid.nodes:
+        for node in row:
+            node.make_plain()
+            if rand.random() < rough:
+                node.move_cost = rand.choice([2, 3, 5, 20])
+    return grid
+
+
+def random_queries(grid, count, seed=0):
+    rand = random.Random(seed)
+    cells = grid.cells()
+    return [(rand.choice(cells), rand.choice(cells)) for i in range(count)]
+
+
+def bench_astar():
+    '''
+    The generic PathFinder against the grid-specialised kernel.
+    '''
+    grid = rough_grid(100, 100)
+    queries = random_queries(grid, 50)
+    generic = pathfinder.PathFinder(grid.neighbors, grid.move_cost, grid.dist)
+    for name, finder in [('PathFinder', generic),
+                         ('GridPathFinder', pathfinder.GridPathFinder(grid))]:
+        start = time.time()
+        for a, b in queries:
+            list(finder.compute_path(a, b))
+        print "%s 100x100, %s paths: %.3fs" % (
+            name, len(queries), time.time() - start)
+
+
+def bench_batch():
+    '''
+    400 path requests on a 200x200 map, a quarter of them repeats,
+    one by one and with compute_paths() on 1, 2 and 4 processes.
+    '''
+    grid = rough_grid(200, 200)
+    queries = random_queries(grid, 300)
+    queries += queries[:100]
+    finder = pathfinder.GridPathFinder(grid)
+    start = time.time()
+    for a, b in queries:
+        finder.compute_path(a, b)
+    print "one by one, %s paths: %.3fs" % (len(queries), time.time() - start)
+    for processes in [1, 2, 4]:
+        finder.compute_paths(queries[:8], processes)
+        start = time.time()
+        finder.compute_paths(queries, processes)
+        print "compute_paths, %s processes: %.3fs" % (
+            processes, time.time() - start)
+        finder.close()
+
+
+def bench_dstarlite():
+    '''
+    20 walkers crossing a 100x100 rough map while 10 cells change
+    cost every step: repairing each walker's D* Lite search
+    against planning again from scratch with A*.
+    '''
+    grid = rough_grid(100, 100)
+    rand = random.Random(1)
+    pairs = [(grid.get_node(0, rand.randrange(100)),
+              grid.get_node(99, rand.randrange(100))) for i in range(20)]
+    changes = [[(rand.randrange(100), rand.randrange(100),
+                 rand.choice([1, 2, 3, 5, 20])) for j in range(10)]
+               for i in range(60)]
+
+    def walk(step):
+        for tick in changes:
+            for x, y, cost in tick:
+                grid.get_node(x, y).move_cost = cost
+            for i in range(len(walkers)):
+                walkers[i] = step(i)
+
+    start = time.time()
+    finder = ReplanningPathFinder(grid)
+    paths = [finder.compute_path(a, b) for a, b in pairs]
+    walkers = [path.next() for path in paths]
+    walk(lambda i: next(paths[i], walkers[i]))
+    print "D* Lite: %.3fs, %s cells expanded (%s by the first searches)" % (
+        time.time() - start, finder.expansions, finder.initial_expansions)
+
+    #the same walks on the same map, replanning with A*
+    grid = rough_grid(100, 100)
+    astar = pathfinder.GridPathFinder(grid, heuristic='chebyshev')
+    walkers = [grid.get_node(a.x, a.y) for a, b in pairs]
+    goals = [grid.get_node(b.x, b.y) for a, b in pairs]
+    def replan(i):
+        path = list(astar.compute_path(walkers[i], goals[i]))
+        return path[1] if len(path) > 1 else walkers[i]
+    start = time.time()
+    walk(replan)
+    print "A* from scratch: %.3fs, %s cells expanded" % (
+        time.time() - start, astar.expansions)
+
+
+def maze_grid(width, height, spacing=20, seed=0):
+    '''
+    Plains crossed every spacing columns by walls of cost 50,
+    each with a 3-cell gap.
+    '''
+    rand = random.Random(seed)
+    grid = ls.Grid(width, height)
+    for x in range(spacing // 2, width, spacing):
+        gap = rand.randrange(height)
+        for y in range(height):
+            if abs(y - gap) > 1:
+                grid.get_node(x, y).move_cost = 50
+    return grid
+
+
+def bench_jps():
+    '''
+    A* against Jump Point Search on open, maze-like and mixed
+    terrain: expansions and wall time for the same queries, with
+    each heuristic.
+    '''
+    maps = [('open', ls.Grid(200, 200)),
+            ('maze', maze_grid(200, 200)),
+            ('mixed', rough_grid(200, 200, rough=.05))]
+    for name, grid in maps:
+        queries = random_queries(grid, 20)
+        for heuristic in ['euclidean', 'chebyshev']:
+            for mode, jump_points in [('A*', False), ('JPS', True)]:
+                finder = pathfinder.GridPathFinder(
+                    grid, jump_points=jump_points, heuristic=heuristic)
+                start = time.time()
+                for a, b in queries:
+                    finder.compute_path(a, b)
+                print "%s %s %s 200x200, %s paths: %.3fs, %s expansions" % (
+                    mode, heuristic, name, len(queries),
+                    time.time() - start, finder.expansions)
+
+
+def bench_hpa():
+    '''
+    Long paths on a 400x400 map: A* against the hierarchical
+    planner, both for the first 10 steps of each path (all a
+    walking organism needs per tick) and for the whole path.
+    '''
+    grid = rough_grid(400, 400)
+    queries = random_queries(grid, 10)
+    for heuristic in ['euclidean', 'chebyshev']:
+        astar = pathfinder.GridPathFinder(grid, heuristic=heuristic)
+        start = time.time()
+        for a, b in queries:
+            list(astar.compute_path(a, b))
+        print "A* %s 400x400, %s paths: %.3fs" % (
+            heuristic, len(queries), time.time() - start)
+
+    start = time.time()
+    hpa = hpastar.HierarchicalPathFinder(grid, cluster_size=20)
+    hpa.compute_path(*queries[0])
+    print "HPA* build: %.3fs" % (time.time() - start)
+    for steps in [10, None]:
+        start = time.time()
+        for a, b in queries:
+            path = iter(hpa.compute_path(a, b))
+            for node, i in zip(path, range(steps or len(grid.cells()))):
+                pass
+        print "HPA* 400x400, %s paths, %s steps: %.3fs" % (
+            len(queries), steps or 'all', time.time() - start)
+    start = time.time()
+    grid.get_node(200, 200).move_cost = 5
+    hpa.compute_path(*queries[0])
+    print "HPA* rebuild after one change: %.3fs" % (time.time() - start)
+
+
+def bench_crowd():
+    '''
+    Occupancy bookkeeping with 200k organisms on a 500x500 map:
+    placing, relocating, radius queries and deaths.
+    '''
+    rand = random.Random(0)
+    grid = ls.Grid(500, 500)
+    cells = grid.cells()
+    orgs = [ls.Organism(grid) for i in range(200000)]
+    start = time.time()
+    for org in orgs:
+        org.set_location(rand.choice(cells))
+    print "place 200k: %.3fs" % (time.time() - start)
+    start = time.time()
+    for org in orgs:
+        org.set_location(rand.choice(grid.neighbors(org.location)))
+    print "step 200k to a neighbour: %.3fs" % (time.time() - start)
+    start = time.time()
+    found = 0
+    for i in range(1000):
+        found += len(grid.organisms_near(rand.choice(cells), 5))
+    print "1000 radius-5 queries: %.3fs (%s found)" % (
+        time.time() - start, found)
+    start = time.time()
+    for org in orgs[::2]:
+        org.die()
+    print "100k deaths: %.3fs" % (time.time() - start)
+
+
+def bench_perception():
+    '''
+    Food search for 20k organisms on sparse 300x300 vegetation,
+    one organism at a time on Vegetation objects against one batch
+    on a vegetation layer, for several sight ranges.
+    '''
+    rand = random.Random(0)
+    food = set((rand.randrange(300), rand.randrange(300))
+               for i in range(2000))
+    grids = [ls.Grid(300, 300), ls.Grid(300, 300, veg_arrays=True)]
+    for grid in grids:
+        for row in grid.nodes:
+            for node in row:
+                node.set_plants(5 if (node.x, node.y) in food else 0, 1, 10)
+        cells = grid.cells()
+        rand = random.Random(1)
+        for i in range(20000):
+            ls.Organism(grid).set_location(rand.choice(cells))
+    for sight_range in [2, 5, 10]:
+        for grid in grids:
+            for org in grid.organisms:
+                org.sight_range = sight_range
+        start = time.time()
+        for org in grids[0].organisms:
+            org.find_plants()
+        print "sight %s, per organism: %.3fs" % (
+            sight_range, time.time() - start)
+        start = time.time()
+        grids[1].find_plants(grids[1].organisms)
+        print "sight %s, batched: %.3fs" % (sight_range, time.time() - start)
+
+
+def population_map(size, seed=0):
+    '''
+    A size x size vegetation-layer map with food on about a tenth
+    of the cells and a few patches of rough ground.
+    '''
+    grid = ls.Grid(size, size, veg_arrays=True, seed=seed)
+    rand = grid.random
+    grid.veg.fill(0, 1, 10)
+    for i in range(size * size // 10):
+        grid.veg.set(rand.randrange(size), rand.randrange(size), 5, 1, 10)
+    grid.veg.growth_rate = .05
+    for i in range(size // 10):
+        x, y = rand.randrange(size - 5), rand.randrange(size - 5)
+        for node in [grid.get_node(x + i, y + j)
+                     for i in range(5) for j in range(5)]:
+            node.move_cost = 3
+    return grid
+
+
+def bench_population():
+    '''
+    Ticks of a 500x500 map with 100k organisms, as Organism objects
+    and as a Population.
+    '''
+    count = 100000
+    rand = random.Random(2)
+    xs = [rand.randrange(500) for i in range(count)]
+    ys = [rand.randrange(500) for i in range(count)]
+    grid = population_map(500)
+    for x, y in zip(xs, ys):
+        org = ls.Organism(grid)
+        org.energy = 80.
+        org.set_location(grid.get_node(x, y))
+    print "objects 100k: %.2f ticks/s" % time_ticks(grid.update, 3)
+    grid = population_map(500)
+    Population(grid, count).add_many(xs, ys, energy=80.)
+    print "population 100k: %.2f ticks/s" % time_ticks(grid.update, 20)
+
+
+def bench_engine():
+    '''
+    Ticks of a 500x500 map with 100k organisms in a Population, on
+    one process and on Engines with 2 and 4 worker processes.
+    '''
+    count = 100000
+    rand = random.Random(2)
+    xs = [rand.randrange(500) for i in range(count)]
+    ys = [rand.randrange(500) for i in range(count)]
+    for processes in [None, 2, 4]:
+        grid = population_map(500)
+        Population(grid, count).add_many(xs, ys, energy=80.)
+        if processes is None:
+            print "single process: %.2f ticks/s" % time_ticks(grid.update, 20)
+            continue
+        with Engine(grid, processes) as engine:
+            engine.update()
+            print "engine, %s processes: %.2f ticks/s" % (
+                processes, time_ticks(engine.update, 20))
+
+
+def bench_render():
+    '''
+    Frame times (with SDL_VIDEODRIVER=dummy where there is no
+    display): on a 100x100 map with 1000 organisms, a full redraw
+    against redrawing only the cells changed by a tick; on a
+    400x400 map, cell by cell against bulk drawing.
+    '''
+    grid = rough_grid(100, 100, rough=0)
+    for i in range(1000):
+        org = ls.Organism(grid)
+        org.energy = 80.
+        org.set_location(grid.random.choice(grid.cells()))
+    vis = ls.Visualizer(grid)
+    start = time.time()
+    for i in range(5):
+        vis.draw()
+    print "full redraw: %.4fs/frame" % ((time.time() - start) / 5)
+    elapsed = 0
+    cells = 0
+    for i in range(5):
+        grid.update()
+        start = time.time()
+        cells += len(vis.draw_changes())
+        elapsed += time.time() - start
+    print "changes only: %.4fs/frame (%s cells)" % (elapsed / 5, cells / 5)
+
+    grid = population_map(400)
+    Population(grid, 20000).add_many(
+        [grid.random.randrange(400) for i in range(20000)],
+        [grid.random.randrange(400) for i in range(20000)])
+    for bulk in [False, True]:
+        vis = ls.Visualizer(grid, bulk=bulk)
+        start = time.time()
+        vis.draw()
+        print "400x400 %s: %.4fs/frame" % (
+            'bulk' if bulk else 'cell by cell', time.time() - start)
+
+
+def bench_checkpoint():
+    '''
+    Saving and resuming a 1000x1000 vegetation-layer world with
+    100k organisms in a Population, mapped and read in full.
+    '''
+    grid = population_map(1000)
+    Population(grid, 100000).add_many(
+        [grid.random.randrange(1000) for i in range(100000)],
+        [grid.random.randrange(1000) for i in range(100000)])
+    grid.update()
+    path = os.path.join(tempfile.mkdtemp(), 'world.ckpt')
+    start = time.time()
+    checkpoint.save(grid, path)
+    print "save: %.3fs, %.0f MB" % (time.time() - start,
+                                    os.path.getsize(path) / 1e6)
+    for mmap in [True, False]:
+        start = time.time()
+        checkpoint.load(path, mmap)
+        print "load (%s): %.3fs" % ('mmap' if mmap else 'read',
+                                    time.time() - start)
+    start = time.time()
+    ls.Grid(1000, 1000, veg_arrays=True)
+    print "building the same Grid from scratch: %.3fs" % (time.time() - start)
+    os.remove(path)
+
+
+def bench_recorder():
+    '''
+    Ticks with and without a Recorder, for 5000 Organism objects on
+    a 200x200 map and 100k organisms in a Population on 500x500.
+    '''
+    path = os.path.join(tempfile.mkdtemp(), 'run.rec')
+    for label, build, ticks in [('objects 5k', lambda: objects_map(200, 5000),
+                                 20),
+                                ('population 100k',
+                                 lambda: populated_map(500, 100000), 20)]:
+        grid = build()
+        plain = time_ticks(grid.update, ticks)
+        grid = build()
+        with Recorder(path) as rec:
+            recorded = time_ticks(grid.update, ticks)
+        print "%s: %.2f ticks/s, %.2f recorded; %s events, %.1f bytes each" % (
+            label, plain, recorded, rec.written,
+            os.path.getsize(path) / float(max(rec.written, 1)))
+        start = time.time()
+        count = sum(len(events) for tick, events in read_ticks(path))
+        print "  read back %s events in %.3fs" % (count, time.time() - start)
+        os.remove(path)
+
+
+def bench_flowfield():
+    '''
+    Ticks of a 300x300 map with 5000 Organism objects that see 6
+    cells, each searching for food or all following a FoodField,
+    and the cost of building the field and of updating it.
+    '''
+    for label, field in [('search', False), ('food field', True)]:
+        grid = objects_map(300, 5000)
+        for org in grid.organisms:
+            org.sight_range = 6
+        if field:
+            start = time.time()
+            FoodField(grid)
+            print "building the field: %.3fs" % (time.time() - start)
+        print "%s: %.2f ticks/s" % (label, time_ticks(grid.update, 10))
+    #grazing stops short of zero, so clear and sow some cells to
+    #time an update with vegetation crossing zero
+    rand = grid.random
+    for i in range(100):
+        grid.veg.set(rand.randrange(300), rand.randrange(300), 0, 1, 10)
+        grid.veg.set(rand.randrange(300), rand.randrange(300), 5, 1, 10)
+    start = time.time()
+    grid.food_field.update()
+    print "update after 200 crossings: %.4fs, %s cells settled" % (
+        time.time() - start, grid.food_field.settled)
+
+
+def objects_map(size, count, seed=0):
+    grid = population_map(size, seed)
+    for i in range(count):
+        org = ls.Organism(grid)
+        org.energy = 80.
+        org.set_location(grid.get_node(grid.random.randrange(size),
+                                       grid.random.randrange(size)))
+    return grid
+
+
+def populated_map(size, count, seed=0):
+    grid = population_map(size, seed)
+    Population(grid, count).add_many(
+        [grid.random.randrange(size) for i in range(count)],
+        [grid.random.randrange(size) for i in range(count)], energy=80.)
+    return grid
+
+
+def rss():
+    '''
+    Resident memory of this process in bytes (Linux only).
+    '''
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def without_slots(cls):
+    '''
+    A copy of a slotted class that keeps its attributes in a
+    per-instance dict instead, as the classes used to.
+    '''
+    namespace = dict((name, value) for name, value in vars(cls).items()
+                     if name not in cls.__slots__ and name != '__slots__')
+    return type(cls.__name__, (object,), namespace)
+
+
+def bench_slots():
+    '''
+    Size (not counting attribute values) and attribute access
+    speed of Nodes, Vegetation objects and search nodes, with and
+    without __slots__, and the resident size of a whole 1000x1000
+    Grid.
+    '''
+    count = 1000000
+    classes = [
+        (ls.Node, lambda cls, i: cls(i, i)),
+        (ls.Vegetation, lambda cls, i: cls(i, 1, 10)),
+        (pathfinder.PathFinder._Node, lambda cls, i: cls(i, i, i)),
+    ]
+    for cls, make in classes:
+        for variant, label in [(without_slots(cls), 'dict'), (cls, 'slots')]:
+            objs = [make(variant, i) for i in range(count)]
+            size = sys.getsizeof(objs[0])
+            if hasattr(objs[0], '__dict__'):
+                size += sys.getsizeof(objs[0].__dict__)
+            attr = cls.__slots__[0]
+            start = time.time()
+            for obj in objs:
+                getattr(obj, attr)
+            print "%s (%s): %s bytes each, 1M getattrs %.3fs" % (
+                cls.__name__, label, size, time.time() - start)
+            del objs
+
+    before = rss()
+    grid = ls.Grid(1000, 1000)
+    for row in grid.nodes:
+        for node in row:
+            node.make_plain()
+    print "Grid 1000x1000 with Vegetation: %.0f MB" % (
+        (rss() - before) / 1e6)
+    start = time.time()
+    for node in grid.cells():
+        grid.neighbors(node)
+    print "neighbors() of 1M cells: %.3fs" % (time.time() - start)
+
+
+def chunked_world(cls, size, count, seed=0):
+    '''
+    Build a cls(*size) grid with plants on a 100x100 patch in its
+    top left corner and count organisms on it, and run 10 ticks.
+    Returns the time taken and the resident MB added.
+    '''
+    start = time.time()
+    before = rss()
+    grid = cls(*size)
+    rand = random.Random(seed)
+    for y in range(100):
+        for x in range(100):
+            grid.get_node(x, y).set_plants(rand.choice([0, 0, 5]), 1, 10)
+    for i in range(count):
+        org = ls.Organism(grid)
+        org.energy = 80.
+        #far enough in that everything they see has plants
+        org.set_location(grid.get_node(rand.randrange(5, 95),
+                                       rand.randrange(5, 95)))
+    for i in range(10):
+        grid.update()
+    return time.time() - start, (rss() - before) / 1e6
+
+
+def bench_chunked():
+    '''
+    Building and running 10 ticks of a 2000x2000 world with 1000
+    organisms in one corner, as a Grid and as a ChunkedGrid, and
+    of an unbounded ChunkedGrid.
+    '''
+    for label, cls, size in [
+            ('Grid 2000x2000', ls.Grid, (2000, 2000)),
+            ('ChunkedGrid 2000x2000', ChunkedGrid, (2000, 2000)),
+            ('ChunkedGrid unbounded', ChunkedGrid, ())]:
+        seconds, mb = in_child(chunked_world, cls, size, 1000)
+        print "%s: %.2fs, %.0f MB" % (label, seconds, mb)
+
+
+#(name, side of the map, ticks to time)
+SUITE_SIZES = [('small', 50, 300), ('medium', 200, 30), ('huge', 1000, 10)]
+SUITE_DENSITIES = [('sparse', .01), ('dense', .1)]
+#maps bigger than this only run with a Population
+SUITE_OBJECTS_MAX = 200
+BASELINE = 'bench_baseline.json'
+LATEST = 'bench_latest.json'
+#how much worse than the baseline a measure may get before it is
+#flagged; ticks_per_s is flagged when it drops, the others when
+#they rise
+TOLERANCE = {'ticks_per_s': .2, 'expansions': .01, 'peak_rss_mb': .1}
+
+
+def run_scenario(size, density, mode, ticks, seed=0):
+    '''
+    Run population_map(size, seed) with organisms on a fraction
+    density of its cells, as Organism objects (mode 'objects') or
+    a Population (mode 'population'), and return its measures.
+    Everything random is drawn from the grid's seeded stream, so
+    the same arguments give the same run.
+    '''
+    grid = population_map(size, seed)
+    count = int(size * size * density)
+    xs = [grid.random.randrange(size) for i in range(count)]
+    ys = [grid.random.randrange(size) for i in range(count)]
+    if mode == 'objects':
+        for x, y in zip(xs, ys):
+            org = ls.Organism(grid)
+            org.energy = 80.
+            org.set_location(grid.get_node(x, y))
+    else:
+        Population(grid, count).add_many(xs, ys, energy=80.)
+    return {
+        'ticks_per_s': time_ticks(grid.update, ticks),
+        'expansions': grid.pathfinder.expansions,
+        'peak_rss_mb': resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024.,
+    }
+
+
+def in_child(func, *args):
+    '''
+    func(*args) in a fresh worker process, so that its peak memory
+    is measured apart from the runs before it.
+    '''
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(func, args)
+    finally:
+        pool.terminate()
+
+
+def regressions(results, baseline):
+    '''
+    Messages for the measures in results that are worse than in
+    baseline by more than TOLERANCE.
+    '''
+    flags = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for measure, tolerance in sorted(TOLERANCE.items()):
+            new = results[name][measure]
+            old = baseline[name][measure]
+            if measure == 'ticks_per_s':
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+            if worse:
+                flags.append("REGRESSION %s %s: %.4g -> %.4g" % (
+                    name, measure, old, new))
+    return flags
+
+
+def bench_suite():
+    '''
+    Whole ticks on small, medium and huge maps with sparse and
+    dense populations, each run in its own process. Writes the
+    measures to LATEST and compares them with BASELINE, which the
+    first run creates; delete it to take a new baseline. Both
+    are written to the working directory and ignored by git.
+    '''
+    results = {}
+    for size_name, size, ticks in SUITE_SIZES:
+        for density_name, density in SUITE_DENSITIES:
+            modes = ['population']
+            if size <= SUITE_OBJECTS_MAX:
+                modes.insert(0, 'objects')
+            for mode in modes:
+                name = '%s-%s-%s' % (size_name, density_name, mode)
+                results[name] = in_child(run_scenario, size, density, mode,
+                                         ticks)
+                print "%s: %.2f ticks/s, %s expansions, %.0f MB peak" % (
+                    name, results[name]['ticks_per_s'],
+                    results[name]['expansions'],
+                    results[name]['peak_rss_mb'])
+    with open(LATEST, 'w') as out:
+        json.dump(results, out, indent=2, sort_keys=True)
+    if not os.path.exists(BASELINE):
+        with open(BASELINE, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+        print "saved baseline to %s" % BASELINE
+        return
+    with open(BASELINE) as baseline:
+        flags = regressions(results, json.load(baseline))
+    for flag in flags:
+        print flag
+    print "%s regressions against %s" % (len(flags), BASELINE)
+
+
+BENCHMARKS = {
+    'astar': bench_astar,
+    'batch': bench_batch,
+    'checkpoint': bench_checkpoint,
+    'chunked': bench_chunked,
+    'crowd': bench_crowd,
+    'dstarlite': bench_dstarlite,
+    'engine': bench_engine,
+    'flowfield': bench_flowfield,
+    'hpa': bench_hpa,
+    'jps': bench_jps,
+    'perception': bench_perception,
+    'population': bench_population,
+    'queue': bench_queue,
+    'recorder': bench_recorder,
+    'regrowth': bench_regrowth,
+    'render': bench_render,
+    'slots': bench_slots,
+    'suite': bench_suite,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
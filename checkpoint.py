@@ -0,0 +1,298 @@
+'''
+Save a Grid to a binary checkpoint file and resume it later.
+
+A checkpoint is a fixed header, a table of sections, and the
+sections themselves, each one array written in bulk:
+
+    header:   MAGIC, FORMAT_VERSION, number of sections
+    table:    per section: name, numpy dtype, rows, columns,
+              offset and length in bytes
+    sections: 'meta' (JSON for the scalar settings), 'move_cost',
+              the vegetation arrays, one column per organism
+              attribute, and the population's columns
+
+load() maps the sections into memory with numpy.memmap instead
+of reading them, copy-on-write, so the vegetation layer and
+population of a big world are available at once and only read
+from disk as they're touched. The Grid's nodes are another
+matter: every Grid holds one Node object per cell, and load()
+has to build them all, so that is what resuming a big world
+mostly costs.
+'''
+import gc
+import json
+import struct
+import numpy as np
+import lifesim as ls
+from population import Population
+
+MAGIC = 'LIFECKPT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sII')
+ENTRY = struct.Struct('<32s8sQQQQ')
+#sections start on multiples of this many bytes
+ALIGN = 64
+
+#Organism attributes saved as one column each
+ORGANISM_COLUMNS = [
+    ('energy', float),
+    ('energy_max', float),
+    ('bitesize', float),
+    ('speed', np.int32),
+    ('sight_range', np.int32),
+    ('eat_threshold', float),
+    ('litter_size', np.int32),
+]
+#how an Organism's path or goal is held: the initial empty list,
+#something to follow, or False once it has been reached
+EMPTY, SET, DONE = 0, 1, 2
+
+
+def save(grid, path):
+    '''
+    Write grid, with its vegetation, terrain, organisms and
+    population, to a checkpoint file at path.
+
+    Organisms' paths are iterators, so saving one reads it to
+    the end; the organism is given a fresh iterator over the same
+    nodes to carry on with.
+    '''
+    adj = grid.adjacency()
+    width, height = adj.width, adj.height
+    sections = [('move_cost', np.array(grid.cell_costs(), dtype=float))]
+    meta = {
+        'width': width,
+        'height': height,
+        'veg_arrays': grid.veg is not None,
+        'random_state': grid.random.getstate(),
+        'population': None,
+    }
+
+    if grid.veg is not None:
+        veg = grid.veg
+        meta['veg_rates'] = [veg.growth_rate, veg.decay_rate,
+                             veg.diffusion_rate]
+        sections += [('veg_amount', veg.amount),
+                     ('veg_energy', veg.energy_density),
+                     ('veg_max', veg.veg_max)]
+    else:
+        cells = grid.cells()
+        has = np.array([hasattr(node, 'plants') for node in cells],
+                       dtype=np.uint8)
+        plants = [node.plants if hasattr(node, 'plants') else None
+                  for node in cells]
+        for name, attr in [('veg_amount', 'amount'),
+                           ('veg_energy', 'energy_density'),
+                           ('veg_max', 'veg_max')]:
+            sections.append((name, np.array(
+                [getattr(p, attr) if p is not None else 0 for p in plants],
+                dtype=float)))
+        sections.append(('veg_present', has))
+
+    sections += _organism_sections(grid)
+
+    pop = grid.population
+    if pop is not None:
+        meta['population'] = {'tick': pop.tick, 'seed': pop.seed,
+                              'path_width': pop.path_width}
+        for name, dtype in pop.COLUMNS:
+            sections.append(('pop_' + name, getattr(pop, name)[:pop.size]))
+        sections.append(('pop_path_cells', pop.path_cells[:pop.size]))
+
+    sections.insert(0, ('meta', np.frombuffer(json.dumps(meta),
+                                              dtype=np.uint8)))
+    _write(path, sections)
+
+
+def load(path, mmap=True):
+    '''
+    Rebuild the Grid saved at path. With mmap, the vegetation
+    and population arrays are mapped from the file copy-on-write
+    rather than read into memory; changes to them never reach
+    the file.
+
+    The grid's nodes are built afresh, one per cell, as for any
+    Grid, and take as long as they would; only the arrays come
+    straight from the file.
+    '''
+    sections = _read_sections(path, mmap)
+    meta = json.loads(sections['meta'].tostring())
+    width, height = meta['width'], meta['height']
+    #the collector would only go over the new nodes again and
+    #again while they are made
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        grid = ls.Grid(width, height, veg_arrays=meta['veg_arrays'])
+    finally:
+        if collecting:
+            gc.enable()
+    grid.random.setstate(_tuples(meta['random_state']))
+
+    #node by node only where the cost isn't the default, and
+    #without logging terrain changes
+    costs = sections['move_cost']
+    cells = grid.cells()
+    flat_costs = grid.cell_costs()
+    for i in np.flatnonzero(costs != 1):
+        cells[i]._move_cost = flat_costs[i] = costs.item(i)
+
+    amount = sections['veg_amount'].reshape(height, width)
+    energy = sections['veg_energy'].reshape(height, width)
+    veg_max = sections['veg_max'].reshape(height, width)
+    if grid.veg is not None:
+        veg = grid.veg
+        veg.amount, veg.energy_density, veg.veg_max = amount, energy, veg_max
+        veg.growth_rate, veg.decay_rate, veg.diffusion_rate = meta['veg_rates']
+    else:
+        present = sections['veg_present']
+        for i in np.flatnonzero(present):
+            y, x = divmod(i, width)
+            cells[i].set_plants(amount.item(y, x), energy.item(y, x),
+                                veg_max.item(y, x))
+
+    _load_organisms(grid, sections)
+
+    if meta['population'] is not None:
+        settings = meta['population']
+        size = len(sections['pop_alive'])
+        pop = Population(grid, capacity=0, path_width=settings['path_width'],
+                         seed=settings['seed'])
+        for name, dtype in pop.COLUMNS:
+            setattr(pop, name, sections['pop_' + name])
+        pop.path_cells = sections['pop_path_cells']
+        pop.size = pop.capacity = size
+        pop.tick = settings['tick']
+    return grid
+
+
+########################## PRIVATE ##########################
+
+def _organism_sections(grid):
+    orgs = grid.organisms
+    width = grid.adjacency().width
+    sections = [('org_' + name,
+                 np.array([getattr(org, name) for org in orgs], dtype=dtype))
+                for name, dtype in ORGANISM_COLUMNS]
+
+    location = []
+    goal = []
+    goal_state = []
+    path_state = []
+    path_len = []
+    path_cells = []
+    for org in orgs:
+        node = org.location
+        location.append(-1 if node is None else node.y * width + node.x)
+        if org.goal is False:
+            goal_state.append(DONE)
+            goal.append(-1)
+        elif org.goal == []:
+            goal_state.append(EMPTY)
+            goal.append(-1)
+        else:
+            goal_state.append(SET)
+            goal.append(org.goal.y * width + org.goal.x)
+        if org.path is False:
+            path_state.append(DONE)
+            path_len.append(0)
+        elif isinstance(org.path, list) and not org.path:
+            path_state.append(EMPTY)
+            path_len.append(0)
+        else:
+            nodes = list(org.path)
+            org.path = iter(nodes)
+            path_state.append(SET)
+            path_len.append(len(nodes))
+            path_cells += [step.y * width + step.x for step in nodes]
+    sections += [
+        ('org_location', np.array(location, dtype=np.int64)),
+        ('org_goal', np.array(goal, dtype=np.int64)),
+        ('org_goal_state', np.array(goal_state, dtype=np.uint8)),
+        ('org_path_state', np.array(path_state, dtype=np.uint8)),
+        ('org_path_len', np.array(path_len, dtype=np.int64)),
+        ('org_path_cells', np.array(path_cells, dtype=np.int64)),
+    ]
+    return sections
+
+
+def _load_organisms(grid, sections):
+    cells = grid.cells()
+    columns = [(name, sections['org_' + name].tolist())
+               for name, dtype in ORGANISM_COLUMNS]
+    location = sections['org_location'].tolist()
+    goal = sections['org_goal'].tolist()
+    goal_state = sections['org_goal_state'].tolist()
+    path_state = sections['org_path_state'].tolist()
+    path_len = sections['org_path_len'].tolist()
+    path_cells = sections['org_path_cells'].tolist()
+    start = 0
+    for i in range(len(location)):
+        org = ls.Organism(grid)
+        for name, values in columns:
+            setattr(org, name, values[i])
+        if location[i] >= 0:
+            org.set_location(cells[location[i]])
+        org.goal = [[], cells[goal[i]], False][goal_state[i]]
+        if path_state[i] == SET:
+            end = start + path_len[i]
+            org.path = iter([cells[c] for c in path_cells[start:end]])
+            start = end
+        else:
+            org.path = [[], None, False][path_state[i]]
+
+
+def _write(path, sections):
+    offset = HEADER.size + ENTRY.size * len(sections)
+    entries = []
+    for name, array in sections:
+        assert len(name) <= 32, name
+        offset = -(-offset // ALIGN) * ALIGN
+        array = np.ascontiguousarray(array)
+        entries.append((name, array, offset))
+        offset += array.nbytes
+    with open(path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections)))
+        for name, array, offset in entries:
+            shape = array.shape + (0,) * (2 - array.ndim)
+            out.write(ENTRY.pack(name, array.dtype.str, shape[0], shape[1],
+                                 offset, array.nbytes))
+        for name, array, offset in entries:
+            out.seek(offset)
+            array.tofile(out)
+
+
+def _read_sections(path, mmap):
+    with open(path, 'rb') as f:
+        magic, version, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a lifesim checkpoint" % path)
+        if version != FORMAT_VERSION:
+            raise ValueError("%s is checkpoint format version %s, expected %s"
+                             % (path, version, FORMAT_VERSION))
+        entries = [ENTRY.unpack(f.read(ENTRY.size)) for i in range(count)]
+        sections = {}
+        for name, dtype, rows, cols, offset, nbytes in entries:
+            name = name.rstrip('\0')
+            dtype = np.dtype(dtype.rstrip('\0'))
+            shape = (rows, cols) if cols else (rows,)
+            if mmap and nbytes:
+                array = np.memmap(path, dtype=dtype, mode='c',
+                                  offset=offset, shape=shape)
+            else:
+                f.seek(offset)
+                array = np.fromfile(f, dtype=dtype,
+                                    count=nbytes // dtype.itemsize)
+                array = array.reshape(shape)
+            sections[name] = array
+    return sections
+
+
+def _tuples(value):
+    '''
+    JSON turns random.getstate()'s tuples into lists; turn them
+    back.
+    '''
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
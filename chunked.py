@@ -0,0 +1,201 @@
+'''
+Grids whose nodes are only built where they're needed.
+'''
+import lifesim as ls
+import pathfinder
+
+#side of an unbounded world; big enough that nothing walks off it
+UNBOUNDED = 2 ** 31
+
+
+class ChunkedGrid(ls.Grid):
+    '''
+    A Grid that builds its nodes chunk_size x chunk_size at a time,
+    the first time a node in the chunk is asked for, instead of
+    all at once. A big map costs nothing up front, and only as
+    much memory as the area that is actually used.
+
+    get_node(), neighbors() and self.nodes (a stand-in for the
+    list of lists, indexed the same way) build chunks as they go.
+    Anything that works on the whole map at once builds all of it:
+    cells(), cell_costs() and adjacency(), and with them
+    GridPathFinder, a FoodField and the Visualizer. Paths are
+    planned with the generic pathfinder.PathFinder instead, over
+    neighbors().
+
+    With width or height None the map is unbounded in that
+    direction: UNBOUNDED cells wide or high, with whole-map
+    operations refused.
+
+    Vegetation can't be kept in arrays (veg_arrays), since those
+    cover the whole map. New nodes get plants of plants = (amount,
+    energy_density, veg_max) if given, and otherwise none, as in a
+    Grid.
+
+    evict() hands chunks that nothing has touched back, to be built
+    afresh if they're needed again.
+    '''
+    def __init__(self, width=None, height=None, chunk_size=32, plants=None,
+                 veg_arrays=False, **options):
+        '''
+        chunk_size:
+            Side of a chunk, in nodes. Organisms are bucketed for
+            organisms_near() in squares of the same size.
+
+        plants:
+            (amount, energy_density, veg_max) for the plants on
+            every new node, or None for none.
+
+        Other options are as for Grid.
+        '''
+        if veg_arrays:
+            raise ValueError("a ChunkedGrid can't keep vegetation in arrays")
+        self.width = UNBOUNDED if width is None else width
+        self.height = UNBOUNDED if height is None else height
+        self.bounded = width is not None and height is not None
+        self.chunk_size = chunk_size
+        self.plants = plants
+        self.chunks = {}
+        #chunks asked for since the last evict()
+        self.touched = set()
+        self.chunks_built = 0
+        self.chunks_evicted = 0
+        ls.Grid.__init__(self, self.width, self.height,
+                         chunk_size=chunk_size, **options)
+        self.pathfinder = pathfinder.PathFinder(self.neighbors,
+                                                self.move_cost, self.dist)
+
+    def make_nodes(self, x, y):
+        return ChunkedNodes(self)
+
+    def get_node(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError("(%s, %s) is off the map" % (x, y))
+        size = self.chunk_size
+        key = (x // size, y // size)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self._build_chunk(key)
+        self.touched.add(key)
+        return chunk[y % size][x % size]
+
+    def neighbors(self, node):
+        '''
+        Grid.neighbors(), in the same order, without the adjacency
+        table.
+        '''
+        x, y = node.x, node.y
+        width, height = self.width, self.height
+        return [self.get_node(x + dx, y + dy)
+                for dx, dy in ls.Adjacency.DELTAS
+                if 0 <= x + dx < width and 0 <= y + dy < height]
+
+    def cell_index(self, node):
+        return node.y * self.width + node.x
+
+    def adjacency(self):
+        if not self.bounded:
+            raise ValueError("an unbounded ChunkedGrid has no adjacency "
+                             "table; it would cover the whole map")
+        return ls.Grid.adjacency(self)
+
+    def evict(self):
+        '''
+        Drop every chunk that hasn't been asked for since the last
+        evict() and is as it was built: default move costs and
+        plants and no occupants. Returns how many were dropped.
+
+        Anything still holding a node of a dropped chunk, such as
+        a planned path, holds a node the grid no longer has; call
+        this between ticks, when no organism is heading there.
+        Cached paths are forgotten, and the whole-map tables behind
+        cells() and adjacency() are built afresh when next needed.
+        '''
+        dropped = 0
+        for key in list(self.chunks):
+            if key not in self.touched and self._is_default(self.chunks[key]):
+                del self.chunks[key]
+                dropped += 1
+        self.touched = set()
+        self.chunks_evicted += dropped
+        if dropped:
+            self.path_cache.clear()
+            self._adjacency = self._cells = self._costs = None
+        return dropped
+
+    ########################## PRIVATE ##########################
+
+    def _build_chunk(self, key):
+        size = self.chunk_size
+        x0, y0 = key[0] * size, key[1] * size
+        plants = self.plants
+        chunk = []
+        for j in range(y0, min(y0 + size, self.height)):
+            row = []
+            for i in range(x0, min(x0 + size, self.width)):
+                node = ls.Node(i, j, self)
+                if plants is not None:
+                    node.plants = ls.Vegetation(*plants)
+                row.append(node)
+            chunk.append(row)
+        self.chunks[key] = chunk
+        self.chunks_built += 1
+        return chunk
+
+    def _is_default(self, chunk):
+        plants = self.plants
+        for row in chunk:
+            for node in row:
+                if node.occupants or node._move_cost != 1:
+                    return False
+                if plants is None:
+                    if hasattr(node, 'plants'):
+                        return False
+                else:
+                    veg = node.plants
+                    if (veg.amount, veg.energy_density,
+                            veg.veg_max) != tuple(plants):
+                        return False
+        return True
+
+
+class ChunkedNodes(object):
+    '''
+    Stands in for Grid.nodes in a ChunkedGrid: nodes[y][x] is
+    grid.get_node(x, y).
+    '''
+    def __init__(self, grid):
+        self.grid = grid
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        if not 0 <= y < self.grid.height:
+            raise IndexError(y)
+        return ChunkedRow(self.grid, y)
+
+    def __iter__(self):
+        for y in xrange(self.grid.height):
+            yield ChunkedRow(self.grid, y)
+
+
+class ChunkedRow(object):
+    '''
+    One row of a ChunkedNodes.
+    '''
+    def __init__(self, grid, y):
+        self.grid = grid
+        self.y = y
+
+    def __len__(self):
+        return self.grid.width
+
+    def __getitem__(self, x):
+        if not 0 <= x < self.grid.width:
+            raise IndexError(x)
+        return self.grid.get_node(x, self.y)
+
+    def __iter__(self):
+        for x in xrange(self.grid.width):
+            yield self.grid.get_node(x, self.y)
@@ -0,0 +1,379 @@
+from heapq import heappush, heappop
+
+INF = float('inf')
+
+
+class DStarLite(object):
+    """ D* Lite on a lifesim.Grid: a search that is kept, rather
+        than thrown away, as the searcher moves and the map
+        changes under it, and repaired only where the changes
+        reach.
+
+        The search runs backwards from the goals, so g[cell] is the
+        cost of the cheapest path from cell to the nearest goal.
+        Moving into a cell costs its move_cost, as in
+        GridPathFinder. The estimate from the searcher to a cell is
+        the number of king's moves times the cheapest move cost on
+        the map, which never overestimates.
+
+        There may be several goals, any of which will do, and
+        goals can be dropped or added as the search goes on.
+
+        Counters:
+
+        expansions:
+            cells expanded in total.
+        initial_expansions:
+            of those, by the first search and any from-scratch
+            rebuilds.
+        repairs:
+            times the search was brought up to date after a change.
+        rebuilds:
+            times it had to start from scratch, because the
+            terrain log no longer went back far enough or a cell
+            became cheaper than the estimate allows for.
+    """
+    def __init__(self, grid, start, goals, stats=None, min_cost=None):
+        """ Plan from start, a node, to the nearest of goals, a
+            list of nodes.
+
+            stats:
+                Anything with the same counters, to add this
+                search's to.
+
+            min_cost:
+                The cheapest move cost on the map, if already known.
+        """
+        self.grid = grid
+        self.stats = stats
+        self.min_cost = min_cost
+        self.goals = set(grid.cell_index(goal) for goal in goals)
+        self.start = grid.cell_index(start)
+        self.expansions = 0
+        self.initial_expansions = 0
+        self.repairs = 0
+        self.rebuilds = 0
+        self._version = grid.terrain_version
+        self._build()
+
+    def next_step(self):
+        """ The cell to move to from start along the cheapest path
+            to a goal, or None if start is a goal or no goal can be
+            reached.
+        """
+        start = self.start
+        if start in self.goals:
+            return None
+        costs = self.grid.cell_costs()
+        g = self.g
+        best = INF
+        step = None
+        for offset in self.adj.offsets_for(start):
+            succ = start + offset
+            succ_dist = costs[succ] + g.get(succ, INF)
+            if succ_dist < best:
+                best = succ_dist
+                step = succ
+        return step
+
+    def move_to(self, cell):
+        """ Tell the search that the searcher is now at cell.
+        """
+        self.start = cell
+
+    def remove_goal(self, cell):
+        if cell in self.goals:
+            self.goals.discard(cell)
+            self._changed = True
+            self._update_cell(cell)
+
+    def add_goal(self, cell):
+        if cell not in self.goals:
+            self.goals.add(cell)
+            self._changed = True
+            self._update_cell(cell)
+
+    def sync(self):
+        """ Catch up with changes in move costs since the last
+            sync and repair the search, from where the searcher is
+            now.
+        """
+        grid = self.grid
+        changes = grid.terrain_changes_since(self._version)
+        self._version = grid.terrain_version
+        if changes is None:
+            self._rebuild()
+            return
+        if changes:
+            costs = grid.cell_costs()
+            if min(costs[grid.cell_index(node)]
+                   for node in changes) < self.min_cost:
+                self._rebuild()
+                return
+            for node in set(changes):
+                cell = grid.cell_index(node)
+                #the cost of every move into cell has changed
+                for offset in self.adj.offsets_for(cell):
+                    self._update_cell(cell + offset)
+            self._changed = True
+        if self._changed:
+            self._count('repairs', 1)
+            self._search()
+
+    def cost(self):
+        """ Cost of the cheapest path from start to a goal.
+        """
+        return self.g.get(self.start, INF)
+
+    def path(self):
+        """ The cells of the current cheapest path, start and goal
+            included, or [] if there is none.
+        """
+        if self.cost() == INF:
+            return []
+        cell = self.start
+        path = [cell]
+        while cell not in self.goals:
+            cell = self._next_from(cell)
+            path.append(cell)
+        return path
+
+    ########################## PRIVATE ##########################
+
+    def _build(self):
+        grid = self.grid
+        self.adj = grid.adjacency()
+        if self.min_cost is None or grid.terrain_version != self._version:
+            self.min_cost = min(grid.cell_costs())
+        self._version = grid.terrain_version
+        self.g = {}
+        self.rhs = {}
+        self._open = []
+        #the key each cell is queued with; heap entries with any
+        #other key are stale
+        self._queued = {}
+        self._km = 0
+        self._last = self.start
+        self._changed = False
+        for goal in self.goals:
+            self.rhs[goal] = 0
+            self._queue(goal)
+        self._count('initial_expansions', self._search())
+
+    def _rebuild(self):
+        self._count('rebuilds', 1)
+        self.min_cost = None
+        self._build()
+
+    def _count(self, name, n):
+        setattr(self, name, getattr(self, name) + n)
+        if self.stats is not None:
+            setattr(self.stats, name, getattr(self.stats, name) + n)
+
+    def _estimate(self, cell):
+        width = self.adj.width
+        y, x = divmod(cell, width)
+        sy, sx = divmod(self.start, width)
+        return max(abs(x - sx), abs(y - sy)) * self.min_cost
+
+    def _key(self, cell):
+        best = min(self.g.get(cell, INF), self.rhs.get(cell, INF))
+        return (best + self._estimate(cell) + self._km, best)
+
+    def _queue(self, cell):
+        key = self._key(cell)
+        self._queued[cell] = key
+        heappush(self._open, (key, cell))
+
+    def _next_from(self, cell):
+        costs = self.grid.cell_costs()
+        g = self.g
+        return min((costs[cell + offset] + g.get(cell + offset, INF),
+                    cell + offset)
+                   for offset in self.adj.offsets_for(cell))[1]
+
+    def _update_cell(self, cell):
+        if cell not in self.goals:
+            costs = self.grid.cell_costs()
+            g = self.g
+            self.rhs[cell] = min(costs[cell + offset] +
+                                 g.get(cell + offset, INF)
+                                 for offset in self.adj.offsets_for(cell))
+        else:
+            self.rhs[cell] = 0
+        if self.g.get(cell, INF) != self.rhs[cell]:
+            self._queue(cell)
+        else:
+            self._queued.pop(cell, None)
+
+    def _top(self):
+        """ The smallest key still queued, dropping stale entries.
+        """
+        open_set = self._open
+        queued = self._queued
+        while open_set:
+            key, cell = open_set[0]
+            if queued.get(cell) == key:
+                return key
+            heappop(open_set)
+        return (INF, INF)
+
+    def _search(self):
+        """ Expand cells until the cost from start is settled.
+            Returns the number expanded.
+        """
+        # The searcher moving on lowers every estimate by at most
+        # the estimate between its old and new cell, so that is
+        # added to every key from now on instead of requeueing
+        if self.start != self._last:
+            width = self.adj.width
+            y, x = divmod(self.start, width)
+            ly, lx = divmod(self._last, width)
+            self._km += max(abs(x - lx), abs(y - ly)) * self.min_cost
+            self._last = self.start
+        self._changed = False
+
+        g, rhs = self.g, self.rhs
+        queued = self._queued
+        costs = self.grid.cell_costs()
+        start = self.start
+        offsets_for = self.adj.offsets_for
+        expanded = 0
+        while True:
+            top = self._top()
+            start_key = self._key(start)
+            if not (top < start_key or
+                    rhs.get(start, INF) != g.get(start, INF)):
+                break
+            if top == (INF, INF):
+                break
+            cell = heappop(self._open)[1]
+            new_key = self._key(cell)
+            if top < new_key:
+                self._queue(cell)
+                continue
+            del self._queued[cell]
+            expanded += 1
+            old_g = g.get(cell, INF)
+            if old_g > rhs[cell]:
+                # Cheaper now: each neighbour can only get cheaper
+                # by going through cell
+                g[cell] = rhs[cell]
+                through = g[cell] + costs[cell]
+                for offset in offsets_for(cell):
+                    pred = cell + offset
+                    if through < rhs.get(pred, INF):
+                        rhs[pred] = through
+                        if g.get(pred, INF) != through:
+                            self._queue(pred)
+                        else:
+                            queued.pop(pred, None)
+            else:
+                # Dearer: neighbours that went through cell have to
+                # look for their best way again
+                g[cell] = INF
+                through = old_g + costs[cell]
+                self._update_cell(cell)
+                for offset in offsets_for(cell):
+                    pred = cell + offset
+                    if rhs.get(pred, INF) == through:
+                        self._update_cell(pred)
+        self._count('expansions', expanded)
+        return expanded
+
+
+class ReplanningPath(object):
+    """ The cells to walk along a DStarLite search, one at a time,
+        start first, ending at whichever goal is reached.
+
+        Before each step the search is brought up to date with any
+        changes in move costs and, with watch_food set, goals whose
+        plants have all been eaten are dropped, so the walker heads
+        for the nearest goal that is left. The walk ends early if
+        no goal can be reached any more.
+    """
+    #the path belongs to whoever asked for it; Grid doesn't cache it
+    shared = False
+
+    def __init__(self, planner, watch_food=False):
+        self.planner = planner
+        self.watch_food = watch_food
+        self.started = False
+        path = planner.path()
+        self.goal = planner.grid.cell(path[-1]) if path else None
+
+    def __iter__(self):
+        return self
+
+    def __nonzero__(self):
+        return self.goal is not None
+
+    def next(self):
+        planner = self.planner
+        cells = planner.grid.cells()
+        if not self.started:
+            self.started = True
+            if self.goal is None:
+                raise StopIteration
+            return cells[planner.start]
+        if self.watch_food:
+            for goal in list(planner.goals):
+                if cells[goal].plants.amount <= 0:
+                    planner.remove_goal(goal)
+        if not planner.goals:
+            raise StopIteration
+        planner.sync()
+        step = planner.next_step()
+        if step is None or planner.cost() == INF:
+            raise StopIteration
+        planner.move_to(step)
+        return cells[step]
+
+
+class ReplanningPathFinder(object):
+    """ Plans paths that repair themselves: compute_path() and
+        food_path() return a ReplanningPath, which keeps its own
+        DStarLite search rather than being planned afresh after
+        every change. Use it with grid.use_pathfinder(); the paths
+        belong to the organism that asked for them, so the grid
+        doesn't cache them.
+
+        The counters add up those of every search started here
+        (see DStarLite), plus:
+
+        plans:
+            searches started.
+    """
+    def __init__(self, grid):
+        self.grid = grid
+        self.plans = 0
+        self.expansions = 0
+        self.initial_expansions = 0
+        self.repairs = 0
+        self.rebuilds = 0
+        self._min_cost = None
+        self._version = None
+
+    def compute_path(self, start, goal):
+        """ A ReplanningPath from start to goal.
+        """
+        return ReplanningPath(self._plan(start, [goal]))
+
+    def food_path(self, start, goals):
+        """ A ReplanningPath from start to the nearest of goals,
+            cells with plants, that drops goals as they are eaten
+            bare.
+        """
+        goals = [goal for goal in goals if goal.plants.amount > 0]
+        return ReplanningPath(self._plan(start, goals), watch_food=True)
+
+    ########################## PRIVATE ##########################
+
+    def _plan(self, start, goals):
+        self.plans += 1
+        grid = self.grid
+        if grid.terrain_version != self._version:
+            self._min_cost = min(grid.cell_costs())
+            self._version = grid.terrain_version
+        return DStarLite(grid, start, goals, stats=self,
+                         min_cost=self._min_cost)
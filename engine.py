@@ -0,0 +1,189 @@
+'''
+Multi-process ticks for grids with a Population.
+'''
+import multiprocessing
+import traceback
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+
+
+def shared(array):
+    '''
+    A copy of a numpy array in shared memory, which processes
+    forked afterwards read and write in place.
+    '''
+    raw = RawArray('c', max(array.nbytes, 1))
+    copy = np.frombuffer(raw, dtype=array.dtype,
+                         count=array.size).reshape(array.shape)
+    copy[...] = array
+    return copy
+
+
+class Engine(object):
+    '''
+    Runs Grid.update() for a grid with a population.Population on
+    several processes, each owning a horizontal strip of the map.
+
+    The population's columns and the vegetation arrays are moved
+    into shared memory and the workers are forked, so each one
+    reads the whole map, halo rows included, and writes only to
+    its own strip and its own organisms. A tick is three phases
+    with a barrier between each:
+
+    act:
+        the organisms whose cell is in a strip die, move, and
+        choose what to eat or where to go (Population.act()).
+    graze:
+        grazers eat from the cells they stand on, which are in
+        their strip (Population.graze()).
+    grow:
+        each strip's vegetation grows into a second buffer
+        (VegetationLayer.grow_rows()), so that diffusion reads
+        neighbouring strips' rows from before the tick. Every
+        process then swaps the buffers.
+
+    Organisms that cross a strip boundary belong to the new strip
+    from the next tick on, when strips are assigned again from
+    their positions. Every step gives exactly the same result as
+    the single-process Population.step() and VegetationLayer.grow(),
+    for any number of processes.
+
+    The workers hold copies of the grid's Nodes, taken when they
+    are forked. They are forked again on the next update() after
+    move costs change or the population outgrows its columns.
+    Object Organisms in grid.organisms still decide in the main
+    process, before the population.
+    '''
+    def __init__(self, grid, processes=None):
+        '''
+        grid:
+            A Grid with a Population attached.
+
+        processes:
+            Number of worker processes, and of strips. Defaults to
+            the number of CPUs.
+        '''
+        if grid.population is None:
+            raise ValueError("Engine needs a grid with a Population")
+        self.grid = grid
+        self.processes = processes or multiprocessing.cpu_count()
+        height = grid.veg.amount.shape[0]
+        self.bounds = np.linspace(0, height, self.processes + 1).astype(int)
+        self.workers = []
+        self._key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self):
+        '''
+        One tick, equivalent to Grid.update().
+        '''
+        grid = self.grid
+        pop = grid.population
+        if grid.food_field is not None:
+            grid.food_field.update()
+        for org in list(grid.organisms):
+            org.decide()
+        self._start()
+
+        size = pop.size
+        self.strip[:size] = np.searchsorted(self.bounds[1:-1], pop.y[:size],
+                                            side='right')
+        self._run('act', size, pop.tick)
+        self._run('graze', size)
+        self._run('grow')
+        veg = grid.veg
+        veg.amount, self.spare = self.spare, veg.amount
+        pop.tick += 1
+
+    def close(self):
+        for process, conn in self.workers:
+            conn.send(None)
+            conn.close()
+            process.join()
+        self.workers = []
+        self._key = None
+
+    ########################## PRIVATE ##########################
+
+    def _start(self):
+        '''
+        Fork the workers if there are none or the ones there are
+        hold out-of-date terrain or columns.
+        '''
+        grid = self.grid
+        pop = grid.population
+        key = (grid.terrain_version, pop.capacity, id(pop.x))
+        if key == self._key:
+            return
+        self.close()
+
+        for name, dtype in pop.COLUMNS:
+            setattr(pop, name, shared(getattr(pop, name)))
+        pop.path_cells = shared(pop.path_cells)
+        self.strip = shared(np.zeros(pop.capacity, dtype=np.int32))
+        veg = grid.veg
+        veg.amount = shared(veg.amount)
+        veg.energy_density = shared(veg.energy_density)
+        veg.veg_max = shared(veg.veg_max)
+        self.spare = shared(veg.amount)
+        #built now, so the workers inherit them
+        grid.adjacency()
+        pop._costs()
+        #but not a compute_paths() pool, which they can't use
+        if hasattr(grid.pathfinder, 'close'):
+            grid.pathfinder.close()
+
+        for strip in range(self.processes):
+            conn, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=self._work,
+                                              args=(strip, child))
+            process.daemon = True
+            process.start()
+            child.close()
+            self.workers.append((process, conn))
+        self._key = (grid.terrain_version, pop.capacity, id(pop.x))
+
+    def _run(self, *command):
+        for process, conn in self.workers:
+            conn.send(command)
+        errors = [conn.recv() for process, conn in self.workers]
+        for error in errors:
+            if error is not None:
+                self.close()
+                raise RuntimeError("engine worker failed:\n" + error)
+
+    def _work(self, strip, conn):
+        '''
+        The loop run by each worker process.
+        '''
+        grid = self.grid
+        pop = grid.population
+        veg = grid.veg
+        y0, y1 = self.bounds[strip], self.bounds[strip + 1]
+        while True:
+            command = conn.recv()
+            if command is None:
+                break
+            try:
+                phase = command[0]
+                if phase == 'grow':
+                    veg.grow_rows(y0, y1, self.spare)
+                    veg.amount, self.spare = self.spare, veg.amount
+                else:
+                    size = command[1]
+                    rows = np.flatnonzero(pop.alive[:size] &
+                                          (self.strip[:size] == strip))
+                    if phase == 'act':
+                        pop.tick = command[2]
+                        pop.act(rows)
+                    else:
+                        pop.graze(rows)
+                conn.send(None)
+            except Exception:
+                conn.send(traceback.format_exc())
+        conn.close()
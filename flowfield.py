@@ -0,0 +1,187 @@
+from array import array
+from heapq import heappush, heappop
+import numpy as np
+
+INF = float('inf')
+
+
+class FoodField(object):
+    """ The cost of getting from every cell of a lifesim.Grid to
+        the cheapest cell with food on it, shared by every
+        organism instead of each one searching for its own.
+
+        The field is a multi-source Dijkstra from all cells with
+        plants.amount > 0, over the grid's move costs. For each
+        cell it holds:
+
+        dist:
+            the cost of the cheapest path to food (0 on food, inf
+            where none can be reached).
+        nxt:
+            the neighbour to step to along that path (the cell
+            itself on food, -1 where there is none).
+        source:
+            the food cell the path ends at.
+
+        Creating a FoodField attaches it to the grid: Grid.update()
+        then brings it up to date at the start of each tick, and
+        Organism.forage() follows it rather than scanning its sight
+        and running A* (see route()).
+
+        update() only recomputes around cells whose vegetation
+        crossed zero since the last one: cells that gained food
+        are searched out from, and cells that were heading for
+        food that has gone are cleared and searched into from the
+        cells around them. A change in move costs, or in the shape
+        of the map, rebuilds the whole field.
+    """
+    def __init__(self, grid):
+        self.grid = grid
+        self.rebuilds = 0
+        self.updates = 0
+        self.settled = 0
+        self.food = None
+        self._shape = None
+        self._version = None
+        grid.food_field = self
+        self.update()
+
+    def food_mask(self):
+        """ True for each cell, in flat cell order, with food on
+            it.
+        """
+        grid = self.grid
+        if grid.veg is not None:
+            return grid.veg.amount.reshape(-1) > 0
+        return np.array([node.plants.amount > 0 for node in grid.cells()],
+                        dtype=bool)
+
+    def update(self):
+        """ Bring the field up to date with the vegetation and
+            terrain.
+        """
+        grid = self.grid
+        adj = grid.adjacency()
+        food = self.food_mask()
+        shape = (adj.width, adj.height)
+        if shape != self._shape or grid.terrain_version != self._version:
+            self._build(food)
+            self._shape = shape
+            self._version = grid.terrain_version
+            return
+        changed = np.flatnonzero(food != self.food)
+        self.food = food
+        self.settled = 0
+        if not changed.size:
+            return
+        self.updates += 1
+        gained = changed[food[changed]].tolist()
+        lost = changed[~food[changed]]
+
+        costs = grid.cell_costs()
+        dist, nxt, source = self.dist, self.nxt, self.source
+        open_set = []
+        if lost.size:
+            cleared = np.flatnonzero(np.in1d(self._sources, lost)).tolist()
+            for cell in cleared:
+                dist[cell] = INF
+                nxt[cell] = -1
+                source[cell] = -1
+            # Every label found here is the cost of a real path, so
+            # the search below can only lower it
+            for cell in cleared:
+                best = INF
+                for offset in adj.offsets_for(cell):
+                    succ = cell + offset
+                    succ_dist = dist[succ] + costs[succ]
+                    if succ_dist < best:
+                        best = succ_dist
+                        via = succ
+                if best < INF:
+                    dist[cell] = best
+                    nxt[cell] = via
+                    source[cell] = source[via]
+                    heappush(open_set, (best, cell))
+        for cell in gained:
+            dist[cell] = 0
+            nxt[cell] = cell
+            source[cell] = cell
+            heappush(open_set, (0, cell))
+        self._search(open_set)
+
+    def distance(self, node):
+        return self.dist[self.grid.cell_index(node)]
+
+    def route(self, node, sight_range=None):
+        """ The cells from node to the food cheapest to reach from
+            it, both included, or None if there is no food that
+            can be reached or, given sight_range, none in sight
+            there.
+
+            Organisms go for the cheapest food to reach, rather than
+            the nearest in sight as find_plants() picks it, when
+            that food is in sight, and otherwise search for food in
+            sight as they would without a field.
+        """
+        grid = self.grid
+        index = grid.cell_index(node)
+        goal = self.source[index]
+        if goal < 0:
+            return None
+        if sight_range is not None:
+            y, x = divmod(goal, self._shape[0])
+            if max(abs(x - node.x), abs(y - node.y)) > sight_range:
+                return None
+        cells = grid.cells()
+        nxt = self.nxt
+        path = [node]
+        while index != goal:
+            index = nxt[index]
+            path.append(cells[index])
+        return path
+
+    def _build(self, food):
+        size = len(food)
+        self.rebuilds += 1
+        self.food = food
+        self.dist = array('d', [INF]) * size
+        self.nxt = array('l', [-1]) * size
+        self.source = array('l', [-1]) * size
+        # A view of source for finding the cells heading for food
+        # that has gone; the array is never resized
+        self._sources = np.frombuffer(self.source, dtype=np.int_)
+        open_set = []
+        for cell in np.flatnonzero(food).tolist():
+            self.dist[cell] = 0
+            self.nxt[cell] = cell
+            self.source[cell] = cell
+            open_set.append((0, cell))
+        self._search(open_set)
+
+    def _search(self, open_set):
+        """ Dijkstra's algorithm from the labels in open_set,
+            lowering dist wherever a cheaper path to food turns up.
+            Moving from a cell to its neighbour costs the
+            neighbour's move_cost, so the step into cell from
+            each neighbour costs cell's own.
+        """
+        grid = self.grid
+        offsets_for = grid.adjacency().offsets_for
+        costs = grid.cell_costs()
+        dist, nxt, source = self.dist, self.nxt, self.source
+        settled = 0
+        while open_set:
+            curr_dist, curr = heappop(open_set)
+            if curr_dist > dist[curr]:
+                continue
+            settled += 1
+            succ_dist = curr_dist + costs[curr]
+            curr_source = source[curr]
+            for offset in offsets_for(curr):
+                succ = curr + offset
+                if succ_dist < dist[succ]:
+                    dist[succ] = succ_dist
+                    nxt[succ] = curr
+                    source[succ] = curr_source
+                    heappush(open_set, (succ_dist, succ))
+        self.settled = settled
@@ -0,0 +1,185 @@
+'''
+Run a simulation without a display.
+
+    python headless.py --size 200 --organisms 2000 --ticks 1000 \
+        --every 100 --format csv --out run.csv
+
+builds a random map and population from the options, runs it as
+fast as it will go and writes a summary line every so many ticks.
+See "python headless.py --help" for the options.
+'''
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+#lifesim imports pygame, which otherwise greets stdout
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import lifesim as ls
+from engine import Engine
+from population import Population
+
+FIELDS = ['tick', 'organisms', 'mean_energy', 'vegetation',
+          'ticks_per_s', 'elapsed_s']
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run lifesim without a display.")
+    parser.add_argument('--size', type=int, default=100,
+                        help="width of the map (default %(default)s)")
+    parser.add_argument('--height', type=int,
+                        help="height of the map (default: --size)")
+    parser.add_argument('--organisms', type=int, default=500)
+    parser.add_argument('--ticks', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', choices=['objects', 'population'],
+                        default='population',
+                        help="Organism objects or a Population "
+                             "(default %(default)s)")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="run a population on an Engine with this "
+                             "many processes")
+    parser.add_argument('--food', type=float, default=.1,
+                        help="fraction of cells starting with plants")
+    parser.add_argument('--growth', type=float, default=.05)
+    parser.add_argument('--decay', type=float, default=0.)
+    parser.add_argument('--diffusion', type=float, default=0.)
+    parser.add_argument('--energy', type=float, default=80.,
+                        help="starting energy of each organism")
+    parser.add_argument('--sight', type=int, default=2)
+    parser.add_argument('--every', type=int, default=10,
+                        help="ticks between summaries")
+    parser.add_argument('--format', choices=['text', 'json', 'csv'],
+                        default='text')
+    parser.add_argument('--out', default='-',
+                        help="file for the summaries (default stdout)")
+    args = parser.parse_args(argv)
+    if args.processes > 1 and args.mode != 'population':
+        parser.error("--processes needs --mode population")
+    if args.every < 1:
+        parser.error("--every must be at least 1")
+    return args
+
+
+def build(args):
+    '''
+    The grid described by args, with its organisms on it. Every
+    random choice comes from the grid's stream, seeded by
+    args.seed.
+    '''
+    width = args.size
+    height = args.height or args.size
+    grid = ls.Grid(width, height, veg_arrays=True, seed=args.seed)
+    rand = grid.random
+    veg = grid.veg
+    veg.fill(0, 1, 10)
+    for i in range(int(width * height * args.food)):
+        veg.set(rand.randrange(width), rand.randrange(height), 10, 1, 10)
+    veg.growth_rate = args.growth
+    veg.decay_rate = args.decay
+    veg.diffusion_rate = args.diffusion
+
+    xs = [rand.randrange(width) for i in range(args.organisms)]
+    ys = [rand.randrange(height) for i in range(args.organisms)]
+    if args.mode == 'population':
+        Population(grid, max(args.organisms, 1)).add_many(
+            xs, ys, energy=args.energy, sight_range=args.sight)
+    else:
+        for x, y in zip(xs, ys):
+            org = ls.Organism(grid)
+            org.energy = args.energy
+            org.sight_range = args.sight
+            org.set_location(grid.get_node(x, y))
+    return grid
+
+
+def summary(grid, tick):
+    '''
+    Counts and totals for the state of grid after tick ticks.
+    '''
+    pop = grid.population
+    if pop is not None:
+        living = pop.living()
+        count = len(living)
+        energy = float(pop.energy[living].sum())
+    else:
+        count = len(grid.organisms)
+        energy = sum(org.energy for org in grid.organisms)
+    return {
+        'tick': tick,
+        'organisms': count,
+        'mean_energy': energy / count if count else 0.,
+        'vegetation': float(grid.veg.amount.sum()),
+    }
+
+
+class SummaryWriter(object):
+    '''
+    Writes summaries to a file as text, JSON lines or CSV.
+    '''
+    def __init__(self, out, format):
+        self.out = out
+        self.format = format
+        if format == 'csv':
+            self.csv = csv.DictWriter(out, FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.format == 'csv':
+            self.csv.writerow(row)
+        elif self.format == 'json':
+            self.out.write(json.dumps(row, sort_keys=True) + '\n')
+        else:
+            self.out.write(
+                "tick %(tick)s: %(organisms)s organisms, mean energy "
+                "%(mean_energy).1f, vegetation %(vegetation).0f, "
+                "%(ticks_per_s).1f ticks/s\n" % row)
+        self.out.flush()
+
+
+def run(grid, ticks, every, writer, tick=None):
+    '''
+    Advance grid by ticks ticks with tick() (grid.update by
+    default), writing a summary to writer every every ticks and
+    after the last. Returns the overall ticks per second.
+    '''
+    tick = tick or grid.update
+    start = last = time.time()
+    writer.write(dict(summary(grid, 0), ticks_per_s=0., elapsed_s=0.))
+    for i in range(1, ticks + 1):
+        tick()
+        if i % every == 0 or i == ticks:
+            now = time.time()
+            done = i % every or every
+            writer.write(dict(summary(grid, i),
+                              ticks_per_s=done / max(now - last, 1e-9),
+                              elapsed_s=now - start))
+            last = now
+    return ticks / max(time.time() - start, 1e-9)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    grid = build(args)
+    if args.out == '-':
+        out = sys.stdout
+    else:
+        out = open(args.out, 'wb' if args.format == 'csv' else 'w')
+    try:
+        writer = SummaryWriter(out, args.format)
+        if args.processes > 1:
+            with Engine(grid, args.processes) as engine:
+                rate = run(grid, args.ticks, args.every, writer,
+                           engine.update)
+        else:
+            rate = run(grid, args.ticks, args.every, writer)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write("%s ticks at %.1f ticks/s\n" % (args.ticks, rate))
+
+
+if __name__ == "__main__":
+    main()
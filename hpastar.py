@@ -0,0 +1,366 @@
+from heapq import heappush, heappop
+from pathfinder import GridPathFinder
+
+
+class HierarchicalPathFinder(object):
+    """ Hierarchical A* (HPA*) for large lifesim.Grids.
+
+        The grid is cut into square clusters. Wherever two clusters
+        share a border, an entrance is placed at the cheapest
+        crossing in each stretch of entrance_width border cells.
+        The abstract graph links every entrance to the cell across
+        the border from it, and to the other entrances of its own
+        cluster at the cost of the cheapest path inside the
+        cluster.
+
+        A query links the start and goal to the entrances of their
+        clusters, searches the abstract graph with A*, and returns
+        a HierarchicalPath, which turns each leg of the abstract
+        path into cells only when a walk along it gets that far.
+        Queries between neighbouring clusters (or within one) are
+        handed to a plain GridPathFinder instead.
+
+        Paths are near-optimal: they cross cluster borders only at
+        entrances.
+
+        When move costs change, the next query rebuilds only the
+        clusters around the changed cells, using the grid's
+        terrain_changes_since().
+    """
+    def __init__(self, grid, cluster_size=10, entrance_width=None):
+        """ Create a new HierarchicalPathFinder.
+
+            grid:
+                A lifesim.Grid, or anything providing the same
+                interface as needed by GridPathFinder plus
+                terrain_changes_since().
+
+            cluster_size:
+                Width and height of a cluster, in cells.
+
+            entrance_width:
+                Border cells per entrance. Defaults to half of
+                cluster_size, i.e. two entrances per border.
+        """
+        self.grid = grid
+        self.cluster_size = cluster_size
+        self.entrance_width = entrance_width or max(1, cluster_size // 2)
+        self.local = GridPathFinder(grid)
+
+        self.expansions = 0
+        self.clusters_built = 0
+        self._shape = None
+        self._version = None
+
+    def compute_path(self, start, goal):
+        """ Compute the path between the 'start' node and the
+            'goal' node.
+
+            The path is returned as a HierarchicalPath, which can
+            be iterated over for the nodes, including the start
+            and goal nodes themselves.
+
+            If no path was found, an empty list is returned.
+        """
+        self._sync()
+        grid = self.grid
+        start = grid.cell_index(start)
+        goal = grid.cell_index(goal)
+        start_cluster = self._cluster_of(start)
+        goal_cluster = self._cluster_of(goal)
+        if (abs(start_cluster[0] - goal_cluster[0]) <= 1 and
+                abs(start_cluster[1] - goal_cluster[1]) <= 1):
+            waypoints = [start, goal]
+        else:
+            waypoints = self._abstract_path(start, goal,
+                                            start_cluster, goal_cluster)
+            if not waypoints:
+                return []
+        return HierarchicalPath(self, waypoints)
+
+    def refine(self, start, goal):
+        """ Cell indices from just after 'start' up to and including
+            'goal', for one leg of an abstract path.
+        """
+        if goal in self.inter.get(start, ()):
+            return [goal]
+        cluster = self._cluster_of(start)
+        if cluster == self._cluster_of(goal):
+            dist, parent = self._search(start, self._bounds(cluster), [goal])
+            pth = []
+            while goal != start:
+                pth.append(goal)
+                goal = parent[goal]
+            pth.reverse()
+            return pth
+        return self.local.compute_index_path(start, goal)[1:]
+
+    ########################## PRIVATE ##########################
+
+    def _sync(self):
+        """ Bring the abstract graph up to date with the grid.
+        """
+        grid = self.grid
+        adj = grid.adjacency()
+        shape = (adj.width, adj.height)
+        changes = None
+        if shape == self._shape:
+            changes = grid.terrain_changes_since(self._version)
+        self._version = grid.terrain_version
+
+        if changes is None:
+            self._build(shape)
+            return
+
+        costs = grid.cell_costs()
+        dirty = set()
+        for node in changes:
+            dirty.add(self._cluster_of(grid.cell_index(node)))
+            self._min_cost = min(self._min_cost, node.move_cost)
+        if not dirty:
+            return
+        # Entrances on any border of a dirty cluster may move, and
+        # with them the internal edges of the clusters next door
+        borders = set()
+        clusters = set()
+        for cx, cy in dirty:
+            borders.update(self._borders_of(cx, cy))
+            clusters.update([(cx, cy), (cx - 1, cy), (cx + 1, cy),
+                             (cx, cy - 1), (cx, cy + 1)])
+        for key in borders:
+            self._set_border(key, costs)
+        for cluster in clusters:
+            if cluster in self.intra:
+                self._build_cluster(cluster)
+
+    def _build(self, shape):
+        self._shape = shape
+        width, height = shape
+        size = self.cluster_size
+        self.clusters_wide = (width + size - 1) // size
+        self.clusters_high = (height + size - 1) // size
+        costs = self.grid.cell_costs()
+        self._min_cost = min(costs)
+
+        self.borders = {}
+        self.inter = {}
+        self.intra = {}
+        for cy in range(self.clusters_high):
+            for cx in range(self.clusters_wide):
+                if cx + 1 < self.clusters_wide:
+                    self._set_border((cx, cy, 'E'), costs)
+                if cy + 1 < self.clusters_high:
+                    self._set_border((cx, cy, 'S'), costs)
+        for cy in range(self.clusters_high):
+            for cx in range(self.clusters_wide):
+                self._build_cluster((cx, cy))
+
+    def _cluster_of(self, index):
+        y, x = divmod(index, self._shape[0])
+        return x // self.cluster_size, y // self.cluster_size
+
+    def _bounds(self, cluster):
+        size = self.cluster_size
+        x0 = cluster[0] * size
+        y0 = cluster[1] * size
+        return (x0, y0,
+                min(x0 + size, self._shape[0]),
+                min(y0 + size, self._shape[1]))
+
+    def _borders_of(self, cx, cy):
+        """ Keys of the borders around a cluster. A border is keyed
+            by the cluster to its west or north and 'E' or 'S'.
+        """
+        keys = []
+        if cx + 1 < self.clusters_wide:
+            keys.append((cx, cy, 'E'))
+        if cx > 0:
+            keys.append((cx - 1, cy, 'E'))
+        if cy + 1 < self.clusters_high:
+            keys.append((cx, cy, 'S'))
+        if cy > 0:
+            keys.append((cx, cy - 1, 'S'))
+        return keys
+
+    def _entrances(self, cluster):
+        cx, cy = cluster
+        entrances = set()
+        for key in self._borders_of(cx, cy):
+            inside = 0 if key[:2] == cluster else 1
+            entrances.update(pair[inside] for pair in self.borders[key])
+        return entrances
+
+    def _set_border(self, key, costs):
+        """ Place the entrances on a border: the crossing (a, b)
+            with the lowest costs[a] + costs[b] in each stretch of
+            entrance_width cells, nearest the middle of the stretch
+            on ties.
+        """
+        cx, cy, side = key
+        x0, y0, x1, y1 = self._bounds((cx, cy))
+        width = self._shape[0]
+        if side == 'E':
+            crossings = [(y * width + x1 - 1, y * width + x1)
+                         for y in range(y0, y1)]
+        else:
+            crossings = [((y1 - 1) * width + x, y1 * width + x)
+                         for x in range(x0, x1)]
+
+        pairs = []
+        for i in range(0, len(crossings), self.entrance_width):
+            stretch = crossings[i:i + self.entrance_width]
+            middle = (len(stretch) - 1) / 2.
+            best = min(range(len(stretch)), key=lambda j: (
+                costs[stretch[j][0]] + costs[stretch[j][1]],
+                abs(j - middle)))
+            pairs.append(stretch[best])
+
+        for a, b in self.borders.get(key, ()):
+            del self.inter[a][b]
+            del self.inter[b][a]
+        for a, b in pairs:
+            self.inter.setdefault(a, {})[b] = costs[b]
+            self.inter.setdefault(b, {})[a] = costs[a]
+        self.borders[key] = pairs
+
+    def _build_cluster(self, cluster):
+        """ Costs between every pair of entrances of a cluster,
+            moving only inside it.
+        """
+        self.clusters_built += 1
+        bounds = self._bounds(cluster)
+        entrances = self._entrances(cluster)
+        edges = {}
+        for entrance in entrances:
+            dist, parent = self._search(entrance, bounds, entrances)
+            edges[entrance] = dict((other, dist[other])
+                                   for other in entrances
+                                   if other != entrance and other in dist)
+        self.intra[cluster] = edges
+
+    def _search(self, source, bounds, targets, reverse=False):
+        """ Dijkstra's algorithm from source, staying inside bounds
+            (x0, y0, x1, y1), until every target is settled.
+            Returns the (dist, parent) dicts.
+
+            With reverse set the costs are those of moving from
+            each cell to source rather than from source to it.
+        """
+        adj = self.grid.adjacency()
+        costs = self.grid.cell_costs()
+        width = adj.width
+        x0, y0, x1, y1 = bounds
+        remaining = set(targets)
+        remaining.discard(source)
+
+        dist = {source: 0}
+        parent = {source: -1}
+        settled = set()
+        open_set = [(0, source)]
+        while open_set and remaining:
+            curr_dist, curr = heappop(open_set)
+            if curr in settled:
+                continue
+            settled.add(curr)
+            remaining.discard(curr)
+            self.expansions += 1
+            for offset in adj.offsets_for(curr):
+                succ = curr + offset
+                y, x = divmod(succ, width)
+                if not (x0 <= x < x1 and y0 <= y < y1) or succ in settled:
+                    continue
+                if reverse:
+                    succ_dist = curr_dist + costs[curr]
+                else:
+                    succ_dist = curr_dist + costs[succ]
+                if succ_dist < dist.get(succ, succ_dist + 1):
+                    dist[succ] = succ_dist
+                    parent[succ] = curr
+                    heappush(open_set, (succ_dist, succ))
+        return dist, parent
+
+    def _abstract_path(self, start, goal, start_cluster, goal_cluster):
+        """ A* over the entrances, with start and goal linked in
+            to the entrances of their clusters. Returns the list
+            of waypoints, or an empty list if there is no path.
+        """
+        entrances = self._entrances(start_cluster)
+        dist, parent = self._search(start, self._bounds(start_cluster),
+                                    entrances)
+        from_start = dict((e, dist[e]) for e in entrances if e in dist)
+        entrances = self._entrances(goal_cluster)
+        dist, parent = self._search(goal, self._bounds(goal_cluster),
+                                    entrances, reverse=True)
+        to_goal = dict((e, dist[e]) for e in entrances if e in dist)
+
+        width = self._shape[0]
+        goal_y, goal_x = divmod(goal, width)
+        min_cost = self._min_cost
+        def estimate(index):
+            y, x = divmod(index, width)
+            return max(abs(x - goal_x), abs(y - goal_y)) * min_cost
+
+        g_cost = {start: 0}
+        pred = {start: None}
+        closed = set()
+        open_set = [(estimate(start), 0, start)]
+        counter = 1
+        while open_set:
+            curr = heappop(open_set)[2]
+            if curr in closed:
+                continue
+            if curr == goal:
+                pth = []
+                while curr is not None:
+                    pth.append(curr)
+                    curr = pred[curr]
+                pth.reverse()
+                return pth
+            closed.add(curr)
+            self.expansions += 1
+
+            if curr == start:
+                # start may be an entrance itself, with a way across
+                # the border of its own
+                edges = (from_start.items() +
+                         self.inter.get(start, {}).items())
+            else:
+                edges = (self.intra[self._cluster_of(curr)][curr].items() +
+                         self.inter.get(curr, {}).items())
+            if curr in to_goal:
+                edges.append((goal, to_goal[curr]))
+            for succ, cost in edges:
+                if succ in closed:
+                    continue
+                succ_g = g_cost[curr] + cost
+                if succ_g < g_cost.get(succ, succ_g + 1):
+                    g_cost[succ] = succ_g
+                    pred[succ] = curr
+                    heappush(open_set, (succ_g + estimate(succ), counter, succ))
+                    counter += 1
+        return []
+
+
+class HierarchicalPath(object):
+    """ The nodes of a path found by HierarchicalPathFinder.
+
+        waypoints are the cell indices of the abstract path. Each
+        leg between two waypoints is refined into cells the first
+        time an iteration reaches it and kept for later
+        iterations, so the path can be cached and walked any number
+        of times.
+    """
+    def __init__(self, finder, waypoints):
+        self.finder = finder
+        self.waypoints = waypoints
+        self.legs = [None] * (len(waypoints) - 1)
+
+    def __iter__(self):
+        cells = self.finder.grid.cells()
+        yield cells[self.waypoints[0]]
+        for i in range(len(self.legs)):
+            if self.legs[i] is None:
+                self.legs[i] = self.finder.refine(self.waypoints[i],
+                                                  self.waypoints[i + 1])
+            for index in self.legs[i]:
+                yield cells[index]
@@ -0,0 +1,185 @@
+'''
+Opt-in per-tick profiling of the simulation's hot paths.
+'''
+import csv
+import json
+from timeit import default_timer
+import lifesim
+import pathfinder
+import population
+
+
+class Profiler(object):
+    '''
+    Times the main stages of a tick and counts pathfinding work,
+    one row per call of Grid.update().
+
+    enable() wraps the methods listed in TIMED and SEARCHES in
+    place on their classes, and disable() puts the originals back,
+    so a disabled profiler costs nothing at all. Only one profiler
+    can be enabled at a time.
+
+    Each row has, for every section that ran, '<section>_s' (total
+    seconds) and '<section>_calls', plus:
+
+    searches:
+        number of path searches.
+    expansions:
+        nodes expanded by them.
+    open_peak:
+        the largest open set any of them held.
+
+    Sections nest: 'update' includes everything else that happens
+    in Grid.update(), 'forage' and 'wander' include their
+    'perception' and 'pathfind' time, and so on. A section called
+    from inside itself counts once. 'draw' time is counted in the
+    row of the next update.
+    '''
+    #(section, class, method)
+    TIMED = [
+        ('update', lifesim.Grid, 'update'),
+        ('die', lifesim.Organism, 'die'),
+        ('move', lifesim.Organism, 'move'),
+        ('graze', lifesim.Organism, 'graze'),
+        ('forage', lifesim.Organism, 'forage'),
+        ('wander', lifesim.Organism, 'wander'),
+        ('perception', lifesim.Organism, 'can_see'),
+        ('perception', lifesim.Organism, 'find_plants'),
+        ('perception', lifesim.Grid, 'find_plants'),
+        ('perception', lifesim.VegetationLayer, 'nearest_food'),
+        ('population', population.Population, 'step'),
+        ('vegetation', lifesim.VegetationLayer, 'grow'),
+        ('draw', lifesim.Visualizer, 'draw'),
+        ('draw', lifesim.Visualizer, 'draw_changes'),
+        ('draw', lifesim.Visualizer, 'draw_arrays'),
+    ]
+    #searches timed as 'pathfind' and counted; the finder they
+    #are called on has expansions and open_peak
+    SEARCHES = [
+        (pathfinder.GridPathFinder, 'compute_index_path'),
+        (pathfinder.PathFinder, 'compute_path'),
+    ]
+    active = None
+
+    def __init__(self):
+        self.rows = []
+        self._originals = []
+        #calls in progress per section, so that a section entered
+        #again from inside itself isn't counted twice
+        self._depth = {}
+        self._start_row()
+
+    def enable(self):
+        if Profiler.active is not None:
+            raise RuntimeError("another Profiler is already enabled")
+        Profiler.active = self
+        for section, cls, name in self.TIMED:
+            self._wrap(cls, name, self._timed(section, cls.__dict__[name]))
+        for cls, name in self.SEARCHES:
+            self._wrap(cls, name, self._search(cls.__dict__[name]))
+
+    def disable(self):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        if Profiler.active is self:
+            Profiler.active = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def columns(self):
+        '''
+        Every column that appears in any row, 'tick' first.
+        '''
+        names = set()
+        for row in self.rows:
+            names.update(row)
+        names.discard('tick')
+        return ['tick'] + sorted(names)
+
+    def totals(self):
+        '''
+        Sums over all rows (maximum for open_peak).
+        '''
+        totals = {}
+        for row in self.rows:
+            for name, value in row.items():
+                if name == 'tick':
+                    continue
+                if name == 'open_peak':
+                    totals[name] = max(totals.get(name, 0), value)
+                else:
+                    totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def write_csv(self, path):
+        columns = self.columns()
+        with open(path, 'wb') as out:
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            for row in self.rows:
+                writer.writerow([row.get(name, 0) for name in columns])
+
+    def write_json(self, path):
+        with open(path, 'w') as out:
+            json.dump(self.rows, out, indent=1, sort_keys=True)
+
+    ########################## PRIVATE ##########################
+
+    def _start_row(self):
+        self.row = {'tick': len(self.rows), 'searches': 0,
+                    'expansions': 0, 'open_peak': 0}
+
+    def _add(self, section, seconds):
+        row = self.row
+        key = section + '_s'
+        row[key] = row.get(key, 0) + seconds
+        key = section + '_calls'
+        row[key] = row.get(key, 0) + 1
+
+    def _wrap(self, cls, name, wrapper):
+        self._originals.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, wrapper)
+
+    def _timed(self, section, method):
+        profiler = self
+        depth = self._depth
+        depth[section] = 0
+        def wrapper(*args, **kwargs):
+            if depth[section]:
+                return method(*args, **kwargs)
+            depth[section] += 1
+            start = default_timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                depth[section] -= 1
+                profiler._add(section, default_timer() - start)
+                if section == 'update':
+                    profiler.rows.append(profiler.row)
+                    profiler._start_row()
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    def _search(self, method):
+        profiler = self
+        def wrapper(finder, *args, **kwargs):
+            before = finder.expansions
+            start = default_timer()
+            try:
+                return method(finder, *args, **kwargs)
+            finally:
+                profiler._add('pathfind', default_timer() - start)
+                row = profiler.row
+                row['searches'] += 1
+                row['expansions'] += finder.expansions - before
+                row['open_peak'] = max(row['open_peak'], finder.open_peak)
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
@@ -1,19 +1,33 @@
+from collections import OrderedDict
 from math import sqrt
+import numpy as np
 import pathfinder
 import pygame
+import random
 import sys
-from random import choice
+import threading
+import time
 
 class Node(object):
     '''
     A single location on a map grid.
+    
+    grid, if given, is told whenever move_cost changes so that it
+    can drop paths planned over the old terrain.
+    
+    Nodes, like Organisms, Vegetation and VegetationViews, keep
+    their attributes in __slots__ rather than a per-instance dict,
+    since a big map holds millions of them.
     '''
-    def __init__(self, x, y):
+    __slots__ = ('x', 'y', 'grid', 'occupants', '_move_cost', 'plants')
+    
+    def __init__(self, x, y, grid=None):
         self.x = x
         self.y = y
+        self.grid = grid
         
         self.occupants = []
-        self.move_cost = 1
+        self._move_cost = 1
     
     def __str__(self):
         return "Node(%s, %s), %s occupants" % (
@@ -25,18 +39,52 @@ class Node(object):
     def __repr__(self):
         return "Node(%r, %r)" % (self.x, self.y)
         
+    @property
+    def move_cost(self):
+        return self._move_cost
+        
+    @move_cost.setter
+    def move_cost(self, cost):
+        self._move_cost = cost
+        if self.grid is not None:
+            self.grid.terrain_changed(self)
+        
     def set_plants(self, amount, energy_density, veg_max):
         self.plants = Vegetation(amount, energy_density, veg_max)
+        if self.grid is not None:
+            self.grid.changed(self)
         
     def make_plain(self):
         self.set_plants(10, 1, 10)
         
         
+class ArrayNode(Node):
+    '''
+    A Node whose vegetation is kept in its Grid's VegetationLayer
+    instead of in a Vegetation object of its own.
+    '''
+    __slots__ = ('layer',)
+    
+    def __init__(self, x, y, layer, grid=None):
+        Node.__init__(self, x, y, grid)
+        self.layer = layer
+        
+    @property
+    def plants(self):
+        return VegetationView(self.layer, self.x, self.y)
+        
+    def set_plants(self, amount, energy_density, veg_max):
+        self.layer.set(self.x, self.y, amount, energy_density, veg_max)
+        if self.grid is not None:
+            self.grid.changed(self)
+        
+        
 class Grid(object):
         '''
         A cartesian grid of nodes, stored as a list of lists
         '''
-        def __init__(self, x, y):
+        def __init__(self, x, y, veg_arrays=False, path_cache_size=1024,
+                     chunk_size=16, seed=None):
             '''
             Note that this construction method means that the
             y coordinate comes first when calling directly from
@@ -44,19 +92,122 @@ class Grid(object):
             
             To avoid confusion, use get_node(x, y) instead of
             raw indexing.
+            
+            veg_arrays:
+                If True, vegetation for the whole map is held in
+                a VegetationLayer (self.veg) and every node's
+                plants attribute is a view into it. Otherwise
+                each node gets its own Vegetation object and
+                self.veg is None.
+                
+            path_cache_size:
+                How many computed paths pathfind() remembers.
+                0 turns the cache off.
+                
+            chunk_size:
+                Side of the squares organisms are bucketed into
+                for organisms_near().
+                
+            seed:
+                Seed for self.random, the random number stream
+                every random choice on this grid draws from, so
+                that runs with the same seed play out the same.
+                None seeds it from the system.
             '''
-            self.nodes = []
-            for j in range(y):
-                self.nodes.append([])
-                for i in range(x):
-                    new_node = Node(i, j)
-                    self.nodes[j].append(new_node)
+            self.random = random.Random(seed)
+            if veg_arrays:
+                self.veg = VegetationLayer(x, y)
+            else:
+                self.veg = None
+                
+            self.nodes = self.make_nodes(x, y)
                     
             self.organisms = []
+            self.index = OrganismIndex(chunk_size)
+            #a population.Population attaches itself here
+            self.population = None
+            #and a flowfield.FoodField here
+            self.food_field = None
+            #nodes whose plants or occupants changed since the last
+            #take_changes(), once track_changes() has been called
+            self.dirty = None
+            
+            #built on first use by adjacency()
+            self._adjacency = None
+            self._cells = None
+            self._costs = None
+            
+            #bumped by terrain_changed() whenever a node's
+            #move_cost changes; part of every path cache key
+            self.terrain_version = 0
+            #nodes whose move_cost changed, oldest first, so that
+            #planners can catch up with terrain_changes_since()
+            self.terrain_log = []
+            self.terrain_log_start = 0
+            self.terrain_log_size = 100000
+            self.pathfinder = pathfinder.GridPathFinder(self)
+            self.path_cache = PathCache(path_cache_size)
                     
+        def make_nodes(self, x, y):
+            '''
+            The y lists of x nodes each that make up the map.
+            '''
+            nodes = []
+            for j in range(y):
+                nodes.append([])
+                for i in range(x):
+                    if self.veg is None:
+                        new_node = Node(i, j, self)
+                    else:
+                        new_node = ArrayNode(i, j, self.veg, self)
+                    nodes[j].append(new_node)
+            return nodes
+            
         def get_node(self, x, y):
             return self.nodes[y][x]
             
+        def adjacency(self):
+            '''
+            The Adjacency table for the current shape of the map,
+            built the first time it is needed and rebuilt only if
+            the shape of self.nodes changes.
+            '''
+            width = len(self.nodes[0])
+            height = len(self.nodes)
+            adj = self._adjacency
+            if adj is None or adj.width != width or adj.height != height:
+                adj = Adjacency(width, height)
+                self._cells = [node for row in self.nodes for node in row]
+                self._costs = [node.move_cost for node in self._cells]
+                self._adjacency = adj
+            return adj
+            
+        def cell_index(self, node):
+            '''
+            Position of node in the flat, row-major cell numbering
+            used by the adjacency table.
+            '''
+            return node.y * len(self.nodes[0]) + node.x
+            
+        def cell(self, index):
+            self.adjacency()
+            return self._cells[index]
+            
+        def cells(self):
+            '''
+            Every node in flat cell order.
+            '''
+            self.adjacency()
+            return self._cells
+            
+        def cell_costs(self):
+            '''
+            move_cost of every node in flat cell order, kept up to
+            date as move costs change.
+            '''
+            self.adjacency()
+            return self._costs
+            
         def dist(self, start, end):
             h = sqrt((abs(start.x - end.x) **2) + (abs(start.y - end.y) ** 2))
             return h
@@ -65,38 +216,585 @@ class Grid(object):
             return end.move_cost
             
         def neighbors(self, node):
-            neighbors = []
-            deltas = [-1, 0, 1]
-            for delta in deltas:
-                new_x = node.x + delta
-                for delta in deltas:
-                    new_y = node.y + delta
-                    if (new_x in range(len(self.nodes)) and
-                        new_y in range(len(self.nodes[0]))
-                    ):
-                        new_node = self.get_node(new_x, new_y)
-                        if new_node != node:
-                            neighbors.append(new_node)
-            return neighbors
+            adj = self.adjacency()
+            cells = self._cells
+            index = node.y * adj.width + node.x
+            return [cells[index + offset]
+                    for offset in adj.offsets_for(index)]
+            
+        def pathfind(self, start, goal):
+            '''
+            A* path from start to goal as an iterator over nodes,
+            or an empty list if there is none. Paths are shared
+            between callers through self.path_cache.
+            '''
+            key = (start, goal, self.terrain_version)
+            path = self.path_cache.get(key)
+            if path is None:
+                path = self._cache_path(
+                    key, self.pathfinder.compute_path(start, goal))
+            if not path:
+                return []
+            return iter(path)
+            
+        def pathfind_many(self, requests):
+            '''
+            pathfind() for a list of (start, goal) pairs, returning
+            the paths in the same order. The ones not already in
+            the cache are planned in one call to the pathfinder's
+            compute_paths(), if it has one, which can share them
+            out among processes.
+            '''
+            version = self.terrain_version
+            paths = [self.path_cache.get((start, goal, version))
+                     for start, goal in requests]
+            missing = [i for i, path in enumerate(paths) if path is None]
+            if missing:
+                pairs = [requests[i] for i in missing]
+                if hasattr(self.pathfinder, 'compute_paths'):
+                    found = self.pathfinder.compute_paths(pairs)
+                else:
+                    found = [self.pathfinder.compute_path(start, goal)
+                             for start, goal in pairs]
+                for i, path in zip(missing, found):
+                    start, goal = requests[i]
+                    paths[i] = self._cache_path((start, goal, version), path)
+            return [iter(path) if path else [] for path in paths]
+            
+        def _cache_path(self, key, path):
+            if not getattr(path, 'shared', True):
+                #paths that keep search state of their own, like
+                #dstarlite.ReplanningPath, belong to whoever asked
+                return path
+            if iter(path) is path or isinstance(path, list):
+                #a one-shot iterator can't be shared, nor should a
+                #list callers might change; path objects that can
+                #be walked repeatedly are cached as they are
+                path = tuple(path)
+            self.path_cache.put(key, path)
+            return path
+            
+        def use_pathfinder(self, finder):
+            '''
+            Plan paths with finder from now on, e.g.
+            pathfinder.GridPathFinder(grid, jump_points=True).
+            Paths cached from the previous finder are dropped, and
+            its close() is called if it has one.
+            '''
+            old = self.pathfinder
+            if old is not finder and hasattr(old, 'close'):
+                old.close()
+            self.pathfinder = finder
+            self.path_cache.clear()
+            
+        def terrain_changed(self, node):
+            '''
+            Called by nodes when their move_cost changes. Paths
+            cached before the change are no longer looked up.
+            '''
+            self.terrain_version += 1
+            if self._costs is not None:
+                self._costs[self.cell_index(node)] = node.move_cost
+            self.terrain_log.append(node)
+            if len(self.terrain_log) > self.terrain_log_size:
+                drop = len(self.terrain_log) // 2
+                del self.terrain_log[:drop]
+                self.terrain_log_start += drop
+                
+        def terrain_changes_since(self, version):
+            '''
+            Nodes whose move_cost has changed since terrain_version
+            was version, oldest first and possibly repeated. None
+            if the log no longer goes back that far, in which case
+            anything built on the terrain should be rebuilt.
+            '''
+            if version < self.terrain_log_start:
+                return None
+            return self.terrain_log[version - self.terrain_log_start:]
+            
+        def add_organism(self, org):
+            org._org_slot = len(self.organisms)
+            self.organisms.append(org)
+            
+        def remove_organism(self, org):
+            '''
+            Take org out of the population and off the map, in
+            constant time. The last organism in self.organisms
+            takes its place in the list.
+            '''
+            last = self.organisms.pop()
+            if last is not org:
+                self.organisms[org._org_slot] = last
+                last._org_slot = org._org_slot
+            if org.location is not None:
+                self._take_off(org)
+                self.index.remove(org)
+                org.location = None
+            
+        def place(self, org, node):
+            '''
+            Put org on node, taking it off the node it was on.
+            '''
+            if org.location is not None:
+                self._take_off(org)
+            if self.dirty is not None:
+                self.dirty.add(node)
+            org._occupant_slot = len(node.occupants)
+            node.occupants.append(org)
+            org.location = node
+            self.index.move(org, node)
+            
+        def _take_off(self, org):
+            if self.dirty is not None:
+                self.dirty.add(org.location)
+            occupants = org.location.occupants
+            last = occupants.pop()
+            if last is not org:
+                occupants[org._occupant_slot] = last
+                last._occupant_slot = org._occupant_slot
+                
+        def track_changes(self):
+            '''
+            Start keeping self.dirty, the set of nodes whose plants
+            or occupants have changed, for redrawing only those.
+            Changes made by setting a node's plants attributes
+            directly aren't noticed, nor are changes in a
+            vegetation layer's arrays.
+            '''
+            if self.dirty is None:
+                self.dirty = set()
+                
+        def take_changes(self):
+            '''
+            The nodes changed since the last call, or since
+            track_changes().
+            '''
+            dirty = self.dirty
+            self.dirty = set()
+            return dirty
+            
+        def changed(self, node):
+            if self.dirty is not None:
+                self.dirty.add(node)
+                
+        def find_plants(self, organisms):
+            '''
+            Organism.find_plants() for many organisms at once: a
+            list with the nearest node with plants in sight of each
+            organism, or [] where there is none. With a vegetation
+            layer, all organisms with the same sight_range are
+            looked up in a single array operation.
+            '''
+            if self.veg is None:
+                return [org.find_plants() for org in organisms]
+            goals = [[]] * len(organisms)
+            by_range = {}
+            for i, org in enumerate(organisms):
+                by_range.setdefault(org.sight_range, []).append(i)
+            cells = self.cells()
+            for sight_range, members in by_range.items():
+                xs = np.array([organisms[i].location.x for i in members])
+                ys = np.array([organisms[i].location.y for i in members])
+                found = self.veg.nearest_food(xs, ys, sight_range)
+                for i, index in zip(members, found.tolist()):
+                    if index >= 0:
+                        goals[i] = cells[index]
+            return goals
+            
+        def organisms_near(self, node, radius):
+            '''
+            Every organism within distance radius of node.
+            '''
+            return self.index.near(node, radius)
             
         def update(self):
-            for org in self.organisms:
+            if self.food_field is not None:
+                self.food_field.update()
+            #organisms that die drop out of self.organisms mid-tick,
+            #so go through a copy
+            for org in list(self.organisms):
                 org.decide()
+            if self.population is not None:
+                self.population.step()
+            if self.veg is not None:
+                self.veg.grow()
                     
+class Adjacency(object):
+    '''
+    Neighbour lookup for a width x height grid of cells numbered
+    row-major (index = y * width + x).
+    
+    offsets holds the flat index offset to each of the 8 possible
+    neighbours, and edge_mask has one byte per cell with bit k set
+    if neighbour k is on the map. Neighbours come out in the same
+    order Grid.neighbors has always used: x-major, then y.
+    '''
+    DELTAS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+              if (dx, dy) != (0, 0)]
+    
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.offsets = np.array(
+            [dy * width + dx for dx, dy in self.DELTAS], dtype=np.int32)
+        
+        index = np.arange(width * height)
+        xs = index % width
+        ys = index // width
+        mask = np.zeros(width * height, dtype=np.uint8)
+        for bit, (dx, dy) in enumerate(self.DELTAS):
+            on_map = ((xs + dx >= 0) & (xs + dx < width) &
+                      (ys + dy >= 0) & (ys + dy < height))
+            mask |= on_map.astype(np.uint8) << bit
+        self.edge_mask = bytearray(mask.tobytes())
+        
+        #only a handful of masks occur (interior, edges, corners),
+        #so the offset tuple for each one is worked out up front
+        self._by_mask = [
+            tuple(int(self.offsets[bit]) for bit in range(8)
+                  if m & (1 << bit))
+            for m in range(256)
+        ]
+        
+    def offsets_for(self, index):
+        '''
+        Flat offsets from cell index to each of its neighbours.
+        '''
+        return self._by_mask[self.edge_mask[index]]
+        
+    def neighbor_indices(self, index):
+        return [index + offset for offset in self.offsets_for(index)]
+        
+        
+class OrganismIndex(object):
+    '''
+    Organisms bucketed by which chunk_size x chunk_size square of
+    the map they are in. Adding, removing and moving an organism
+    take constant time, and near() only looks in the buckets that
+    overlap the search area.
+    
+    Each organism remembers its bucket and its position in it, so
+    it can be removed by moving the last organism of the bucket
+    into its place.
+    '''
+    def __init__(self, chunk_size=16):
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.count = 0
+        
+    def __len__(self):
+        return self.count
+        
+    def add(self, org, node):
+        key = (node.x // self.chunk_size, node.y // self.chunk_size)
+        bucket = self.chunks.get(key)
+        if bucket is None:
+            bucket = self.chunks[key] = []
+        org._chunk = key
+        org._chunk_slot = len(bucket)
+        bucket.append(org)
+        self.count += 1
+        
+    def remove(self, org):
+        bucket = self.chunks[org._chunk]
+        last = bucket.pop()
+        if last is not org:
+            bucket[org._chunk_slot] = last
+            last._chunk_slot = org._chunk_slot
+        elif not bucket:
+            del self.chunks[org._chunk]
+        org._chunk = None
+        self.count -= 1
+        
+    def move(self, org, node):
+        '''
+        Record that org is now on node, which may or may not be in
+        the same chunk as before.
+        '''
+        key = (node.x // self.chunk_size, node.y // self.chunk_size)
+        if key != org._chunk:
+            if org._chunk is not None:
+                self.remove(org)
+            self.add(org, node)
+            
+    def near(self, node, radius):
+        '''
+        Organisms within distance radius of node.
+        '''
+        size = self.chunk_size
+        x, y = node.x, node.y
+        limit = radius * radius
+        found = []
+        for cy in range(int(y - radius) // size, int(y + radius) // size + 1):
+            for cx in range(int(x - radius) // size,
+                            int(x + radius) // size + 1):
+                bucket = self.chunks.get((cx, cy))
+                if bucket is None:
+                    continue
+                for org in bucket:
+                    loc = org.location
+                    if (loc.x - x) ** 2 + (loc.y - y) ** 2 <= limit:
+                        found.append(org)
+        return found
+        
+        
+class SightStencil(object):
+    '''
+    Offsets (dx, dy) to every cell up to sight_range away in both
+    directions, nearest first; offsets at the same distance are in
+    the order Organism.can_see() lists their cells. Held both as a
+    list of tuples (offsets) and as two arrays (dx, dy).
+    '''
+    def __init__(self, sight_range):
+        deltas = range(-sight_range, sight_range + 1)
+        self.offsets = sorted(
+            [(dx, dy) for dx in deltas for dy in deltas],
+            key=lambda offset: offset[0] ** 2 + offset[1] ** 2)
+        self.dx = np.array([dx for dx, dy in self.offsets])
+        self.dy = np.array([dy for dx, dy in self.offsets])
+        
+        
+_stencils = {}
+
+def sight_stencil(sight_range):
+    '''
+    The SightStencil for sight_range, built once and shared.
+    '''
+    stencil = _stencils.get(sight_range)
+    if stencil is None:
+        stencil = _stencils[sight_range] = SightStencil(sight_range)
+    return stencil
+    
+    
+class PathCache(object):
+    '''
+    Least-recently-used store of paths, with counters of how
+    often a lookup found one (hits) or not (misses).
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.paths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        
+    def __len__(self):
+        return len(self.paths)
+        
+    def get(self, key):
+        '''
+        The path stored under key, or None.
+        '''
+        path = self.paths.pop(key, None)
+        if path is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.paths[key] = path
+        return path
+        
+    def put(self, key, path):
+        if self.size <= 0:
+            return
+        self.paths[key] = path
+        if len(self.paths) > self.size:
+            self.paths.popitem(last=False)
+            
+    def clear(self):
+        self.paths.clear()
+        
+        
 class Vegetation(object):
     '''
     Hold information about plants in a node
     '''
+    __slots__ = ('amount', 'energy_density', 'veg_max')
+    
     def __init__(self, amount, energy_density, veg_max):
         self.amount = amount
         self.energy_density = energy_density
         self.veg_max = veg_max
         
+        
+class VegetationLayer(object):
+    '''
+    Vegetation for a whole map, stored as three contiguous arrays
+    indexed [y, x] like Grid.nodes.
+    '''
+    def __init__(self, x, y):
+        self.amount = np.zeros((y, x))
+        self.energy_density = np.zeros((y, x))
+        self.veg_max = np.zeros((y, x))
+        
+        #Per-tick rates used by grow(). All zero means vegetation
+        #stays put, as it does for Vegetation objects.
+        self.growth_rate = 0.
+        self.decay_rate = 0.
+        self.diffusion_rate = 0.
+        
+    def set(self, x, y, amount, energy_density, veg_max):
+        self.amount[y, x] = amount
+        self.energy_density[y, x] = energy_density
+        self.veg_max[y, x] = veg_max
+        
+    def fill(self, amount, energy_density, veg_max):
+        '''
+        Set every cell at once, e.g. fill(10, 1, 10) for a map of
+        plains.
+        '''
+        self.amount.fill(amount)
+        self.energy_density.fill(energy_density)
+        self.veg_max.fill(veg_max)
+        
+    def grow(self):
+        '''
+        Advance the vegetation by one tick over the whole map:
+        
+        diffusion:
+            each cell moves diffusion_rate of the way towards the
+            mean of its four orthogonal neighbours. Edges are
+            closed, so nothing leaks off the map.
+        growth:
+            logistic regrowth, amount grows by
+            growth_rate * amount * (1 - amount / veg_max).
+            Cells with no plants only regrow if diffusion seeds
+            them.
+        decay:
+            amount shrinks by decay_rate * amount.
+            
+        The result is clipped to [0, veg_max].
+        '''
+        self.grow_rows(0, self.amount.shape[0], self.amount)
+        
+    def grow_rows(self, y0, y1, out):
+        '''
+        grow() for rows y0 to y1 only: reads self.amount, including
+        the rows just outside the strip for diffusion, and writes
+        the new amounts to out[y0:y1]. out may be self.amount
+        itself. Splitting the map into strips gives exactly the
+        same result as growing it whole.
+        '''
+        amount = out[y0:y1]
+        if out is not self.amount:
+            amount[...] = self.amount[y0:y1]
+        veg_max = self.veg_max[y0:y1]
+        if self.diffusion_rate:
+            spread = self.neighbour_mean(self.amount, y0, y1)
+            spread -= amount
+            spread *= self.diffusion_rate
+            amount += spread
+        if self.growth_rate:
+            room = np.zeros(amount.shape)
+            np.divide(amount, veg_max, out=room, where=veg_max > 0)
+            np.subtract(1, room, out=room)
+            room *= amount
+            room *= self.growth_rate
+            amount += room
+        if self.decay_rate:
+            amount *= 1 - self.decay_rate
+        np.minimum(amount, veg_max, out=amount)
+        np.maximum(amount, 0, out=amount)
+        
+    def neighbour_mean(self, a, y0=0, y1=None):
+        '''
+        Mean of the four orthogonal neighbours of every cell of a,
+        with cells off the edge of the map taking the value of the
+        edge cell. Only rows y0 to y1 are returned if given.
+        '''
+        if y1 is None:
+            y1 = a.shape[0]
+        rows = a[y0:y1]
+        mean = np.empty(rows.shape)
+        mean[1:] = rows[:-1]
+        mean[0] = a[max(y0 - 1, 0)]
+        mean[:-1] += rows[1:]
+        mean[-1] += a[min(y1, a.shape[0] - 1)]
+        mean[:, 1:] += rows[:, :-1]
+        mean[:, 0] += rows[:, 0]
+        mean[:, :-1] += rows[:, 1:]
+        mean[:, -1] += rows[:, -1]
+        mean *= .25
+        return mean
+        
+    def nearest_food(self, xs, ys, sight_range, batch=4096):
+        '''
+        For each position (xs[i], ys[i]), the flat index of the
+        nearest cell within sight_range with plants on it, by the
+        order of sight_stencil(sight_range), or -1 if there is
+        none. Positions are handled batch at a time to bound the
+        size of the intermediate arrays.
+        '''
+        stencil = sight_stencil(sight_range)
+        height, width = self.amount.shape
+        result = np.empty(len(xs), dtype=np.int64)
+        for lo in range(0, len(xs), batch):
+            x = xs[lo:lo + batch, None] + stencil.dx
+            y = ys[lo:lo + batch, None] + stencil.dy
+            food = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            np.clip(x, 0, width - 1, out=x)
+            np.clip(y, 0, height - 1, out=y)
+            food &= self.amount[y, x] > 0
+            first = food.argmax(axis=1)
+            rows = np.arange(len(first))
+            result[lo:lo + batch] = np.where(
+                food[rows, first],
+                y[rows, first] * width + x[rows, first],
+                -1)
+        return result
+        
+    def fraction(self):
+        '''
+        amount / veg_max for every cell, 0 where veg_max is 0.
+        '''
+        frac = np.zeros(self.amount.shape)
+        np.divide(self.amount, self.veg_max, out=frac,
+                  where=self.veg_max > 0)
+        return frac
+        
+        
+class VegetationView(object):
+    '''
+    Stands in for a Vegetation object, reading and writing one
+    cell of a VegetationLayer.
+    '''
+    __slots__ = ('layer', 'cell')
+    
+    def __init__(self, layer, x, y):
+        self.layer = layer
+        self.cell = (y, x)
+        
+    @property
+    def amount(self):
+        return self.layer.amount.item(self.cell)
+        
+    @amount.setter
+    def amount(self, value):
+        self.layer.amount[self.cell] = value
+        
+    @property
+    def energy_density(self):
+        return self.layer.energy_density.item(self.cell)
+        
+    @energy_density.setter
+    def energy_density(self, value):
+        self.layer.energy_density[self.cell] = value
+        
+    @property
+    def veg_max(self):
+        return self.layer.veg_max.item(self.cell)
+        
+    @veg_max.setter
+    def veg_max(self, value):
+        self.layer.veg_max[self.cell] = value
+        
                     
 class Organism(object):
     '''
     Base class for all organisms
     '''
+    __slots__ = ('energy', 'energy_max', 'bitesize', 'speed', 'sight_range',
+                 'eat_threshold', 'litter_size', 'grid', 'location', 'path',
+                 'goal', '_org_slot', '_occupant_slot', '_chunk',
+                 '_chunk_slot')
     
     def __init__(self, grid):
         self.energy = 100.
@@ -109,28 +807,31 @@ class Organism(object):
         self.litter_size  = 2
 
         self.grid = grid
-        self.grid.organisms.append(self)
+        self.location = None
         self.path = []
         self.goal = []
+        
+        #bookkeeping for the grid's constant-time removals
+        self._org_slot = None
+        self._occupant_slot = None
+        self._chunk = None
+        self._chunk_slot = None
+        self.grid.add_organism(self)
     
     def set_location(self, node):
-        self.location = node
-        node.occupants.append(self)
+        self.grid.place(self, node)
         
     def pathfind(self, goal):
         '''
         A* pathfinding to goal
         '''
-        pf = pathfinder.PathFinder(self.grid.neighbors,
-                                    self.grid.move_cost,
-                                    self.grid.dist)
-        p = pf.compute_path(self.location, goal)
-        return p
+        return self.grid.pathfind(self.location, goal)
                 
         
     def graze(self):
         self.location.plants.amount -= self.bitesize
         self.energy += self.location.plants.energy_density * self.bitesize
+        self.grid.changed(self.location)
         
     def move(self):
         for i in range(self.speed):
@@ -138,8 +839,13 @@ class Organism(object):
                 self.path = False
                 self.goal = False
             else:
-                self.location.occupants.remove(self)
-                dest = self.path.next()
+                dest = next(self.path, None)
+                if dest is None:
+                    #a path that replans can end short of the goal,
+                    #at other food or where there's no way on
+                    self.path = False
+                    self.goal = False
+                    break
                 self.energy -= dest.move_cost
                 self.set_location(dest)
             
@@ -148,36 +854,62 @@ class Organism(object):
 #This is just an extension of Grid.neighbors() to arbitrary
 #distances. But neighbors needs to have a static range of 1
 #to tie into the A* implementation. Maybe fixable?
-        can_see = []
-        deltas = range(-self.sight_range, self.sight_range +1)
-        for delta in deltas:
-            new_x = self.location.x + delta
-            for delta in deltas:
-                new_y = self.location.y + delta
-                if (new_x in range(len(self.grid.nodes)) and
-                    new_y in range(len(self.grid.nodes[0]))
-                ):
-                    new_node = self.grid.get_node(new_x, new_y)
-                    can_see.append(new_node)
-        return can_see
+        nodes = self.grid.nodes
+        x, y = self.location.x, self.location.y
+        xs = range(max(0, x - self.sight_range),
+                   min(len(nodes[0]), x + self.sight_range + 1))
+        ys = range(max(0, y - self.sight_range),
+                   min(len(nodes), y + self.sight_range + 1))
+        return [nodes[new_y][new_x] for new_x in xs for new_y in ys]
     
     def find_plants(self):
-        search_order = sorted(
-            self.can_see(),
-            key = lambda x: self.grid.dist(self.location, x)
-        )
-        found = False
-        resign = False
-        goal = []
-        while not found and not resign:
-            for node in search_order:
+        '''
+        The nearest node in sight with plants on it, or [] if there
+        is none. Of equally near nodes, the first in can_see() order
+        wins.
+        '''
+        if self.grid.veg is not None:
+            return self.grid.find_plants([self])[0]
+        nodes = self.grid.nodes
+        width, height = len(nodes[0]), len(nodes)
+        x, y = self.location.x, self.location.y
+        for dx, dy in sight_stencil(self.sight_range).offsets:
+            new_x = x + dx
+            new_y = y + dy
+            if 0 <= new_x < width and 0 <= new_y < height:
+                node = nodes[new_y][new_x]
                 if node.plants.amount > 0:
-                    goal = node
-                    found = True
-            resign = True
-            return goal
+                    return node
+        return []
             
     def forage(self):
+        '''
+        Head for the nearest food in sight. With a FoodField on
+        the grid, follow that to the food cheapest to reach, if
+        it is in sight, instead of searching; if it isn't, search
+        for food in sight as usual. With a pathfinder that has
+        food_path(), such as dstarlite.ReplanningPathFinder, head
+        for all the food in sight at once, switching to the next
+        nearest if the target is eaten first.
+        '''
+        field = self.grid.food_field
+        if field is not None:
+            route = field.route(self.location, self.sight_range)
+            if route:
+                self.goal = route[-1]
+                self.path = iter(route)
+                return
+        finder = self.grid.pathfinder
+        if hasattr(finder, 'food_path'):
+            goals = [node for node in self.can_see()
+                     if node.plants.amount > 0]
+            path = goals and finder.food_path(self.location, goals)
+            if path:
+                self.goal = path.goal
+                self.path = path
+            else:
+                self.goal = []
+            return
         self.goal = self.find_plants()
         if self.goal:
             self.path = self.pathfind(self.goal)
@@ -196,12 +928,11 @@ class Organism(object):
                     self.wander()
             
     def wander(self):
-        self.goal = choice(self.can_see())
+        self.goal = self.grid.random.choice(self.can_see())
         self.path = self.pathfind(self.goal)
         
     def die(self):
-        self.grid.organisms.remove(self)
-        self.location.occupants.remove(self)
+        self.grid.remove_organism(self)
         
     def give_birth(self):
         for i in range(self.litter_size):
@@ -226,13 +957,27 @@ class Visualizer(object):
             (65, 171, 93),
             (35, 132, 67),
             (0, 90, 50)]
+    #colour of organisms in bulk mode, shaded in over the
+    #vegetation in proportion to how many share a cell, up to
+    #DENSITY_FULL
+    DENSITY = (150, 30, 30)
+    DENSITY_FULL = 4
+    #cells smaller than this many pixels are drawn in bulk mode
+    #unless told otherwise
+    BULK_BELOW = 6
 
-    def __init__(self, grid):
+    def __init__(self, grid, bulk=None):
         '''
         Create a new visualization.
         
         grid:
             The Grid object to be visualized.
+            
+        bulk:
+            Draw the map as one image made from arrays (see
+            draw_bulk()) rather than cell by cell. Defaults to
+            doing so when cells would be less than BULK_BELOW
+            pixels wide or high.
         '''
         pygame.init()
         self.screen = pygame.display.set_mode(
@@ -241,8 +986,23 @@ class Visualizer(object):
         self.grid = grid        
         self.grid_width = self.WINDOWWIDTH / len(grid.nodes[0])
         self.grid_height = self.WINDOWHEIGHT / len(grid.nodes)
+        if bulk is None:
+            bulk = min(self.grid_width, self.grid_height) < self.BULK_BELOW
+        self.bulk = bulk
+        self.palette = np.array(self.YL_GN, dtype=np.uint8)
+        #one pixel per cell, and the same scaled to the window
+        self.small = pygame.Surface((len(grid.nodes[0]), len(grid.nodes)),
+                                    0, 32)
+        self.scaled = pygame.Surface(self.screen.get_size(), 0, 32)
         
         self.font = pygame.font.Font(None, 36)
+        #occupant count -> rendered text
+        self.glyphs = {}
+        #node -> (colour, occupant count) as last drawn
+        self.shown = {}
+        #palette index of every cell of a vegetation layer as last
+        #drawn
+        self.shown_veg = None
         
     def draw_grid(self):
         for x in range(0, self.WINDOWWIDTH, self.grid_width):
@@ -262,18 +1022,145 @@ class Visualizer(object):
     def fill_grid(self):
         for row in self.grid.nodes:
             for node in row:
-                draw_x = node.x * self.grid_width
-                draw_y = node.y * self.grid_height
-                color = self.set_bg(node)
-                draw_node = pygame.Rect(
-                    (draw_x, draw_y, self.grid_width, self.grid_height))
-                pygame.draw.rect(self.screen, color, draw_node)
-                if node.occupants:
-                    text = self.font.render(str(len(node.occupants)), 1, self.BLACK)
-                    text_pos = text.get_rect()
-                    text_pos.centerx = draw_node.centerx
-                    text_pos.centery = draw_node.centery
-                    self.screen.blit(text, text_pos)
+                self.draw_node(node)
+        #changes are tracked from the first full drawing on, for
+        #draw_changes()
+        self.grid.track_changes()
+        self.grid.take_changes()
+        if self.grid.veg is not None:
+            self.shown_veg = self.veg_palette_index()
+                    
+    def draw_node(self, node):
+        '''
+        Paint one cell and return its rect.
+        '''
+        color = self.set_bg(node)
+        count = len(node.occupants)
+        self.shown[node] = (color, count)
+        draw_node = pygame.Rect(
+            (node.x * self.grid_width, node.y * self.grid_height,
+             self.grid_width, self.grid_height))
+        pygame.draw.rect(self.screen, color, draw_node)
+        if count:
+            text = self.glyph(count)
+            text_pos = text.get_rect()
+            text_pos.centerx = draw_node.centerx
+            text_pos.centery = draw_node.centery
+            self.screen.blit(text, text_pos)
+        return draw_node
+        
+    def glyph(self, count):
+        '''
+        The rendered occupant count, rendered once per count.
+        '''
+        text = self.glyphs.get(count)
+        if text is None:
+            text = self.font.render(str(count), 1, self.BLACK)
+            self.glyphs[count] = text
+        return text
+        
+    def veg_palette_index(self):
+        '''
+        Index into YL_GN of every cell of the vegetation layer, as
+        set_bg() would pick it.
+        '''
+        scale = len(self.YL_GN) - 1
+        return (self.grid.veg.fraction() * scale).astype(int)
+        
+    def draw_bulk(self):
+        '''
+        Draw the whole map at once: look up the palette colour of
+        every cell's vegetation fraction in one array operation,
+        shade in organism density, blit the result onto a surface
+        with one pixel per cell, and scale that to the window.
+        '''
+        self.draw_arrays(self.veg_fraction(), self.occupancy())
+        self.drop_changes()
+        
+    def drop_changes(self):
+        '''
+        Forget the grid's changes after the whole map has been
+        redrawn, if they are being tracked.
+        '''
+        if self.grid.dirty is not None:
+            self.grid.take_changes()
+        
+    def draw_arrays(self, frac, occupancy):
+        '''
+        draw_bulk() from given vegetation fraction and occupancy
+        arrays.
+        '''
+        scale = len(self.YL_GN) - 1
+        rgb = self.palette[(frac * scale).astype(int)].astype(float)
+        density = np.minimum(occupancy / float(self.DENSITY_FULL), 1)
+        density = density[:, :, None]
+        rgb *= 1 - density
+        rgb += density * np.array(self.DENSITY, dtype=float)
+        #surfarray indexes [x, y]
+        pygame.surfarray.blit_array(
+            self.small, rgb.astype(np.uint8).transpose(1, 0, 2))
+        pygame.transform.scale(self.small, self.scaled.get_size(), self.scaled)
+        self.screen.blit(self.scaled, (0, 0))
+        
+    def veg_fraction(self):
+        '''
+        amount / veg_max of every cell, indexed [y, x].
+        '''
+        if self.grid.veg is not None:
+            return self.grid.veg.fraction()
+        return np.array([[float(node.plants.amount) / node.plants.veg_max
+                          for node in row] for row in self.grid.nodes])
+        
+    def occupancy(self):
+        '''
+        Organisms on every cell, from both Organism objects and
+        the grid's Population, indexed [y, x].
+        '''
+        grid = self.grid
+        height, width = len(grid.nodes), len(grid.nodes[0])
+        counts = np.zeros((height, width))
+        if grid.organisms:
+            located = [org.location for org in grid.organisms
+                       if org.location is not None]
+            cells = [node.y * width + node.x for node in located]
+            counts += np.bincount(cells, minlength=width * height).reshape(
+                height, width)
+        if grid.population is not None:
+            counts += grid.population.occupancy()
+        return counts
+        
+    def draw_changes(self):
+        '''
+        Repaint only the cells that look different from when they
+        were last drawn, and return their rects for
+        pygame.display.update(). Candidates are the grid's
+        changed nodes plus, with a vegetation layer, every cell
+        whose colour has moved to another step of the palette.
+        In bulk mode, or if the map hasn't been drawn cell by
+        cell yet, the whole map is redrawn.
+        '''
+        grid = self.grid
+        if self.bulk or grid.dirty is None:
+            self.draw()
+            return [self.screen.get_rect()]
+        nodes = grid.take_changes()
+        if grid.veg is not None:
+            palette_index = self.veg_palette_index()
+            if self.shown_veg is not None:
+                changed = np.flatnonzero(palette_index != self.shown_veg)
+                nodes.update(grid.cell(i) for i in changed)
+            self.shown_veg = palette_index
+        rects = []
+        for node in nodes:
+            if self.shown.get(node) != (self.set_bg(node),
+                                        len(node.occupants)):
+                rect = self.draw_node(node)
+                pygame.draw.line(self.screen, self.DK_GREY,
+                                 rect.topleft, rect.topright)
+                pygame.draw.line(self.screen, self.DK_GREY,
+                                 rect.topleft, rect.bottomleft)
+                rects.append(rect)
+        return rects
 
     def set_bg(self, node):
         pct_veg = float(node.plants.amount)/float(node.plants.veg_max)
@@ -281,20 +1168,114 @@ class Visualizer(object):
         return self.YL_GN[scaled]
                             
     def draw(self):
+        if self.bulk:
+            self.draw_bulk()
+            return
         self.fill_grid()
         self.draw_grid()
 
             
-    def run(self):
+    def run_realtime(self, tps=10, fps=30, ticks=None, tick=None):
+        '''
+        Run the simulation at tps ticks a second in a
+        SimulationThread, and draw it at up to fps frames a second
+        until the window is closed or ticks ticks have run.
+        Returns the numbers of ticks run and frames drawn.
+        
+        Each frame copies the vegetation fraction and occupancy
+        arrays while holding the simulation's lock, then draws
+        from the copies (as draw_bulk(), with grid lines unless in
+        bulk mode) with the lock released. The simulation waits
+        for nothing but those copies. When drawing falls behind,
+        the frame simply shows the latest tick and the ticks in
+        between go undrawn.
+        
+        tick:
+            Called for each tick; grid.update by default, or e.g.
+            an engine.Engine's update.
+        '''
+        sim = SimulationThread(tick or self.grid.update, tps, ticks)
+        clock = pygame.time.Clock()
+        frames = 0
+        drawn = None
+        sim.start()
+        try:
+            while sim.is_alive():
+                if any(event.type == pygame.QUIT
+                       for event in pygame.event.get()):
+                    break
+                if sim.ticks != drawn:
+                    with sim.lock:
+                        drawn = sim.ticks
+                        frac = self.veg_fraction()
+                        occupancy = self.occupancy()
+                        self.drop_changes()
+                    self.draw_arrays(frac, occupancy)
+                    if not self.bulk:
+                        self.draw_grid()
+                    pygame.display.update()
+                    frames += 1
+                clock.tick(fps)
+        finally:
+            sim.stop()
+            sim.join()
+        return sim.ticks, frames
+        
+    def run(self, fps=30):
+        '''
+        Tick once per mouse click, redrawing at up to fps frames
+        a second.
+        '''
+        clock = pygame.time.Clock()
+        self.draw()
+        pygame.display.update()
         while True:
+            clock.tick(fps)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     sys.exit()
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     self.grid.update()
-                self.draw()
-            pygame.display.update()    
+            pygame.display.update(self.draw_changes())    
         
     
-    
\ No newline at end of file
+    
+
+
+class SimulationThread(threading.Thread):
+    '''
+    Calls tick() tps times a second, or as fast as it can if tps
+    is None, until stop() is called or limit ticks have run. Each
+    tick holds self.lock, for readers that need a consistent view
+    of the grid. A tick that runs late starts the schedule afresh
+    rather than being followed by a burst of catch-up ticks.
+    '''
+    def __init__(self, tick, tps=None, limit=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.tick = tick
+        self.tps = tps
+        self.limit = limit
+        self.ticks = 0
+        self.lock = threading.Lock()
+        self._stopped = threading.Event()
+        
+    def stop(self):
+        self._stopped.set()
+        
+    def run(self):
+        due = time.time()
+        while not self._stopped.is_set():
+            if self.limit is not None and self.ticks >= self.limit:
+                break
+            with self.lock:
+                self.tick()
+                self.ticks += 1
+            if self.tps:
+                due += 1. / self.tps
+                delay = due - time.time()
+                if delay > 0:
+                    self._stopped.wait(delay)
+                else:
+                    due = time.time()
@@ -1,4 +1,10 @@
-from priorityqueueset import PriorityQueueSet
+from array import array
+from collections import OrderedDict
+from heapq import heappush, heappop
+from math import sqrt
+import multiprocessing
+import numpy as np
+from priorityqueueset import IndexedPriorityQueueSet
 
 
 class PathFinder(object):
@@ -36,6 +42,11 @@ class PathFinder(object):
         self.successors = successors
         self.move_cost = move_cost
         self.heuristic_to_goal = heuristic_to_goal
+        
+        # nodes expanded by all searches so far, and the most nodes
+        # the open set held during the last one
+        self.expansions = 0
+        self.open_peak = 0
     
     def compute_path(self, start, goal):
         """ Compute the path between the 'start' point and the 
@@ -55,10 +66,13 @@ class PathFinder(object):
         start_node.g_cost = 0
         start_node.f_cost = self._compute_f_cost(start_node, goal)
         
-        open_set = PriorityQueueSet()
+        open_set = IndexedPriorityQueueSet()
         open_set.add(start_node)
+        self.open_peak = 0
         
         while len(open_set) > 0:
+            if len(open_set) > self.open_peak:
+                self.open_peak = len(open_set)
             # Remove and get the node with the lowest f_score from 
             # the open set            
             #
@@ -68,6 +82,7 @@ class PathFinder(object):
                 return self._reconstruct_path(curr_node)
             
             closed_set[curr_node] = curr_node
+            self.expansions += 1
             
             for succ_coord in self.successors(curr_node.coord):
                 succ_node = self._Node(succ_coord)
@@ -121,6 +136,8 @@ class PathFinder(object):
             coordinate, which is assumed to be unique) and 
             comparison (based on f_cost) for sorting by cost.
         """
+        __slots__ = ('coord', 'g_cost', 'f_cost', 'pred')
+
         def __init__(self, coord, g_cost=None, f_cost=None, pred=None):
             self.coord = coord
             self.g_cost = g_cost
@@ -143,6 +160,465 @@ class PathFinder(object):
             return self.__str__()
 
 
+# The finder whose searches a compute_paths() pool runs. Set just
+# before the pool is forked, so each worker has its own copy.
+_pool_finder = None
+
+
+def _pool_search(pair):
+    before = _pool_finder.expansions
+    path = _pool_finder.compute_index_path(*pair)
+    return path, _pool_finder.expansions - before
+
+
+class GridPathFinder(object):
+    """ A* specialised for lifesim.Grid, or anything with the same
+        flat cell numbering (index = y * width + x).
+        
+        The search works on integer cell indices throughout: g
+        costs, parents and visited/closed marks live in lists
+        allocated once per grid size, and the open set is a heap
+        of (f_cost, counter, index) tuples, so no per-successor
+        objects are created. Entries are stamped with a search
+        number instead of being cleared between searches.
+        
+        Moving into a cell costs that cell's move_cost, whether
+        the move is straight or diagonal.
+        
+        With jump_points set, stretches of cells that cost exactly
+        uniform_cost to enter are crossed with Jump Point Search:
+        instead of queueing every cell along the many equally
+        cheap paths through such a region, the search jumps in
+        straight and diagonal lines and only stops where the line
+        meets the goal or comes next to a cell of any other cost.
+        Cells of other costs, and their immediate neighbours, are
+        expanded one step at a time as in plain A*.
+        
+        Use PathFinder for arbitrary graphs.
+    """
+    def __init__(self, grid, jump_points=False, uniform_cost=1,
+                 heuristic='euclidean', processes=1):
+        """ Create a new GridPathFinder.
+        
+            grid:
+                Provides adjacency() (with width, height and
+                offsets_for(index)), cells(), cell_costs(),
+                cell_index(node) and terrain_version, as
+                lifesim.Grid does.
+                
+            jump_points:
+                Use Jump Point Search over uniform_cost cells.
+                
+            heuristic:
+                'euclidean', the straight-line distance that Grid
+                has always used, or 'chebyshev', the number of
+                king's moves to the goal times uniform_cost.
+                Straight-line distance overestimates diagonal
+                moves, so only 'chebyshev' guarantees the cheapest
+                path, as long as no cell costs less than
+                uniform_cost.
+                
+            processes:
+                Default number of worker processes for
+                compute_paths().
+        """
+        if heuristic not in ('euclidean', 'chebyshev'):
+            raise ValueError("Unknown heuristic %r" % (heuristic,))
+        self.grid = grid
+        self.jump_points = jump_points
+        self.uniform_cost = uniform_cost
+        self.heuristic = heuristic
+        self.processes = processes
+        # cells expanded by all searches so far, and the most
+        # entries the open set held during the last one
+        self.expansions = 0
+        self.open_peak = 0
+        self._size = 0
+        self._search = 0
+        self._open_cells = None
+        self._open_version = None
+        self._pool = None
+        self._pool_key = None
+        
+    def compute_path(self, start, goal):
+        """ Compute the path between the 'start' node and the 
+            'goal' node. 
+            
+            The path is returned as an iterator to the nodes, 
+            including the start and goal nodes themselves.
+            
+            If no path was found, an empty list is returned.
+        """
+        grid = self.grid
+        cells = grid.cells()
+        path = self.compute_index_path(grid.cell_index(start),
+                                       grid.cell_index(goal))
+        if not path:
+            return []
+        return iter([cells[index] for index in path])
+        
+    def compute_paths(self, requests, processes=None):
+        """ Paths for a list of (start, goal) node pairs, returned
+            in the same order, each as a list of nodes, or an empty
+            list if there is no path. Identical requests are
+            searched once and share one list.
+            
+            With more than one process (self.processes unless
+            given), the distinct searches are shared out among a
+            pool of worker processes. Processes rather than threads,
+            since the search is pure Python and threads would only
+            take turns holding the interpreter lock. The pool is
+            kept for later calls, forked again when the terrain or
+            the shape of the map changes, and ended by close().
+            Worker processes can't start pools of their own, so
+            this runs serially inside an engine.Engine.
+        """
+        processes = processes or self.processes
+        if multiprocessing.current_process().daemon:
+            processes = 1
+        grid = self.grid
+        cells = grid.cells()
+        cell_index = grid.cell_index
+        keys = [(cell_index(start), cell_index(goal))
+                for start, goal in requests]
+        unique = list(OrderedDict.fromkeys(keys))
+        if processes > 1 and len(unique) > 1:
+            found = self._pool_search(unique, processes)
+        else:
+            found = [self.compute_index_path(start, goal)
+                     for start, goal in unique]
+        paths = dict((key, [cells[index] for index in path])
+                     for key, path in zip(unique, found))
+        return [paths[key] for key in keys]
+        
+    def close(self):
+        """ End the compute_paths() worker pool, if there is one.
+        """
+        if self._pool is not None:
+            # No map() is ever left running, so the workers can be
+            # let go rather than terminated, which a worker that
+            # inherited SDL's signal handlers would ignore
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._pool_key = None
+        
+    def compute_index_path(self, start, goal):
+        """ As compute_path, but from cell index to cell index,
+            returning a list of cell indices.
+        """
+        if self.jump_points:
+            return self._jump_point_search(start, goal)
+        
+        adj = self.grid.adjacency()
+        costs = self.grid.cell_costs()
+        width = adj.width
+        offsets_for = adj.offsets_for
+        self._allocate(width * adj.height)
+        
+        self._search += 1
+        search = self._search
+        g_cost = self._g_cost
+        parent = self._parent
+        seen = self._seen
+        closed = self._closed
+        chebyshev = self.heuristic == 'chebyshev'
+        uniform_cost = self.uniform_cost
+        
+        goal_y, goal_x = divmod(goal, width)
+        seen[start] = search
+        g_cost[start] = 0
+        parent[start] = -1
+        open_set = [(self._estimate(start, goal_x, goal_y, width), 0, start)]
+        counter = 1
+        open_peak = 0
+        
+        while open_set:
+            if len(open_set) > open_peak:
+                open_peak = len(open_set)
+            curr = heappop(open_set)[2]
+            if closed[curr] == search:
+                continue
+            if curr == goal:
+                self.open_peak = open_peak
+                return self._reconstruct_path(curr)
+            closed[curr] = search
+            self.expansions += 1
+            
+            curr_g = g_cost[curr]
+            for offset in offsets_for(curr):
+                succ = curr + offset
+                if closed[succ] == search:
+                    continue
+                succ_g = curr_g + costs[succ]
+                if seen[succ] != search or succ_g < g_cost[succ]:
+                    seen[succ] = search
+                    g_cost[succ] = succ_g
+                    parent[succ] = curr
+                    # the heuristic is inlined here, this being the
+                    # innermost loop of every search
+                    y, x = divmod(succ, width)
+                    if chebyshev:
+                        h = max(abs(x - goal_x), abs(y - goal_y)) * uniform_cost
+                    else:
+                        h = sqrt((x - goal_x) ** 2 + (y - goal_y) ** 2)
+                    heappush(open_set, (succ_g + h, counter, succ))
+                    counter += 1
+        
+        self.open_peak = open_peak
+        return []
+        
+    ########################## PRIVATE ##########################
+    
+    def _pool_search(self, pairs, processes):
+        global _pool_finder
+        # built now, so the workers inherit them
+        adj = self.grid.adjacency()
+        key = (self.grid.terrain_version, adj.width, adj.height, processes)
+        if key != self._pool_key:
+            self.close()
+            if self.jump_points:
+                self._open()
+            _pool_finder = self
+            self._pool = multiprocessing.Pool(processes)
+            self._pool_key = key
+        chunk = max(1, len(pairs) // (4 * processes))
+        results = self._pool.map(_pool_search, pairs, chunk)
+        self.expansions += sum(expansions for path, expansions in results)
+        return [path for path, expansions in results]
+        
+    def _allocate(self, size):
+        if size != self._size:
+            self._size = size
+            self._search = 0
+            self._g_cost = [0] * size
+            self._parent = [-1] * size
+            self._seen = [0] * size
+            self._closed = [0] * size
+            
+    def _estimate(self, index, goal_x, goal_y, width):
+        y, x = divmod(index, width)
+        if self.heuristic == 'chebyshev':
+            return max(abs(x - goal_x), abs(y - goal_y)) * self.uniform_cost
+        return sqrt((x - goal_x) ** 2 + (y - goal_y) ** 2)
+    
+    def _reconstruct_path(self, index):
+        parent = self._parent
+        pth = [index]
+        while parent[index] != -1:
+            index = parent[index]
+            pth.append(index)
+        pth.reverse()
+        return pth
+        
+    def _open(self):
+        """ The Jump Point Search view of the terrain, rebuilt when
+            the grid's terrain_version changes:
+            
+            open_cells:
+                one byte per cell, 1 where the cell and all of
+                its neighbours cost uniform_cost to enter.
+            stops:
+                for each straight direction, in the order of
+                STRAIGHT, an array giving for every cell the
+                number of steps to the nearest cell that is not
+                open in that direction, or 0 if there is none
+                before the edge of the map.
+        """
+        adj = self.grid.adjacency()
+        width = adj.width
+        height = adj.height
+        version = (self.grid.terrain_version, width, height)
+        if self._open_version != version:
+            uniform = (np.array(self.grid.cell_costs()) == self.uniform_cost)
+            uniform = uniform.reshape(height, width)
+            padded = np.ones((height + 2, width + 2), dtype=bool)
+            padded[1:-1, 1:-1] = uniform
+            open_cells = uniform.copy()
+            for dy in (0, 1, 2):
+                for dx in (0, 1, 2):
+                    open_cells &= padded[dy:dy + height, dx:dx + width]
+            closed = ~open_cells
+            
+            stops = []
+            for dx, dy in self.STRAIGHT:
+                axis = 0 if dy else 1
+                length = closed.shape[axis]
+                steps = np.arange(length)
+                if axis == 0:
+                    steps = steps[:, None]
+                if dx + dy > 0:
+                    # position of the next closed cell at or beyond
+                    # each cell, then shifted to strictly beyond
+                    pos = np.where(closed, steps, length)
+                    pos = np.flip(np.minimum.accumulate(
+                        np.flip(pos, axis), axis=axis), axis)
+                    beyond = np.full(closed.shape, length)
+                    if axis == 0:
+                        beyond[:-1] = pos[1:]
+                    else:
+                        beyond[:, :-1] = pos[:, 1:]
+                    dist = np.where(beyond == length, 0, beyond - steps)
+                else:
+                    pos = np.where(closed, steps, -1)
+                    pos = np.maximum.accumulate(pos, axis=axis)
+                    beyond = np.full(closed.shape, -1)
+                    if axis == 0:
+                        beyond[1:] = pos[:-1]
+                    else:
+                        beyond[:, 1:] = pos[:, :-1]
+                    dist = np.where(beyond == -1, 0, steps - beyond)
+                stops.append(array('i', dist.astype(np.int32).tobytes()))
+                
+            self._open_cells = (
+                bytearray(open_cells.astype(np.uint8).tobytes()), stops)
+            self._open_version = version
+        return self._open_cells
+        
+    def _jump_point_search(self, start, goal):
+        adj = self.grid.adjacency()
+        costs = self.grid.cell_costs()
+        width = adj.width
+        height = adj.height
+        offsets_for = adj.offsets_for
+        terrain = self._open()
+        open_cells = terrain[0]
+        uniform_cost = self.uniform_cost
+        self._allocate(width * height)
+        
+        self._search += 1
+        search = self._search
+        g_cost = self._g_cost
+        parent = self._parent
+        seen = self._seen
+        closed = self._closed
+        estimate = self._estimate
+        jump = self._jump
+        
+        goal_y, goal_x = divmod(goal, width)
+        seen[start] = search
+        g_cost[start] = 0
+        parent[start] = -1
+        open_set = [(estimate(start, goal_x, goal_y, width), 0, start)]
+        counter = 1
+        open_peak = 0
+        
+        while open_set:
+            if len(open_set) > open_peak:
+                open_peak = len(open_set)
+            curr = heappop(open_set)[2]
+            if closed[curr] == search:
+                continue
+            if curr == goal:
+                self.open_peak = open_peak
+                return self._fill_jumps(self._reconstruct_path(curr), width)
+            closed[curr] = search
+            self.expansions += 1
+            curr_g = g_cost[curr]
+            
+            if open_cells[curr]:
+                # Jump along each direction worth following: all
+                # of them from the start, otherwise only those
+                # that an optimal path through curr can continue in
+                y, x = divmod(curr, width)
+                if parent[curr] == -1:
+                    directions = self.DIRECTIONS
+                else:
+                    py, px = divmod(parent[curr], width)
+                    dx = (x > px) - (x < px)
+                    dy = (y > py) - (y < py)
+                    if dx and dy:
+                        directions = ((dx, dy), (dx, 0), (0, dy))
+                    else:
+                        directions = ((dx, dy),)
+                successors = []
+                for dx, dy in directions:
+                    found = jump(x, y, dx, dy, goal, terrain, width, height)
+                    if found is not None:
+                        successors.append(
+                            (found[0], curr_g + found[1] * uniform_cost))
+            else:
+                # Next to other costs: one step at a time, as A*
+                successors = [(curr + offset, curr_g + costs[curr + offset])
+                              for offset in offsets_for(curr)]
+                
+            for succ, succ_g in successors:
+                if closed[succ] == search:
+                    continue
+                if seen[succ] != search or succ_g < g_cost[succ]:
+                    seen[succ] = search
+                    g_cost[succ] = succ_g
+                    parent[succ] = curr
+                    heappush(open_set, (
+                        succ_g + estimate(succ, goal_x, goal_y, width),
+                        counter,
+                        succ))
+                    counter += 1
+        
+        self.open_peak = open_peak
+        return []
+        
+    DIRECTIONS = ((-1, -1), (-1, 0), (-1, 1), (0, -1),
+                  (0, 1), (1, -1), (1, 0), (1, 1))
+    STRAIGHT = ((1, 0), (-1, 0), (0, 1), (0, -1))
+    
+    def _jump(self, x, y, dx, dy, goal, terrain, width, height):
+        """ Walk from (x, y) in direction (dx, dy) to the next jump
+            point: the goal, a cell that is not open, or (moving
+            diagonally) a cell from which a straight line reaches
+            one of those. Returns (index, steps taken) or None if
+            the walk leaves the map first.
+        """
+        if not (dx and dy):
+            return self._straight(x, y, dx, dy, goal, terrain, width)
+        open_cells = terrain[0]
+        straight = self._straight
+        steps = 0
+        while True:
+            x += dx
+            y += dy
+            steps += 1
+            if not (0 <= x < width and 0 <= y < height):
+                return None
+            index = y * width + x
+            if (index == goal or not open_cells[index]
+                    or straight(x, y, dx, 0, goal, terrain, width)
+                    or straight(x, y, 0, dy, goal, terrain, width)):
+                return index, steps
+                
+    def _straight(self, x, y, dx, dy, goal, terrain, width):
+        """ The first cell that is the goal or not open on a
+            straight line from (x, y), as (index, steps), or None
+            if the line reaches the edge of the map first. Done in
+            constant time using the precomputed stops.
+        """
+        index = y * width + x
+        goal_y, goal_x = divmod(goal, width)
+        if dx:
+            stop = terrain[1][0 if dx > 0 else 1][index]
+            to_goal = (goal_x - x) * dx if goal_y == y else 0
+        else:
+            stop = terrain[1][2 if dy > 0 else 3][index]
+            to_goal = (goal_y - y) * dy if goal_x == x else 0
+        if to_goal > 0 and (not stop or to_goal < stop):
+            stop = to_goal
+        if not stop:
+            return None
+        return index + stop * (dy * width + dx), stop
+                
+    def _fill_jumps(self, jump_path, width):
+        """ Expand a path of jump points into every cell along it.
+        """
+        pth = jump_path[:1]
+        for index in jump_path[1:]:
+            y, x = divmod(index, width)
+            while pth[-1] != index:
+                py, px = divmod(pth[-1], width)
+                step = ((y > py) - (y < py)) * width + (x > px) - (x < px)
+                pth.append(pth[-1] + step)
+        return pth
+
+
 if __name__ == "__main__":
     from gridmap import GridMap          
             
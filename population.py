@@ -0,0 +1,439 @@
+'''
+Structure-of-arrays storage for large numbers of organisms.
+'''
+import numpy as np
+
+
+class Population(object):
+    '''
+    Organisms kept column by column in numpy arrays, one row per
+    organism, and updated a whole column at a time instead of by
+    calling Organism.decide() on each one.
+
+    A tick runs the same branches as Organism.decide(): organisms
+    with negative energy die, those with a path take a step along
+    it, and hungry ones graze where they stand or else pick the
+    nearest food in sight, or failing that a random cell in sight,
+    and plan a path to it. The batch version differs in a few
+    ways:
+
+    - Every organism perceives the vegetation as it was at the
+      start of the tick.
+    - Organisms grazing the same cell eat in row order while the
+      cell lasts. Any left without food wait until the next tick.
+    - Over terrain of uniform cost, paths are built directly as a
+      diagonal run followed by a straight one, which is as cheap as
+      any path A* could find. Elsewhere they come from
+      grid.pathfind_many(). Paths longer than path_width cells are cut
+      short and the organism replans when it reaches the end.
+    - Random choices come from a hash of (seed, tick, row), so the
+      outcome doesn't depend on the order rows are processed in.
+
+    The grid must have been built with veg_arrays=True. Creating a
+    Population attaches it to the grid, and Grid.update() then
+    steps it each tick. Organisms in a Population don't appear in
+    grid.organisms or in Node.occupants; use view(), occupancy()
+    and the columns instead.
+    '''
+    COLUMNS = [
+        ('alive', bool),
+        ('x', np.int32),
+        ('y', np.int32),
+        ('energy', float),
+        ('energy_max', float),
+        ('bitesize', float),
+        ('speed', np.int32),
+        ('sight_range', np.int32),
+        ('eat_threshold', float),
+        ('litter_size', np.int32),
+        ('goal', np.int64),
+        ('path_len', np.int32),
+        ('path_pos', np.int32),
+        ('grazing', bool),
+    ]
+    #the same starting values as Organism
+    DEFAULTS = {
+        'energy': 100.,
+        'energy_max': 100.,
+        'bitesize': 1.,
+        'speed': 1,
+        'sight_range': 2,
+        'eat_threshold': .9,
+        'litter_size': 2,
+    }
+
+    def __init__(self, grid, capacity=1024, path_width=32, seed=None):
+        '''
+        grid:
+            The Grid the organisms live on.
+
+        capacity:
+            Rows to allocate up front; more are added as needed.
+
+        path_width:
+            Longest path, in cells, stored for an organism.
+
+        seed:
+            Seed for the organisms' random choices. Defaults to
+            one drawn from grid.random.
+        '''
+        if grid.veg is None:
+            raise ValueError("Population needs a grid built with "
+                             "veg_arrays=True")
+        self.grid = grid
+        self.path_width = path_width
+        if seed is None:
+            seed = grid.random.getrandbits(63)
+        self.seed = seed
+        self.tick = 0
+        self.size = 0
+        self.capacity = 0
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self.path_cells = np.zeros((0, path_width), dtype=np.int32)
+        self._reserve(capacity)
+        self._terrain = None
+        grid.population = self
+
+    def __len__(self):
+        return int(self.alive[:self.size].sum())
+
+    def add(self, node, **attributes):
+        '''
+        Add an organism on node and return its row. Keyword
+        arguments override the DEFAULTS.
+        '''
+        return self.add_many([node.x], [node.y], **attributes)[0]
+
+    def add_many(self, xs, ys, **attributes):
+        '''
+        Add an organism at each (xs[i], ys[i]) and return their rows.
+        '''
+        count = len(xs)
+        self._reserve(self.size + count)
+        rows = np.arange(self.size, self.size + count)
+        self.size += count
+        values = dict(self.DEFAULTS)
+        values.update(attributes)
+        for name, value in values.items():
+            getattr(self, name)[rows] = value
+        self.alive[rows] = True
+        self.x[rows] = xs
+        self.y[rows] = ys
+        self.goal[rows] = -1
+        self.path_len[rows] = 0
+        self.path_pos[rows] = 0
+        self.grazing[rows] = False
+        return rows
+
+    def give_birth(self, row):
+        '''
+        Organism.give_birth() for the organism in row.
+        '''
+        count = int(self.litter_size[row])
+        return self.add_many([self.x[row]] * count, [self.y[row]] * count)
+
+    def view(self, row):
+        return OrganismView(self, row)
+
+    def views(self):
+        '''
+        An OrganismView for every living organism.
+        '''
+        return [OrganismView(self, row) for row in self.living()]
+
+    def living(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def occupancy(self):
+        '''
+        Number of living organisms on each cell, as an array
+        indexed [y, x] like the vegetation layer.
+        '''
+        height, width = self.grid.veg.amount.shape
+        rows = self.living()
+        cells = self.y[rows].astype(np.int64) * width + self.x[rows]
+        return np.bincount(cells, minlength=width * height).reshape(
+            height, width)
+
+    def compact(self):
+        '''
+        Drop the rows of dead organisms. Living organisms keep
+        their order but get new row numbers.
+        '''
+        rows = self.living()
+        for name, dtype in self.COLUMNS:
+            column = getattr(self, name)
+            column[:len(rows)] = column[rows]
+        self.path_cells[:len(rows)] = self.path_cells[rows]
+        self.size = len(rows)
+
+    def step(self):
+        '''
+        Advance every living organism by one tick.
+        '''
+        rows = self.living()
+        self.act(rows)
+        self.graze(rows)
+        self.tick += 1
+
+    def act(self, rows):
+        '''
+        The first half of a tick for the organisms in rows: dying,
+        moving, and choosing whether to graze or where to go.
+        Reads the vegetation but doesn't change it, and writes only
+        to the given rows.
+        '''
+        dying = self.energy[rows] < 0
+        self.alive[rows[dying]] = False
+        rows = rows[~dying]
+        self.grazing[rows] = False
+
+        has_path = self.path_len[rows] > 0
+        moving = rows[has_path]
+        idle = rows[~has_path]
+        hungry = idle[self.energy[idle] <
+                      self.eat_threshold[idle] * self.energy_max[idle]]
+        here = self.grid.veg.amount[self.y[hungry], self.x[hungry]]
+        can_graze = here >= self.bitesize[hungry]
+        self.grazing[hungry[can_graze]] = True
+
+        self._move(moving)
+        self._forage(hungry[~can_graze])
+
+    def graze(self, rows):
+        '''
+        The second half of a tick: the organisms in rows that chose
+        to graze eat from the cells they stand on. Organisms on the
+        same cell eat in row order for as long as the plants last.
+        '''
+        rows = rows[self.grazing[rows]]
+        if not rows.size:
+            return
+        veg = self.grid.veg
+        width = veg.amount.shape[1]
+        cells = self.y[rows].astype(np.int64) * width + self.x[rows]
+        order = np.lexsort((rows, cells))
+        rows = rows[order]
+        cells = cells[order]
+        bites = self.bitesize[rows]
+
+        #how much earlier organisms on the same cell want to eat
+        eaten = np.cumsum(bites) - bites
+        first = np.ones(len(cells), dtype=bool)
+        first[1:] = cells[1:] != cells[:-1]
+        group_start = np.maximum.accumulate(
+            np.where(first, np.arange(len(cells)), 0))
+        eaten -= eaten[group_start]
+
+        amount = veg.amount.reshape(-1)
+        fed = amount[cells] - eaten >= bites
+        np.subtract.at(amount, cells[fed], bites[fed])
+        self.energy[rows[fed]] += (
+            veg.energy_density.reshape(-1)[cells[fed]] * bites[fed])
+        self.grazing[rows] = False
+
+    ########################## PRIVATE ##########################
+
+    def _reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name, dtype in self.COLUMNS:
+            old = getattr(self, name)
+            column = np.zeros(capacity, dtype=dtype)
+            column[:len(old)] = old
+            setattr(self, name, column)
+        cells = np.zeros((capacity, self.path_width), dtype=np.int32)
+        cells[:len(self.path_cells)] = self.path_cells
+        self.path_cells = cells
+        self.capacity = capacity
+
+    def _costs(self):
+        '''
+        (flat move costs, summed-area table of cells dearer than
+        the cheapest, or None if there are none), rebuilt when the
+        grid's terrain_version changes.
+        '''
+        version = self.grid.terrain_version
+        if self._terrain is None or self._terrain[0] != version:
+            height, width = self.grid.veg.amount.shape
+            costs = np.array(self.grid.cell_costs(), dtype=float)
+            dear = (costs > costs.min()).reshape(height, width)
+            table = None
+            if dear.any():
+                table = np.zeros((height + 1, width + 1), dtype=np.int32)
+                table[1:, 1:] = dear.cumsum(0).cumsum(1)
+            self._terrain = (version, costs, table)
+        return self._terrain[1:]
+
+    def _move(self, rows):
+        '''
+        Organism.move() for each row: up to speed steps along the
+        stored path, stopping once at the goal.
+        '''
+        if not rows.size:
+            return
+        costs = self._costs()[0]
+        width = self.grid.veg.amount.shape[1]
+        for step in range(int(self.speed[rows].max())):
+            active = rows[(self.speed[rows] > step) & (self.path_len[rows] > 0)]
+            cells = self.y[active].astype(np.int64) * width + self.x[active]
+            done = ((cells == self.goal[active]) |
+                    (self.path_pos[active] >= self.path_len[active]))
+            self.path_len[active[done]] = 0
+            self.goal[active[done]] = -1
+            going = active[~done]
+            dest = self.path_cells[going, self.path_pos[going]]
+            self.path_pos[going] += 1
+            self.energy[going] -= costs[dest]
+            self.y[going] = dest // width
+            self.x[going] = dest % width
+
+    def _forage(self, rows):
+        '''
+        Organism.forage(), falling back on wander(), for each row.
+        '''
+        if not rows.size:
+            return
+        veg = self.grid.veg
+        goals = np.empty(len(rows), dtype=np.int64)
+        sight = self.sight_range[rows]
+        for sight_range in np.unique(sight):
+            members = np.flatnonzero(sight == sight_range)
+            goals[members] = veg.nearest_food(
+                self.x[rows[members]], self.y[rows[members]], sight_range)
+        lost = goals < 0
+        if lost.any():
+            goals[lost] = self._wander_targets(rows[lost])
+        self._set_paths(rows, goals)
+
+    def _wander_targets(self, rows):
+        '''
+        A random cell within sight of each row, every cell of the
+        clipped sight square equally likely, as Organism.wander().
+        '''
+        height, width = self.grid.veg.amount.shape
+        x, y, sight = self.x[rows], self.y[rows], self.sight_range[rows]
+        x0 = np.maximum(x - sight, 0)
+        x1 = np.minimum(x + sight + 1, width)
+        y0 = np.maximum(y - sight, 0)
+        y1 = np.minimum(y + sight + 1, height)
+        tall = y1 - y0
+        pick = (self._random(rows) * (x1 - x0) * tall).astype(np.int64)
+        return (y0 + pick % tall) * width + x0 + pick // tall
+
+    def _random(self, rows):
+        '''
+        A uniform float in [0, 1) for each row, from a hash of
+        (seed, tick, row) (the splitmix64 finaliser).
+        '''
+        z = rows.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        z += np.uint64((self.seed * 0x100000001B3 + self.tick) %
+                       (1 << 64))
+        z ^= z >> np.uint64(30)
+        z *= np.uint64(0xBF58476D1CE4E5B9)
+        z ^= z >> np.uint64(27)
+        z *= np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+        return (z >> np.uint64(11)).astype(float) / float(1 << 53)
+
+    def _set_paths(self, rows, goals):
+        height, width = self.grid.veg.amount.shape
+        costs, table = self._costs()
+        goal_x = goals % width
+        goal_y = goals // width
+        start_x = self.x[rows].astype(np.int64)
+        start_y = self.y[rows].astype(np.int64)
+
+        if table is None:
+            direct = np.ones(len(rows), dtype=bool)
+        else:
+            #no dear cells in the box spanned by start and goal
+            x0 = np.minimum(start_x, goal_x)
+            x1 = np.maximum(start_x, goal_x) + 1
+            y0 = np.minimum(start_y, goal_y)
+            y1 = np.maximum(start_y, goal_y) + 1
+            direct = (table[y1, x1] - table[y0, x1] -
+                      table[y1, x0] + table[y0, x0]) == 0
+
+        d = np.flatnonzero(direct)
+        if d.size:
+            dx = goal_x[d] - start_x[d]
+            dy = goal_y[d] - start_y[d]
+            steps = np.minimum(np.arange(self.path_width)[None, :],
+                               np.maximum(abs(dx), abs(dy))[:, None])
+            px = start_x[d, None] + np.sign(dx)[:, None] * np.minimum(
+                steps, abs(dx)[:, None])
+            py = start_y[d, None] + np.sign(dy)[:, None] * np.minimum(
+                steps, abs(dy)[:, None])
+            self.path_cells[rows[d]] = py * width + px
+            self.path_len[rows[d]] = np.minimum(
+                np.maximum(abs(dx), abs(dy)) + 1, self.path_width)
+
+        cells = self.grid.cells()
+        planned = np.flatnonzero(~direct)
+        paths = self.grid.pathfind_many(
+            [(cells[start_y[i] * width + start_x[i]], cells[goals[i]])
+             for i in planned])
+        for i, path in zip(planned, paths):
+            path = [node.y * width + node.x for node in path]
+            path = path[:self.path_width] or [goals[i]]
+            self.path_cells[rows[i], :len(path)] = path
+            self.path_len[rows[i]] = len(path)
+
+        self.path_pos[rows] = 0
+        #a path cut short ends at its last stored cell
+        self.goal[rows] = self.path_cells[rows, self.path_len[rows] - 1]
+
+
+def _column_property(name):
+    def get(self):
+        return getattr(self.population, name)[self.row].item()
+    def set(self, value):
+        getattr(self.population, name)[self.row] = value
+    return property(get, set)
+
+
+class OrganismView(object):
+    '''
+    One row of a Population, with the attribute names of an
+    Organism.
+    '''
+    def __init__(self, population, row):
+        self.population = population
+        self.row = row
+        self.grid = population.grid
+
+    alive = _column_property('alive')
+    energy = _column_property('energy')
+    energy_max = _column_property('energy_max')
+    bitesize = _column_property('bitesize')
+    speed = _column_property('speed')
+    sight_range = _column_property('sight_range')
+    eat_threshold = _column_property('eat_threshold')
+    litter_size = _column_property('litter_size')
+
+    @property
+    def location(self):
+        pop = self.population
+        return self.grid.get_node(pop.x[self.row], pop.y[self.row])
+
+    @property
+    def goal(self):
+        goal = self.population.goal[self.row]
+        if goal < 0:
+            return False
+        return self.grid.cell(goal)
+
+    @property
+    def path(self):
+        '''
+        The nodes still to be visited, or False if there is no path.
+        '''
+        pop = self.population
+        if not pop.path_len[self.row]:
+            return False
+        cells = pop.path_cells[self.row,
+                               pop.path_pos[self.row]:pop.path_len[self.row]]
+        return [self.grid.cell(cell) for cell in cells]
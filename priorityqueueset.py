@@ -83,6 +83,98 @@ class PriorityQueueSet(object):
                     return True
         
         return False
+
+
+class IndexedPriorityQueueSet(object):
+    """ Same interface and item requirements as PriorityQueueSet,
+        but the heap is maintained by hand alongside a map from
+        each item to its current position in it.
+        
+        Knowing the position means that when an existing item
+        gets a better priority it can be replaced in place and
+        sifted up, so every operation is O(log N), including the
+        priority update that costs O(N) in PriorityQueueSet.
+    """
+    def __init__(self):
+        """ Create a new IndexedPriorityQueueSet
+        """
+        self.heap = []
+        self.position = {}
+    
+    def __len__(self):
+        return len(self.heap)
+    
+    def has_item(self, item):
+        """ Check if *item* exists in the queue
+        """
+        return item in self.position
+    
+    def pop_smallest(self):
+        """ Remove and return the smallest item from the queue.
+            IndexError will be thrown if the queue is empty.
+        """
+        heap = self.heap
+        smallest = heap[0]
+        last = heap.pop()
+        del self.position[smallest]
+        if heap:
+            heap[0] = last
+            self._sift_down(0)
+        return smallest
+    
+    def add(self, item):
+        """ Add *item* to the queue, or update the priority of the
+            equal item already in it if *item*'s is better. See
+            PriorityQueueSet.add.
+        
+            Returns True iff the item was added or updated.
+        """
+        pos = self.position.get(item)
+        if pos is None:
+            self.heap.append(item)
+            self._sift_up(len(self.heap) - 1)
+            return True
+        elif item < self.heap[pos]:
+            self.heap[pos] = item
+            self._sift_up(pos)
+            return True
+        
+        return False
+    
+    def _sift_up(self, pos):
+        heap = self.heap
+        position = self.position
+        item = heap[pos]
+        while pos > 0:
+            parent_pos = (pos - 1) >> 1
+            parent = heap[parent_pos]
+            if not item < parent:
+                break
+            heap[pos] = parent
+            position[parent] = pos
+            pos = parent_pos
+        heap[pos] = item
+        position[item] = pos
+    
+    def _sift_down(self, pos):
+        heap = self.heap
+        position = self.position
+        end = len(heap)
+        item = heap[pos]
+        child_pos = 2 * pos + 1
+        while child_pos < end:
+            right_pos = child_pos + 1
+            if right_pos < end and heap[right_pos] < heap[child_pos]:
+                child_pos = right_pos
+            child = heap[child_pos]
+            if not child < item:
+                break
+            heap[pos] = child
+            position[child] = pos
+            pos = child_pos
+            child_pos = 2 * pos + 1
+        heap[pos] = item
+        position[item] = pos
         
 
 if __name__ == "__main__":
@@ -90,12 +182,14 @@ if __name__ == "__main__":
     
     #-------------------------------------------------------------
     class TestPriorityQueueSet(unittest.TestCase):
+        queue_class = PriorityQueueSet
+        
         def test_ints(self):
             # Since the int's priority is always its value, here
             # we won't test insertion of existing items with lower
             # priorities
             #
-            pqs = PriorityQueueSet()
+            pqs = self.queue_class()
             for k in [3, 5, 2, 2, 99, 23]:
                 pqs.add(k)
             
@@ -148,7 +242,7 @@ if __name__ == "__main__":
                 def __repr__(self):
                     return "^%s&%s^" % (self.value, self.cost)
         
-            pqs = PriorityQueueSet()
+            pqs = self.queue_class()
             pqs.add(Node('five', 5))
             pqs.add(Node('one', 1))
             pqs.add(Node('eight', 8))
@@ -202,6 +296,43 @@ if __name__ == "__main__":
             self.assertEqual(pqs.pop_smallest(), Node('five', 4))
             self.assertRaises(IndexError, pqs.pop_smallest)
             self.assertEqual(len(pqs), 0)
+
+    #-------------------------------------------------------------
+    class TestIndexedPriorityQueueSet(TestPriorityQueueSet):
+        queue_class = IndexedPriorityQueueSet
+        
+        def test_many_updates(self):
+            import random
+            rand = random.Random(1)
+            best = {}
+            pqs = self.queue_class()
+            for i in range(2000):
+                value = rand.randrange(200)
+                cost = rand.randrange(1000)
+                pqs.add(_Item(value, cost))
+                best[value] = min(cost, best.get(value, cost))
+            self.assertEqual(len(pqs), len(best))
+            
+            popped = []
+            while len(pqs):
+                item = pqs.pop_smallest()
+                self.assert_(not pqs.has_item(item))
+                popped.append((item.cost, item.value))
+            self.assertEqual(popped, sorted((c, v) for v, c in best.items()))
+    
+    class _Item(object):
+        def __init__(self, value, cost):
+            self.value = value
+            self.cost = cost
+        
+        def __eq__(self, other):
+            return self.value == other.value
+        
+        def __cmp__(self, other):
+            return cmp((self.cost, self.value), (other.cost, other.value))
+        
+        def __hash__(self):
+            return hash(self.value)
     #-------------------------------------------------------------
     
     unittest.main()
@@ -0,0 +1,338 @@
+'''
+Opt-in recording of what every organism does, for analysis after
+a run.
+
+    rec = Recorder('run.rec')
+    with rec:
+        for i in range(1000):
+            grid.update()
+
+    for tick, events in read_ticks('run.rec'):
+        moves = events[events['event'] == MOVE]
+
+Events go into a preallocated numpy record array and are written
+out a chunk at a time, zlib compressed, to a file that is only
+ever appended to. read_chunks() and read_ticks() stream the file
+back one chunk at a time, however big it has grown.
+'''
+import os
+import struct
+import zlib
+import numpy as np
+import lifesim
+import population
+
+MAGIC = 'LIFEREC\0'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sI')
+#compressed length and number of records of a chunk
+CHUNK = struct.Struct('<II')
+
+MOVE, GRAZE, BIRTH, DEATH = range(4)
+EVENT_NAMES = ['move', 'graze', 'birth', 'death']
+
+#one fixed-width record per event
+EVENT = np.dtype([
+    ('tick', '<u4'),
+    ('event', 'u1'),
+    #True for organisms in a Population, whose ids are row numbers
+    ('population', '?'),
+    ('id', '<i8'),
+    ('x', '<i4'),
+    ('y', '<i4'),
+    #energy after a move and at death, the bite taken when grazing
+    ('value', '<f4'),
+    #the parent's id for a birth, otherwise -1
+    ('parent', '<i8'),
+])
+
+
+class Recorder(object):
+    '''
+    Records moves, grazes, births and deaths of both Organisms and
+    the rows of a population.Population, one EVENT record each.
+
+    Like instrument.Profiler, enable() wraps the methods that make
+    these happen in place on their classes and disable() puts the
+    originals back, so nothing is recorded, and nothing slowed
+    down, unless a recorder is enabled. Only one recorder can be
+    enabled at a time.
+
+    A move is recorded once per call of move(), where the organism
+    ended up. Organisms get ids in the order they're first
+    recorded; a Population's organisms are recorded by row, which
+    compact() changes. Ticks are counted by Grid.update(), from
+    tick. A Population stepped by an engine.Engine acts in worker
+    processes and isn't recorded.
+    '''
+    active = None
+
+    def __init__(self, path, chunk_size=1 << 16, level=6, tick=0):
+        '''
+        path:
+            File to append to; created, with a header, if it
+            doesn't exist.
+
+        chunk_size:
+            Events buffered before a chunk is compressed and
+            written.
+
+        level:
+            zlib compression level.
+        '''
+        self.path = path
+        self.level = level
+        self.tick = tick
+        self.buffer = np.zeros(chunk_size, dtype=EVENT)
+        self.count = 0
+        self.written = 0
+        self.ids = {}
+        self.next_id = 0
+        self.out = None
+        self._originals = []
+
+    def enable(self):
+        if Recorder.active is not None:
+            raise RuntimeError("another Recorder is already enabled")
+        if self.out is None:
+            self.out = _open(self.path)
+        Recorder.active = self
+        wrappers = [
+            (lifesim.Grid, 'update', self._update),
+            (lifesim.Organism, 'move', self._move),
+            (lifesim.Organism, 'graze', self._graze),
+            (lifesim.Organism, 'give_birth', self._give_birth),
+            (lifesim.Organism, 'die', self._die),
+            (population.Population, 'act', self._act),
+            (population.Population, 'graze', self._pop_graze),
+            (population.Population, 'give_birth', self._pop_give_birth),
+        ]
+        for cls, name, make in wrappers:
+            method = cls.__dict__[name]
+            wrapper = make(method)
+            wrapper.__name__ = method.__name__
+            wrapper.__doc__ = method.__doc__
+            self._originals.append((cls, name, method))
+            setattr(cls, name, wrapper)
+
+    def disable(self):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        if Recorder.active is self:
+            Recorder.active = None
+        self.flush()
+
+    def close(self):
+        self.disable()
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def flush(self):
+        '''
+        Write out the buffered events as one chunk.
+        '''
+        if not self.count or self.out is None:
+            return
+        data = zlib.compress(self.buffer[:self.count].tostring(), self.level)
+        self.out.write(CHUNK.pack(len(data), self.count))
+        self.out.write(data)
+        self.out.flush()
+        self.written += self.count
+        self.count = 0
+
+    def record(self, event, org, value=0., parent=-1):
+        '''
+        Record one event for the Organism org.
+        '''
+        if self.count == len(self.buffer):
+            self.flush()
+        node = org.location
+        self.buffer[self.count] = (self.tick, event, False, self.id(org),
+                                   node.x, node.y, value, parent)
+        self.count += 1
+
+    def record_rows(self, event, pop, rows, values, parents=-1):
+        '''
+        Record an event for each of the given rows of pop.
+        '''
+        start = 0
+        while start < len(rows):
+            if self.count == len(self.buffer):
+                self.flush()
+            end = min(len(rows), start + len(self.buffer) - self.count)
+            part = rows[start:end]
+            out = self.buffer[self.count:self.count + len(part)]
+            out['tick'] = self.tick
+            out['event'] = event
+            out['population'] = True
+            out['id'] = part
+            out['x'] = pop.x[part]
+            out['y'] = pop.y[part]
+            out['value'] = values[start:end]
+            out['parent'] = (parents if np.isscalar(parents)
+                             else parents[start:end])
+            self.count += len(part)
+            start = end
+
+    def id(self, org):
+        '''
+        The id events for org are recorded under.
+        '''
+        ids = self.ids
+        if org not in ids:
+            ids[org] = self.next_id
+            self.next_id += 1
+        return ids[org]
+
+    ########################## PRIVATE ##########################
+
+    def _update(self, method):
+        recorder = self
+        def wrapper(grid):
+            try:
+                return method(grid)
+            finally:
+                recorder.tick += 1
+        return wrapper
+
+    def _move(self, method):
+        recorder = self
+        def wrapper(org):
+            before = org.location
+            method(org)
+            if org.location is not before:
+                recorder.record(MOVE, org, org.energy)
+        return wrapper
+
+    def _graze(self, method):
+        recorder = self
+        def wrapper(org):
+            method(org)
+            recorder.record(GRAZE, org, org.bitesize)
+        return wrapper
+
+    def _give_birth(self, method):
+        recorder = self
+        def wrapper(org):
+            organisms = org.grid.organisms
+            before = len(organisms)
+            method(org)
+            parent = recorder.id(org)
+            for child in organisms[before:]:
+                recorder.record(BIRTH, child, parent=parent)
+        return wrapper
+
+    def _die(self, method):
+        recorder = self
+        def wrapper(org):
+            if org.location is not None:
+                recorder.record(DEATH, org, org.energy)
+            recorder.ids.pop(org, None)
+            method(org)
+        return wrapper
+
+    def _act(self, method):
+        recorder = self
+        def wrapper(pop, rows):
+            dying = rows[pop.energy[rows] < 0]
+            rest = rows[pop.energy[rows] >= 0]
+            moving = rest[pop.path_len[rest] > 0]
+            xs, ys = pop.x[moving], pop.y[moving]
+            recorder.record_rows(DEATH, pop, dying, pop.energy[dying])
+            method(pop, rows)
+            moved = moving[(pop.x[moving] != xs) | (pop.y[moving] != ys)]
+            recorder.record_rows(MOVE, pop, moved, pop.energy[moved])
+        return wrapper
+
+    def _pop_graze(self, method):
+        recorder = self
+        def wrapper(pop, rows):
+            grazing = rows[pop.grazing[rows]]
+            before = pop.energy[grazing]
+            method(pop, rows)
+            fed = grazing[pop.energy[grazing] != before]
+            recorder.record_rows(GRAZE, pop, fed, pop.bitesize[fed])
+        return wrapper
+
+    def _pop_give_birth(self, method):
+        recorder = self
+        def wrapper(pop, row):
+            rows = method(pop, row)
+            recorder.record_rows(BIRTH, pop, rows, np.zeros(len(rows)), row)
+            return rows
+        return wrapper
+
+
+def read_chunks(path):
+    '''
+    The events in the file at path, one record array per chunk.
+    '''
+    with open(path, 'rb') as f:
+        _check_header(f, path)
+        while True:
+            head = f.read(CHUNK.size)
+            if not head:
+                return
+            if len(head) < CHUNK.size:
+                raise ValueError("%s ends in a partial chunk" % path)
+            length, count = CHUNK.unpack(head)
+            data = zlib.decompress(f.read(length))
+            events = np.frombuffer(data, dtype=EVENT)
+            if len(events) != count:
+                raise ValueError("%s has a damaged chunk" % path)
+            yield events
+
+
+def read_ticks(path):
+    '''
+    (tick, events) for every tick in the file at path that has any
+    events, in order, reading a chunk at a time.
+    '''
+    carry = None
+    for events in read_chunks(path):
+        if carry is not None:
+            events = np.concatenate([carry, events])
+        ticks = events['tick']
+        starts = np.flatnonzero(ticks[1:] != ticks[:-1]) + 1
+        bounds = [0] + starts.tolist()
+        #the last tick may go on in the next chunk
+        for start, end in zip(bounds, bounds[1:]):
+            yield int(ticks[start]), events[start:end]
+        carry = events[bounds[-1]:]
+    if carry is not None and len(carry):
+        yield int(carry['tick'][0]), carry
+
+
+########################## PRIVATE ##########################
+
+def _open(path):
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    if not new:
+        with open(path, 'rb') as f:
+            _check_header(f, path)
+    out = open(path, 'ab')
+    if new:
+        out.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        out.flush()
+    return out
+
+
+def _check_header(f, path):
+    head = f.read(HEADER.size)
+    if len(head) < HEADER.size:
+        raise ValueError("%s is not a lifesim recording" % path)
+    magic, version = HEADER.unpack(head)
+    if magic != MAGIC:
+        raise ValueError("%s is not a lifesim recording" % path)
+    if version != FORMAT_VERSION:
+        raise ValueError("%s is recording format version %s, expected %s"
+                         % (path, version, FORMAT_VERSION))
@@ -0,0 +1,112 @@
+from nose.tools import *
+import os
+import tempfile
+import numpy as np
+import checkpoint
+import lifesim as ls
+from population import Population
+
+
+def build_world(seed=0):
+    grid = ls.Grid(15, 12, seed=seed)
+    for row in grid.nodes:
+        for node in row:
+            node.set_plants(grid.random.choice([0, 0, 4]), 1, 10)
+    grid.get_node(7, 7).move_cost = 6
+    for i in range(12):
+        o = ls.Organism(grid)
+        o.energy = 60
+        o.set_location(grid.random.choice(grid.cells()))
+    return grid
+
+
+def build_population_world(seed=0):
+    grid = ls.Grid(20, 16, veg_arrays=True, seed=seed)
+    grid.veg.fill(0, 1, 10)
+    for i in range(60):
+        grid.veg.set(grid.random.randrange(20), grid.random.randrange(16),
+                     5, 1, 10)
+    grid.veg.growth_rate = .1
+    grid.veg.diffusion_rate = .1
+    grid.get_node(3, 3).move_cost = 4
+    Population(grid, seed=seed).add_many(
+        [grid.random.randrange(20) for i in range(50)],
+        [grid.random.randrange(16) for i in range(50)], energy=60.)
+    return grid
+
+
+def state(grid):
+    orgs = [(o.location.x, o.location.y, o.energy, o.goal and o.goal.x)
+            for o in grid.organisms]
+    plants = [node.plants.amount for node in grid.cells()]
+    return orgs, plants
+
+
+class TestCheckpoint(object):
+    def setup(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'world.ckpt')
+
+    def test_objects_resume(self):
+        grid = build_world()
+        for i in range(5):
+            grid.update()
+        checkpoint.save(grid, self.path)
+        resumed = checkpoint.load(self.path)
+        eq_(state(resumed), state(grid))
+        eq_(resumed.get_node(7, 7).move_cost, 6)
+        eq_(resumed.cell_costs(), grid.cell_costs())
+        for i in range(10):
+            grid.update()
+            resumed.update()
+        eq_(state(resumed), state(grid))
+
+    def test_save_keeps_paths(self):
+        grid = build_world()
+        o = grid.organisms[0]
+        o.goal = grid.get_node(14, 11)
+        o.path = o.pathfind(o.goal)
+        checkpoint.save(grid, self.path)
+        ok_(o.path.next() is o.location)
+        resumed = checkpoint.load(self.path, mmap=False)
+        path = list(resumed.organisms[0].path)
+        eq_(path[0], resumed.organisms[0].location)
+        eq_(path[-1], resumed.get_node(14, 11))
+
+    def test_population_resume(self):
+        grid = build_population_world()
+        for i in range(5):
+            grid.update()
+        checkpoint.save(grid, self.path)
+        resumed = checkpoint.load(self.path)
+        ok_(isinstance(resumed.veg.amount, np.memmap))
+        for i in range(10):
+            grid.update()
+            resumed.update()
+        a, b = grid.population, resumed.population
+        eq_(a.tick, b.tick)
+        for name, dtype in a.COLUMNS:
+            ok_(np.array_equal(getattr(a, name)[:a.size],
+                               getattr(b, name)[:b.size]), name)
+        ok_(np.array_equal(grid.veg.amount, resumed.veg.amount))
+        #more organisms than the mapped columns hold
+        b.add_many([1, 2], [1, 2])
+        eq_(b.size, a.size + 2)
+
+    def test_file_unchanged(self):
+        grid = build_population_world()
+        checkpoint.save(grid, self.path)
+        with open(self.path, 'rb') as f:
+            before = f.read()
+        resumed = checkpoint.load(self.path)
+        for i in range(3):
+            resumed.update()
+        with open(self.path, 'rb') as f:
+            eq_(f.read(), before)
+
+    def test_bad_files(self):
+        with open(self.path, 'wb') as f:
+            f.write('not a checkpoint at all')
+        assert_raises(ValueError, checkpoint.load, self.path)
+        with open(self.path, 'wb') as f:
+            f.write(checkpoint.HEADER.pack(checkpoint.MAGIC, 99, 0))
+        assert_raises(ValueError, checkpoint.load, self.path)
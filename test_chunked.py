@@ -0,0 +1,95 @@
+from nose.tools import *
+import lifesim as ls
+import pathfinder
+from chunked import ChunkedGrid, UNBOUNDED
+
+
+def populate(grid, width, height):
+    rand = grid.random
+    for y in range(height):
+        for x in range(width):
+            grid.get_node(x, y).set_plants(rand.choice([0, 0, 5]), 1, 10)
+    grid.get_node(4, 4).move_cost = 3
+    for i in range(15):
+        o = ls.Organism(grid)
+        o.energy = 50
+        o.set_location(grid.get_node(rand.randrange(width),
+                                     rand.randrange(height)))
+
+
+def state(grid):
+    return [(o.location.x, o.location.y, o.energy) for o in grid.organisms]
+
+
+class TestChunkedGrid(object):
+    def test_lazy(self):
+        grid = ChunkedGrid(1000, 1000, chunk_size=10)
+        eq_(grid.chunks_built, 0)
+        node = grid.get_node(15, 25)
+        eq_((node.x, node.y), (15, 25))
+        eq_(grid.chunks_built, 1)
+        ok_(grid.nodes[25][15] is node)
+        eq_((len(grid.nodes), len(grid.nodes[0])), (1000, 1000))
+        grid.neighbors(grid.get_node(10, 20))
+        eq_(sorted(grid.chunks), [(0, 1), (0, 2), (1, 1), (1, 2)])
+        assert_raises(IndexError, grid.get_node, 1000, 0)
+        assert_raises(ValueError, ChunkedGrid, 10, 10, veg_arrays=True)
+
+    def test_neighbors_match_grid(self):
+        grid = ls.Grid(12, 9)
+        chunked = ChunkedGrid(12, 9, chunk_size=4)
+        for node in grid.cells():
+            eq_([(n.x, n.y) for n in grid.neighbors(node)],
+                [(n.x, n.y) for n in
+                 chunked.neighbors(chunked.get_node(node.x, node.y))])
+
+    def test_matches_grid(self):
+        grid = ls.Grid(20, 15, seed=5)
+        grid.use_pathfinder(pathfinder.PathFinder(grid.neighbors,
+                                                  grid.move_cost, grid.dist))
+        chunked = ChunkedGrid(20, 15, chunk_size=8, seed=5)
+        for world in [grid, chunked]:
+            populate(world, 20, 15)
+            for i in range(15):
+                world.update()
+        eq_(state(chunked), state(grid))
+
+    def test_evict(self):
+        grid = ChunkedGrid(100, 100, chunk_size=10, plants=(0, 1, 10))
+        for x in range(0, 100, 10):
+            grid.get_node(x, 0)
+        grid.get_node(20, 0).move_cost = 4
+        grid.get_node(30, 0).plants.amount = 3
+        ls.Organism(grid).set_location(grid.get_node(40, 0))
+        #chunks asked for since the last evict stay
+        eq_(grid.evict(), 0)
+        eq_(grid.evict(), 7)
+        eq_(sorted(grid.chunks), [(2, 0), (3, 0), (4, 0)])
+        node = grid.get_node(0, 0)
+        eq_((node.move_cost, node.plants.amount), (1, 0))
+        eq_(grid.chunks_built, 11)
+
+    def test_evict_whole_map(self):
+        grid = ChunkedGrid(40, 40, chunk_size=10)
+        grid.cells()
+        eq_(grid.evict(), 0)
+        eq_(grid.evict(), 16)
+        node = grid.get_node(5, 5)
+        node.move_cost = 7
+        ok_(grid.cell(grid.cell_index(node)) is node)
+        eq_(grid.cell_costs()[grid.cell_index(node)], 7)
+
+    def test_unbounded(self):
+        grid = ChunkedGrid(plants=(0, 1, 10), seed=1)
+        middle = UNBOUNDED // 2
+        for i in range(10):
+            grid.get_node(middle + 3 * i, middle + 2).set_plants(5, 1, 10)
+            o = ls.Organism(grid)
+            o.energy = 50
+            o.set_location(grid.get_node(middle + 3 * i, middle))
+        for i in range(20):
+            grid.update()
+        ok_(grid.chunks_built < 30)
+        ok_(all(grid.get_node(middle + 3 * i, middle + 2).plants.amount < 5
+                for i in range(10)))
+        assert_raises(ValueError, grid.cells)
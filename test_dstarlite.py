@@ -0,0 +1,139 @@
+from nose.tools import *
+import lifesim as ls
+from dstarlite import DStarLite, ReplanningPathFinder, INF
+from pathfinder import GridPathFinder
+
+
+def rough_grid(seed=0):
+    grid = ls.Grid(30, 25, seed=seed)
+    for node in grid.cells():
+        node.set_plants(0, 1, 10)
+        if grid.random.random() < .3:
+            node.move_cost = grid.random.choice([2, 4, 8])
+    return grid
+
+
+def astar_cost(grid, start, goal):
+    finder = GridPathFinder(grid, heuristic='chebyshev')
+    path = list(finder.compute_path(start, goal))
+    if not path:
+        return INF
+    return sum(node.move_cost for node in path[1:])
+
+
+def random_node(grid):
+    adj = grid.adjacency()
+    return grid.get_node(grid.random.randrange(adj.width),
+                         grid.random.randrange(adj.height))
+
+
+class TestDStarLite(object):
+    def test_matches_astar(self):
+        grid = rough_grid()
+        for i in range(20):
+            start, goal = random_node(grid), random_node(grid)
+            planner = DStarLite(grid, start, [goal])
+            eq_(planner.cost(), astar_cost(grid, start, goal))
+            path = [grid.cell(cell) for cell in planner.path()]
+            eq_((path[0], path[-1]), (start, goal))
+            eq_(sum(node.move_cost for node in path[1:]), planner.cost())
+
+    def test_repairs_terrain(self):
+        grid = rough_grid(1)
+        start, goal = grid.get_node(0, 0), grid.get_node(29, 24)
+        planner = DStarLite(grid, start, [goal])
+        rand = grid.random
+        for i in range(15):
+            planner.move_to(planner.next_step())
+            for j in range(5):
+                random_node(grid).move_cost = rand.choice([1, 3, 9])
+            planner.sync()
+            eq_(planner.cost(),
+                astar_cost(grid, grid.cell(planner.start), goal))
+        eq_(planner.repairs, 15)
+        eq_(planner.rebuilds, 0)
+        ok_(planner.expansions > planner.initial_expansions)
+
+    def test_cheaper_terrain_rebuilds(self):
+        grid = rough_grid()
+        for node in grid.cells():
+            node.move_cost = max(node.move_cost, 2)
+        start, goal = grid.get_node(2, 2), grid.get_node(20, 20)
+        planner = DStarLite(grid, start, [goal])
+        grid.get_node(10, 10).move_cost = 1
+        planner.sync()
+        eq_(planner.rebuilds, 1)
+        eq_(planner.cost(), astar_cost(grid, start, goal))
+
+    def test_goals(self):
+        grid = rough_grid(2)
+        start = grid.get_node(15, 12)
+        goals = [grid.get_node(17, 12), grid.get_node(5, 5),
+                 grid.get_node(28, 2)]
+        planner = DStarLite(grid, start, goals)
+        eq_(planner.cost(),
+            min(astar_cost(grid, start, goal) for goal in goals))
+        planner.remove_goal(grid.cell_index(goals[0]))
+        planner.sync()
+        eq_(planner.cost(),
+            min(astar_cost(grid, start, goal) for goal in goals[1:]))
+        planner.add_goal(grid.cell_index(goals[0]))
+        planner.sync()
+        eq_(planner.cost(), astar_cost(grid, start, goals[0]))
+
+
+class TestReplanningPath(object):
+    def test_walk(self):
+        grid = rough_grid(3)
+        finder = ReplanningPathFinder(grid)
+        start, goal = grid.get_node(0, 12), grid.get_node(29, 12)
+        path = finder.compute_path(start, goal)
+        walked = [path.next()]
+        eq_(walked[0], start)
+        for node in path:
+            ok_(node in grid.neighbors(walked[-1]))
+            walked.append(node)
+            #wall off the cell ahead on the straight line
+            ahead = grid.get_node(min(node.x + 2, 28), 12)
+            ahead.move_cost = 50
+        eq_(walked[-1], goal)
+        ok_(finder.repairs > 0)
+        eq_(finder.plans, 1)
+
+    def test_food_eaten(self):
+        grid = rough_grid()
+        for node in grid.cells():
+            node.move_cost = 1
+        near, far = grid.get_node(8, 5), grid.get_node(5, 12)
+        near.set_plants(5, 1, 10)
+        far.set_plants(5, 1, 10)
+        path = ReplanningPathFinder(grid).food_path(grid.get_node(5, 5),
+                                                    [near, far])
+        eq_(path.goal, near)
+        path.next()
+        path.next()
+        near.set_plants(0, 1, 10)
+        walked = list(path)
+        eq_(walked[-1], far)
+        far.set_plants(0, 1, 10)
+        eq_(list(ReplanningPathFinder(grid).food_path(
+            grid.get_node(5, 5), [far])), [])
+
+    def test_organisms(self):
+        grid = ls.Grid(25, 25, seed=4)
+        for node in grid.cells():
+            node.set_plants(grid.random.choice([0, 0, 0, 5]), 1, 10)
+        finder = ReplanningPathFinder(grid)
+        grid.use_pathfinder(finder)
+        for i in range(20):
+            o = ls.Organism(grid)
+            o.energy = 50
+            o.sight_range = 4
+            o.set_location(random_node(grid))
+        for i in range(25):
+            grid.update()
+            random_node(grid).move_cost = 5
+        ok_(finder.plans > 0)
+        ok_(finder.repairs > 0)
+        eq_(len(grid.path_cache), 0)
+        ok_(any(o.energy > 50 for o in grid.organisms))
@@ -0,0 +1,112 @@
+from nose.tools import *
+from random import Random
+import numpy as np
+import lifesim as ls
+from engine import Engine
+from population import Population
+from flowfield import FoodField
+from pathfinder import GridPathFinder
+
+
+def build_world(seed=0):
+    '''
+    A 30x24 map with patchy food, a rough patch, regrowth and
+    diffusion, and 300 organisms.
+    '''
+    rand = Random(seed)
+    grid = ls.Grid(30, 24, veg_arrays=True)
+    grid.veg.fill(0, 1, 10)
+    for i in range(150):
+        grid.veg.set(rand.randrange(30), rand.randrange(24), 3, 1, 10)
+    grid.veg.growth_rate = .1
+    grid.veg.decay_rate = .01
+    grid.veg.diffusion_rate = .2
+    for x in range(10, 14):
+        for y in range(5, 15):
+            grid.get_node(x, y).move_cost = 4
+    pop = Population(grid, capacity=300, seed=seed)
+    pop.add_many([rand.randrange(30) for i in range(300)],
+                 [rand.randrange(24) for i in range(300)],
+                 energy=60., sight_range=3)
+    return grid
+
+
+def same_state(a, b):
+    pa, pb = a.population, b.population
+    eq_(pa.size, pb.size)
+    for name, dtype in pa.COLUMNS:
+        ok_(np.array_equal(getattr(pa, name)[:pa.size],
+                           getattr(pb, name)[:pb.size]), name)
+    ok_(np.array_equal(a.veg.amount, b.veg.amount))
+
+
+class TestEngine(object):
+    def test_needs_population(self):
+        assert_raises(ValueError, Engine, ls.Grid(3, 3, veg_arrays=True))
+
+    def test_matches_serial(self):
+        serial = build_world()
+        for i in range(15):
+            serial.update()
+        for processes in [1, 3]:
+            grid = build_world()
+            with Engine(grid, processes) as engine:
+                for i in range(15):
+                    engine.update()
+            same_state(serial, grid)
+
+    def test_changes_between_ticks(self):
+        serial = build_world(1)
+        grid = build_world(1)
+        with Engine(grid, 2) as engine:
+            for world, tick in [(serial, serial.update),
+                                (grid, engine.update)]:
+                for i in range(5):
+                    tick()
+                world.get_node(20, 20).move_cost = 9
+                world.population.add_many(range(100), [2] * 100)
+                for i in range(5):
+                    tick()
+        same_state(serial, grid)
+
+    def test_pooled_pathfinder(self):
+        #the engine's workers can't start a pool of their own
+        serial = build_world(3)
+        grid = build_world(3)
+        grid.use_pathfinder(GridPathFinder(grid, processes=2))
+        cells = grid.cells()
+        grid.pathfinder.compute_paths([(cells[0], cells[-1]),
+                                       (cells[-1], cells[0])])
+        with Engine(grid, 2) as engine:
+            for i in range(5):
+                serial.update()
+                engine.update()
+            #nor inherit the one here
+            eq_(grid.pathfinder._pool, None)
+        same_state(serial, grid)
+
+    def test_food_field(self):
+        worlds = []
+        for stepped in ['serial', 'engine']:
+            grid = build_world(2)
+            FoodField(grid)
+            rand = Random(2)
+            for i in range(20):
+                o = ls.Organism(grid)
+                o.energy = 50
+                o.sight_range = 4
+                o.set_location(grid.get_node(rand.randrange(30),
+                                             rand.randrange(24)))
+            worlds.append(grid)
+        serial, grid = worlds
+        with Engine(grid, 2) as engine:
+            for i in range(10):
+                serial.update()
+                engine.update()
+        same_state(serial, grid)
+        eq_([(o.location.x, o.location.y, o.energy)
+             for o in serial.organisms],
+            [(o.location.x, o.location.y, o.energy)
+             for o in grid.organisms])
+        ok_(grid.food_field.updates > 0)
+        eq_(grid.food_field.updates, serial.food_field.updates)
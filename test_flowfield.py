@@ -0,0 +1,137 @@
+from nose.tools import *
+from heapq import heappush, heappop
+import lifesim as ls
+from flowfield import FoodField, INF
+
+
+def build_world(veg_arrays=True, seed=0):
+    grid = ls.Grid(25, 20, veg_arrays=veg_arrays, seed=seed)
+    rand = grid.random
+    for node in grid.cells():
+        node.set_plants(5 if rand.random() < .05 else 0, 1, 10)
+    for i in range(4):
+        x, y = rand.randrange(21), rand.randrange(16)
+        for node in [grid.get_node(x + i, y + j)
+                     for i in range(4) for j in range(4)]:
+            node.move_cost = 5
+    return grid
+
+
+def brute_force(grid):
+    '''
+    Cost from every cell to the cheapest food, by a Dijkstra from
+    each food cell in turn.
+    '''
+    cells = grid.cells()
+    best = [INF] * len(cells)
+    for food in cells:
+        if food.plants.amount <= 0:
+            continue
+        dist = {food: 0}
+        open_set = [(0, food.x, food.y)]
+        while open_set:
+            d, x, y = heappop(open_set)
+            node = grid.get_node(x, y)
+            if d > dist[node]:
+                continue
+            for succ in grid.neighbors(node):
+                succ_dist = d + node.move_cost
+                if succ_dist < dist.get(succ, INF):
+                    dist[succ] = succ_dist
+                    heappush(open_set, (succ_dist, succ.x, succ.y))
+        for node, d in dist.items():
+            index = grid.cell_index(node)
+            best[index] = min(best[index], d)
+    return best
+
+
+class TestFoodField(object):
+    def test_matches_brute_force(self):
+        for veg_arrays in [True, False]:
+            grid = build_world(veg_arrays)
+            field = FoodField(grid)
+            eq_(list(field.dist), brute_force(grid))
+
+    def test_incremental(self):
+        grid = build_world()
+        field = FoodField(grid)
+        rand = grid.random
+        for i in range(10):
+            for j in range(8):
+                node = grid.get_node(rand.randrange(25), rand.randrange(20))
+                node.set_plants(rand.choice([0, 0, 3]), 1, 10)
+            field.update()
+            eq_(field.rebuilds, 1)
+            eq_(list(field.dist), brute_force(grid))
+            for cell in range(len(field.dist)):
+                source = field.source[cell]
+                if source >= 0:
+                    ok_(grid.cell(source).plants.amount > 0)
+        ok_(field.updates > 0)
+
+    def test_terrain_rebuilds(self):
+        grid = build_world()
+        field = FoodField(grid)
+        grid.get_node(3, 3).move_cost = 9
+        field.update()
+        eq_(field.rebuilds, 2)
+        eq_(list(field.dist), brute_force(grid))
+
+    def test_route(self):
+        grid = build_world()
+        field = FoodField(grid)
+        cells = grid.cells()
+        for cell in range(0, len(cells), 7):
+            node = cells[cell]
+            route = field.route(node)
+            if route is None:
+                eq_(field.dist[cell], INF)
+                continue
+            eq_(route[0], node)
+            ok_(route[-1].plants.amount > 0)
+            for a, b in zip(route, route[1:]):
+                ok_(b in grid.neighbors(a))
+            eq_(sum(b.move_cost for b in route[1:]), field.dist[cell])
+
+        grid = ls.Grid(10, 1, veg_arrays=True)
+        grid.veg.fill(0, 1, 10)
+        grid.veg.set(9, 0, 5, 1, 10)
+        field = FoodField(grid)
+        eq_(field.route(grid.get_node(5, 0), 3), None)
+        eq_(len(field.route(grid.get_node(6, 0), 3)), 4)
+
+    def test_organisms_follow(self):
+        for veg_arrays in [True, False]:
+            grid = build_world(veg_arrays)
+            FoodField(grid)
+            for i in range(30):
+                o = ls.Organism(grid)
+                o.energy = 50
+                o.sight_range = 4
+                o.set_location(grid.random.choice(grid.cells()))
+            for i in range(20):
+                grid.update()
+            #the field is updated at the start of a tick, so it
+            #doesn't yet show this one's grazing
+            grid.food_field.update()
+            eq_(list(grid.food_field.dist), brute_force(grid))
+            ok_(any(o.energy > 50 for o in grid.organisms))
+
+    def test_cheapest_out_of_sight(self):
+        #the food at (11, 0) is cheaper to reach but out of sight;
+        #the food at (2, 0) is in sight behind rough ground
+        grid = ls.Grid(12, 1)
+        for node in grid.cells():
+            node.set_plants(0, 1, 10)
+        grid.get_node(2, 0).set_plants(5, 1, 10)
+        grid.get_node(11, 0).set_plants(5, 1, 10)
+        grid.get_node(3, 0).move_cost = 20
+        grid.get_node(4, 0).move_cost = 20
+        field = FoodField(grid)
+        o = ls.Organism(grid)
+        o.sight_range = 3
+        o.set_location(grid.get_node(5, 0))
+        eq_(field.route(o.location, o.sight_range), None)
+        o.forage()
+        eq_(o.goal, grid.get_node(2, 0))
+        eq_(list(o.path)[-1], grid.get_node(2, 0))
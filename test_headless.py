@@ -0,0 +1,63 @@
+from nose.tools import *
+import csv
+import json
+import os
+import re
+import sys
+import tempfile
+from StringIO import StringIO
+import headless
+
+
+def run(*options):
+    path = os.path.join(tempfile.mkdtemp(), 'out')
+    stderr, sys.stderr = sys.stderr, StringIO()
+    try:
+        headless.main(['--size', '20', '--organisms', '40', '--out', path] +
+                      list(options))
+        ok_(re.match(r'\d+ ticks at [\d.]+ ticks/s\n$',
+                     sys.stderr.getvalue()))
+    finally:
+        sys.stderr = stderr
+    return path
+
+
+class TestHeadless(object):
+    def test_json(self):
+        path = run('--ticks', '25', '--every', '10', '--format', 'json')
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        eq_([row['tick'] for row in rows], [0, 10, 20, 25])
+        eq_(rows[0]['organisms'], 40)
+        ok_(rows[-1]['elapsed_s'] > 0)
+
+    def test_csv(self):
+        path = run('--ticks', '6', '--every', '3', '--format', 'csv',
+                   '--mode', 'objects')
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        eq_(len(rows), 3)
+        eq_(sorted(rows[0]), sorted(headless.FIELDS))
+
+    def test_reproducible(self):
+        def final(*options):
+            path = run('--ticks', '20', '--every', '20', '--format', 'json',
+                       *options)
+            with open(path) as f:
+                row = [json.loads(line) for line in f][-1]
+            return row['organisms'], row['mean_energy'], row['vegetation']
+        eq_(final('--seed', '4'), final('--seed', '4'))
+        eq_(final('--seed', '4'), final('--seed', '4', '--processes', '2'))
+        ok_(final('--seed', '4') != final('--seed', '5'))
+
+    def test_bad_options(self):
+        #keep argparse's usage text out of the test output
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            assert_raises(SystemExit, headless.parse_args,
+                          ['--mode', 'objects', '--processes', '2'])
+            assert_raises(SystemExit, headless.parse_args,
+                          ['--every', '0'])
+            ok_('--every must be at least 1' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
@@ -0,0 +1,90 @@
+from nose.tools import *
+import lifesim as ls
+import hpastar
+from random import Random
+from test_pathfinder import (build_rough_map, build_maze, check_path,
+                             path_cost, cheapest_cost)
+
+
+class TestHierarchical(object):
+    def setup(self):
+        self.m = build_rough_map(60, 45, 2)
+        self.hpa = hpastar.HierarchicalPathFinder(self.m, cluster_size=10)
+        
+    def test_paths(self):
+        rand = Random(4)
+        for i in range(20):
+            start = rand.choice(self.m.cells())
+            goal = rand.choice(self.m.cells())
+            path = list(self.hpa.compute_path(start, goal))
+            check_path(self.m, path, start, goal)
+            ok_(path_cost(path) <= 1.5 * cheapest_cost(self.m, start, goal))
+            
+    def test_start_is_goal(self):
+        n = self.m.get_node(33, 12)
+        eq_(list(self.hpa.compute_path(n, n)), [n])
+        
+    def test_lazy_refinement(self):
+        start = self.m.get_node(1, 1)
+        goal = self.m.get_node(58, 43)
+        path = self.hpa.compute_path(start, goal)
+        ok_(len(path.waypoints) > 3)
+        eq_(path.legs.count(None), len(path.legs))
+        walk = iter(path)
+        eq_(walk.next(), start)
+        walk.next()
+        eq_(path.legs.count(None), len(path.legs) - 1)
+        eq_(list(path), list(path))
+        eq_(path.legs.count(None), 0)
+        
+    def test_incremental_rebuild(self):
+        start = self.m.get_node(1, 1)
+        goal = self.m.get_node(58, 43)
+        self.hpa.compute_path(start, goal)
+        built = self.hpa.clusters_built
+        eq_(built, 6 * 5)
+        self.m.get_node(25, 25).move_cost = 40
+        path = list(self.hpa.compute_path(start, goal))
+        check_path(self.m, path, start, goal)
+        eq_(self.hpa.clusters_built - built, 5)
+        
+    def test_start_on_entrance(self):
+        #(0, 11) is the entrance across to (0, 12)
+        m = ls.Grid(1, 32)
+        hpa = hpastar.HierarchicalPathFinder(m, cluster_size=4)
+        start, goal = m.get_node(0, 11), m.get_node(0, 29)
+        path = list(hpa.compute_path(start, goal))
+        check_path(m, path, start, goal)
+        eq_(len(path), 19)
+        
+    def test_walls(self):
+        #the only cheap way across x == 9 is through (9, 17)
+        m = build_maze(30, 20, 0)
+        for x in (3, 21):
+            for y in range(20):
+                m.get_node(x, y).move_cost = 1
+        for y in range(20):
+            m.get_node(9, y).move_cost = 1 if y == 17 else 50
+        hpa = hpastar.HierarchicalPathFinder(m, cluster_size=5)
+        start, goal = m.get_node(0, 0), m.get_node(29, 0)
+        path = list(hpa.compute_path(start, goal))
+        check_path(m, path, start, goal)
+        ok_(m.get_node(9, 17) in path)
+        m.get_node(9, 17).move_cost = 50
+        m.get_node(9, 2).move_cost = 1
+        path = list(hpa.compute_path(start, goal))
+        ok_(m.get_node(9, 2) in path)
+        ok_(max(node.move_cost for node in path) == 1)
+        
+    def test_grid_pathfind(self):
+        self.m.use_pathfinder(self.hpa)
+        o = ls.Organism(self.m)
+        o.set_location(self.m.get_node(2, 2))
+        goal = self.m.get_node(50, 40)
+        o.goal = goal
+        o.path = o.pathfind(goal)
+        while o.path:
+            o.move()
+        eq_(o.location, goal)
+        ok_(self.m.pathfind(self.m.get_node(2, 2), goal))
+        eq_(self.m.path_cache.hits, 1)
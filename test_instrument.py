@@ -0,0 +1,99 @@
+from nose.tools import *
+import csv
+import json
+import os
+import tempfile
+import lifesim as ls
+import pathfinder
+from instrument import Profiler
+from population import Population
+
+
+def build_world():
+    grid = ls.Grid(20, 20, seed=3)
+    for row in grid.nodes:
+        for node in row:
+            node.set_plants(grid.random.choice([0, 0, 0, 5]), 1, 10)
+    for i in range(15):
+        o = ls.Organism(grid)
+        o.energy = 50
+        o.set_location(grid.random.choice(grid.cells()))
+    return grid
+
+
+class TestProfiler(object):
+    def setup(self):
+        self.grid = build_world()
+        self.profiler = Profiler()
+
+    def teardown(self):
+        self.profiler.disable()
+
+    def test_rows(self):
+        with self.profiler:
+            for i in range(5):
+                self.grid.update()
+        rows = self.profiler.rows
+        eq_([row['tick'] for row in rows], range(5))
+        for row in rows:
+            eq_(row['update_calls'], 1)
+            ok_(row['update_s'] > 0)
+        totals = self.profiler.totals()
+        ok_(totals['forage_calls'] > 0)
+        ok_(totals['perception_calls'] > 0)
+        ok_(totals['searches'] > 0)
+        eq_(totals['expansions'], self.grid.pathfinder.expansions)
+        ok_(totals['open_peak'] > 0)
+
+    def test_disable(self):
+        update = ls.Grid.__dict__['update']
+        compute = pathfinder.GridPathFinder.__dict__['compute_index_path']
+        self.profiler.enable()
+        ok_(ls.Grid.__dict__['update'] is not update)
+        assert_raises(RuntimeError, Profiler().enable)
+        self.profiler.disable()
+        ok_(ls.Grid.__dict__['update'] is update)
+        ok_(pathfinder.GridPathFinder.__dict__['compute_index_path']
+            is compute)
+        self.grid.update()
+        eq_(self.profiler.rows, [])
+
+    def test_population(self):
+        grid = ls.Grid(20, 20, veg_arrays=True, seed=1)
+        grid.veg.fill(0, 1, 10)
+        grid.veg.set(15, 15, 5, 1, 10)
+        Population(grid).add_many([14, 2], [14, 2], energy=50)
+        with self.profiler:
+            grid.update()
+        row = self.profiler.rows[0]
+        eq_(row['population_calls'], 1)
+        eq_(row['perception_calls'], 1)
+
+    def test_draw(self):
+        grid = self.grid
+        grid.track_changes()
+        v = ls.Visualizer(grid)
+        with self.profiler:
+            v.draw()
+            grid.update()
+            v.draw_changes()
+            v.draw_arrays(v.veg_fraction(), v.occupancy())
+            grid.update()
+        rows = self.profiler.rows
+        eq_([row['draw_calls'] for row in rows], [1, 2])
+
+    def test_export(self):
+        with self.profiler:
+            for i in range(3):
+                self.grid.update()
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'profile.csv')
+        self.profiler.write_csv(path)
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        eq_(rows[0], self.profiler.columns())
+        eq_(len(rows), 4)
+        path = os.path.join(directory, 'profile.json')
+        self.profiler.write_json(path)
+        with open(path) as f:
+            eq_(json.load(f), self.profiler.rows)
@@ -1,6 +1,7 @@
 from nose.tools import *
 import lifesim as ls
-from random import choice
+from random import Random
+import time
 
 
 class TestNode(object):
@@ -19,18 +20,23 @@ def build_small_map():
             node.make_plain()
     return grid
     
-def build_desert():
-    d = ls.Grid(10, 10)
+def build_desert(seed=0):
+    d = ls.Grid(10, 10, seed=seed)
     for row in d.nodes:
         for node in row:
             node.set_plants(0, 1, 10)
     return d
     
-def build_rand_map():
-    r = ls.Grid(10, 10)
+def build_array_map():
+    grid = ls.Grid(10, 10, veg_arrays=True)
+    grid.veg.fill(10, 1, 10)
+    return grid
+    
+def build_rand_map(seed=0):
+    r = ls.Grid(10, 10, seed=seed)
     for row in r.nodes:
         for node in row:
-            node.set_plants(choice(range(10)), 1, 10)
+            node.set_plants(r.random.choice(range(10)), 1, 10)
     return r
         
 class TestGrid(object):
@@ -60,12 +66,139 @@ class TestGrid(object):
         n3 = self.m.get_node(9,9)
         eq_(len(self.m.neighbors(n3)), 3)
     
+    def test_neighbor_order(self):
+        n = self.m.get_node(5, 5)
+        eq_([(nb.x, nb.y) for nb in self.m.neighbors(n)],
+            [(4, 4), (4, 5), (4, 6), (5, 4), (5, 6), (6, 4), (6, 5), (6, 6)])
+        
+    def test_neighbors_not_square(self):
+        m = ls.Grid(6, 3)
+        eq_(len(m.neighbors(m.get_node(5, 1))), 5)
+        eq_(len(m.neighbors(m.get_node(4, 2))), 5)
+        eq_(len(m.neighbors(m.get_node(0, 0))), 3)
+        eq_(len(m.neighbors(m.get_node(3, 1))), 8)
+        ok_(m.get_node(5, 2) in m.neighbors(m.get_node(4, 1)))
+        
+    def test_adjacency_cached(self):
+        adj = self.m.adjacency()
+        self.m.neighbors(self.m.get_node(1, 1))
+        ok_(self.m.adjacency() is adj)
+        self.m.nodes.append([ls.Node(i, 10) for i in range(10)])
+        ok_(self.m.adjacency() is not adj)
+        eq_(len(self.m.neighbors(self.m.get_node(4, 9))), 8)
+        eq_(self.m.cell(self.m.cell_index(self.m.get_node(3, 10))),
+            self.m.get_node(3, 10))
+    
+    def test_path_cache(self):
+        start = self.m.get_node(1, 1)
+        goal = self.m.get_node(4, 6)
+        p1 = list(self.m.pathfind(start, goal))
+        eq_((self.m.path_cache.hits, self.m.path_cache.misses), (0, 1))
+        p2 = list(self.m.pathfind(start, goal))
+        eq_(p1, p2)
+        eq_(p1[0], start)
+        eq_(p1[-1], goal)
+        eq_((self.m.path_cache.hits, self.m.path_cache.misses), (1, 1))
+        
+    def test_path_cache_terrain(self):
+        start = self.m.get_node(1, 1)
+        goal = self.m.get_node(1, 4)
+        ok_(self.m.get_node(1, 2) in list(self.m.pathfind(start, goal)))
+        self.m.get_node(1, 2).move_cost = 10
+        eq_(self.m.terrain_version, 1)
+        ok_(self.m.get_node(1, 2) not in list(self.m.pathfind(start, goal)))
+        eq_(self.m.path_cache.misses, 2)
+        
+    def test_path_cache_lru(self):
+        m = ls.Grid(5, 5, path_cache_size=2)
+        a, b, c = m.get_node(0, 0), m.get_node(2, 2), m.get_node(4, 4)
+        m.pathfind(a, b)
+        m.pathfind(a, c)
+        m.pathfind(a, b)
+        m.pathfind(b, c)
+        eq_(len(m.path_cache), 2)
+        m.pathfind(a, b)
+        eq_(m.path_cache.hits, 2)
+        m.pathfind(a, c)
+        eq_(m.path_cache.misses, 4)
+        
     def test_dist(self):
         n1 = self.m.get_node(3,3)
         n2 = self.m.get_node(6, 7)
         eq_(self.m.dist(n1, n2), 5)
     
     
+class TestArrayVeg(object):
+    def setup(self):
+        self.m = build_array_map()
+        
+    def test_init(self):
+        ok_(isinstance(self.m.get_node(2, 3), ls.Node))
+        eq_(self.m.veg.amount.shape, (10, 10))
+        eq_(self.m.get_node(2, 3).plants.amount, 10)
+        ok_(ls.Grid(2, 2).veg is None)
+        
+    def test_set_plants(self):
+        n = self.m.get_node(2, 3)
+        n.set_plants(4, 2, 8)
+        eq_(self.m.veg.amount[3, 2], 4)
+        eq_(self.m.veg.energy_density[3, 2], 2)
+        eq_(self.m.veg.veg_max[3, 2], 8)
+        eq_(self.m.veg.amount[2, 3], 10)
+        
+    def test_view(self):
+        n = self.m.get_node(5, 1)
+        n.plants.amount -= 3
+        eq_(self.m.veg.amount[1, 5], 7)
+        eq_(n.plants.amount, 7)
+        
+    def test_fraction(self):
+        self.m.get_node(0, 0).set_plants(5, 1, 10)
+        self.m.get_node(1, 0).set_plants(0, 1, 0)
+        frac = self.m.veg.fraction()
+        eq_(frac[0, 0], .5)
+        eq_(frac[0, 1], 0)
+        eq_(frac[9, 9], 1)
+        
+    def test_graze(self):
+        o = ls.Organism(self.m)
+        o.set_location(self.m.get_node(1, 1))
+        o.graze()
+        eq_(self.m.veg.amount[1, 1], 9)
+        eq_(o.energy, 101)
+        
+    def test_no_growth_by_default(self):
+        self.m.get_node(1, 1).set_plants(4, 1, 10)
+        self.m.update()
+        eq_(self.m.veg.amount[1, 1], 4)
+        
+    def test_regrowth(self):
+        self.m.veg.growth_rate = .5
+        self.m.get_node(1, 1).set_plants(4, 1, 10)
+        self.m.get_node(2, 2).set_plants(0, 1, 10)
+        self.m.update()
+        #4 + .5 * 4 * (1 - 4/10.)
+        assert_almost_equal(self.m.veg.amount[1, 1], 5.2)
+        eq_(self.m.veg.amount[2, 2], 0)
+        eq_(self.m.veg.amount[5, 5], 10)
+        
+    def test_decay(self):
+        self.m.veg.decay_rate = .1
+        self.m.update()
+        assert_almost_equal(self.m.veg.amount[5, 5], 9)
+        
+    def test_diffusion(self):
+        self.m.veg.fill(0, 1, 10)
+        self.m.get_node(5, 5).set_plants(8, 1, 10)
+        self.m.veg.diffusion_rate = .5
+        self.m.update()
+        eq_(self.m.veg.amount[5, 5], 4)
+        eq_(self.m.veg.amount[5, 4], 1)
+        eq_(self.m.veg.amount[6, 5], 1)
+        eq_(self.m.veg.amount[6, 6], 0)
+        assert_almost_equal(self.m.veg.amount.sum(), 8)
+        
+    
 class TestOrg(object):
     def setup(self):
         self.m = build_small_map()
@@ -118,6 +251,52 @@ class TestOrg(object):
         self.d_o.set_location(self.d_o.grid.get_node(9, 9))
         ok_(not self.d_o.find_plants())
         
+    def test_find_nearest_plants(self):
+        self.d.get_node(7, 7).set_plants(1, 1, 10)
+        self.d.get_node(5, 6).set_plants(1, 1, 10)
+        self.d_o.set_location(self.d.get_node(5, 5))
+        eq_(self.d_o.find_plants(), self.d.get_node(5, 6))
+        #equally near: first in can_see() order
+        self.d.get_node(4, 5).set_plants(1, 1, 10)
+        eq_(self.d_o.find_plants(), self.d.get_node(4, 5))
+        
+    def test_find_plants_batch(self):
+        rand = Random(3)
+        objects = ls.Grid(30, 20)
+        arrays = ls.Grid(30, 20, veg_arrays=True)
+        for grid in objects, arrays:
+            for row in grid.nodes:
+                for node in row:
+                    node.set_plants(0, 1, 10)
+        for i in range(40):
+            x, y = rand.randrange(30), rand.randrange(20)
+            objects.get_node(x, y).set_plants(5, 1, 10)
+            arrays.get_node(x, y).set_plants(5, 1, 10)
+        for grid in objects, arrays:
+            rand = Random(4)
+            for i in range(100):
+                o = ls.Organism(grid)
+                o.sight_range = rand.choice([1, 2, 3, 5])
+                o.set_location(grid.get_node(rand.randrange(30),
+                                             rand.randrange(20)))
+        found = [objects.find_plants(objects.organisms),
+                 arrays.find_plants(arrays.organisms)]
+        ok_(any(found[0]))
+        ok_(not all(found[0]))
+        eq_([(n.x, n.y) if n else None for n in found[0]],
+            [(n.x, n.y) if n else None for n in found[1]])
+        for o, goal in zip(arrays.organisms, found[1]):
+            eq_(o.find_plants(), goal)
+        
+    def test_see_not_square(self):
+        m = ls.Grid(12, 4)
+        for row in m.nodes:
+            for node in row:
+                node.make_plain()
+        o = ls.Organism(m)
+        o.set_location(m.get_node(10, 1))
+        eq_(len(o.can_see()), 4 * 4)
+        
     def test_move(self):
         self.o.set_location(self.o.grid.get_node(3, 3))
         self.o.goal = self.o.grid.get_node(6, 6)
@@ -167,15 +346,81 @@ class TestOrg(object):
         eq_(self.d_o.location.plants.amount, 0)
         ok_(not self.d_o.path, not self.d_o.goal)
     
+    def test_wander_seeded(self):
+        def walk(seed):
+            grid = build_desert(seed)
+            o = ls.Organism(grid)
+            o.set_location(grid.get_node(5, 5))
+            o.energy = 20
+            for i in range(30):
+                grid.update()
+            return o.location
+        eq_((walk(1).x, walk(1).y), (walk(1).x, walk(1).y))
+        ok_(len(set((walk(s).x, walk(s).y) for s in range(5))) > 1)
+    
     def test_birth(self):
         self.o.give_birth()
         eq_(len(self.o.location.occupants), 3)
 
+class TestOccupancy(object):
+    def setup(self):
+        self.m = ls.Grid(40, 40, chunk_size=8)
+        self.orgs = []
+        rand = Random(5)
+        for i in range(300):
+            o = ls.Organism(self.m)
+            o.set_location(self.m.get_node(rand.randrange(40),
+                                           rand.randrange(40)))
+            self.orgs.append(o)
+            
+    def check_consistent(self):
+        on_map = [o for row in self.m.nodes for n in row for o in n.occupants]
+        eq_(sorted(map(id, on_map)), sorted(map(id, self.m.organisms)))
+        for o in self.m.organisms:
+            ok_(o in o.location.occupants)
+        eq_(len(self.m.index), len(self.m.organisms))
+        
+    def test_place(self):
+        self.check_consistent()
+        o = self.orgs[0]
+        old = o.location
+        o.set_location(self.m.get_node(39, 39))
+        ok_(o not in old.occupants)
+        ok_(o in self.m.get_node(39, 39).occupants)
+        self.check_consistent()
+        
+    def test_die(self):
+        for o in self.orgs[::3]:
+            o.die()
+            ok_(o not in self.m.organisms)
+        eq_(len(self.m.organisms), 200)
+        self.check_consistent()
+        
+    def test_move(self):
+        o = self.orgs[7]
+        o.set_location(self.m.get_node(5, 5))
+        o.goal = self.m.get_node(20, 9)
+        o.path = o.pathfind(o.goal)
+        while o.path:
+            o.move()
+        eq_(o.location, self.m.get_node(20, 9))
+        self.check_consistent()
+        
+    def test_near(self):
+        for x, y, r in [(0, 0, 3), (20, 20, 5), (33, 7, 9.5), (39, 39, 60)]:
+            node = self.m.get_node(x, y)
+            expected = [o for o in self.m.organisms
+                        if self.m.dist(node, o.location) <= r]
+            found = self.m.organisms_near(node, r)
+            eq_(sorted(map(id, found)), sorted(map(id, expected)))
+        eq_(len(self.m.organisms_near(self.m.get_node(0, 0), 60)), 300)
+        
+        
 def rand_pop(grid, animals):
     for i in range(animals):
         new_o = ls.Organism(grid)
-        new_o.set_location(choice(
-            choice(grid.nodes)
+        new_o.set_location(grid.random.choice(
+            grid.random.choice(grid.nodes)
             )
         )
     
@@ -190,7 +435,8 @@ class TestVis(object):
         for org in self.d.organisms:
             org.energy = 20
         for i in range(20):
-            choice(choice(self.d.nodes)).set_plants(10, 1, 10)
+            self.d.random.choice(
+                self.d.random.choice(self.d.nodes)).set_plants(10, 1, 10)
         self.v_d = ls.Visualizer(self.d)
             
         
@@ -210,6 +456,101 @@ class TestVis(object):
     def test_color(self):
         self.v.fill_grid()
         
+    def test_draw_changes(self):
+        self.v.draw()
+        eq_(self.v.draw_changes(), [])
+        org = self.m.organisms[0]
+        old = org.location
+        new = self.m.get_node((old.x + 5) % 10, old.y)
+        org.set_location(new)
+        rects = self.v.draw_changes()
+        eq_(sorted((r.x, r.y) for r in rects),
+            sorted((n.x * self.v.grid_width, n.y * self.v.grid_height)
+                   for n in [old, new]))
+        eq_(self.v.draw_changes(), [])
+        
+    def test_draw_changes_graze(self):
+        self.v_d.draw()
+        org = self.d.organisms[0]
+        org.location.set_plants(95, 1, 100)
+        eq_(len(self.v_d.draw_changes()), 1)
+        org.graze()
+        #still the same colour
+        eq_(self.v_d.draw_changes(), [])
+        for i in range(10):
+            org.graze()
+        eq_(len(self.v_d.draw_changes()), 1)
+        
+    def test_draw_changes_layer(self):
+        grid = ls.Grid(10, 10, veg_arrays=True)
+        grid.veg.fill(5, 1, 10)
+        grid.veg.growth_rate = .5
+        v = ls.Visualizer(grid)
+        v.draw()
+        grid.veg.amount[2, 3] = 0
+        grid.update()
+        eq_(len(v.draw_changes()), 100)
+        eq_(v.draw_changes(), [])
+        
+    def test_run_realtime(self):
+        ticks, frames = self.v_d.run_realtime(tps=200, fps=50, ticks=20)
+        eq_(ticks, 20)
+        ok_(1 <= frames <= 21)
+        
+    def test_tracking(self):
+        #changes are only kept once draw_changes() has a drawing
+        #to update
+        eq_(self.d.dirty, None)
+        self.v_d.run_realtime(tps=200, fps=50, ticks=5)
+        eq_(self.d.dirty, None)
+        eq_(self.v_d.draw_changes(), [self.v_d.screen.get_rect()])
+        eq_(self.d.dirty, set())
+        self.d.update()
+        ok_(self.d.dirty)
+        #a full redraw leaves nothing for draw_changes() to catch up
+        self.v_d.run_realtime(tps=20, fps=200, ticks=2, tick=lambda: None)
+        eq_(self.d.dirty, set())
+        
+    def test_simulation_thread(self):
+        ticks = []
+        sim = ls.SimulationThread(lambda: ticks.append(time.time()), tps=50,
+                                  limit=6)
+        sim.start()
+        sim.join(5)
+        eq_(sim.ticks, 6)
+        #paced, not as fast as possible
+        ok_(ticks[-1] - ticks[0] >= .09)
+        
+    def test_glyph_cache(self):
+        ok_(self.v.glyph(3) is self.v.glyph(3))
+        
+    def test_bulk_default(self):
+        ok_(not self.v.bulk)
+        ok_(ls.Visualizer(ls.Grid(400, 300, veg_arrays=True)).bulk)
+        
+    def test_bulk(self):
+        grid = ls.Grid(200, 100, veg_arrays=True)
+        grid.veg.fill(0, 1, 10)
+        grid.veg.set(10, 20, 10, 1, 10)
+        grid.veg.set(30, 40, 10, 1, 10)
+        for i in range(4):
+            ls.Organism(grid).set_location(grid.get_node(30, 40))
+        v = ls.Visualizer(grid)
+        v.draw()
+        #cells are 4x8 pixels
+        eq_(tuple(v.scaled.get_at((10 * 4 + 1, 20 * 8 + 1)))[:3], v.YL_GN[7])
+        eq_(tuple(v.scaled.get_at((0, 0)))[:3], v.YL_GN[0])
+        eq_(tuple(v.scaled.get_at((30 * 4 + 1, 40 * 8 + 1)))[:3], v.DENSITY)
+        
+    def test_bulk_objects(self):
+        v = ls.Visualizer(self.m, bulk=True)
+        v.draw()
+        node = self.m.get_node(3, 6)
+        counts = v.occupancy()
+        eq_(counts.sum(), 30)
+        eq_(counts[6, 3], len(node.occupants))
+        eq_(v.veg_fraction()[6, 3], node.plants.amount / 10.)
+        
 #     def test_d(self):
 #         self.v_d.run()
         
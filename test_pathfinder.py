@@ -0,0 +1,204 @@
+from nose.tools import *
+import lifesim as ls
+import pathfinder
+from random import Random
+
+
+def build_rough_map(width, height, seed):
+    '''
+    Plains with a random scattering of costlier cells.
+    '''
+    rand = Random(seed)
+    grid = ls.Grid(width, height)
+    for row in grid.nodes:
+        for node in row:
+            node.make_plain()
+            if rand.random() < .3:
+                node.move_cost = rand.choice([2, 3, 5, 20])
+    return grid
+    
+def build_maze(width, height, seed):
+    '''
+    Plains crossed by costly walls, each with a narrow gap.
+    '''
+    rand = Random(seed)
+    grid = ls.Grid(width, height)
+    for x in range(3, width, 6):
+        gap = rand.randrange(height)
+        for y in range(height):
+            if abs(y - gap) > 1:
+                grid.get_node(x, y).move_cost = 50
+    return grid
+    
+def path_cost(path):
+    return sum(node.move_cost for node in path[1:])
+    
+def check_path(grid, path, start, goal):
+    eq_(path[0], start)
+    eq_(path[-1], goal)
+    for a, b in zip(path, path[1:]):
+        ok_(b in grid.neighbors(a))
+        
+def generic_cost(grid, start, goal):
+    pf = pathfinder.PathFinder(grid.neighbors, grid.move_cost, grid.dist)
+    return path_cost(list(pf.compute_path(start, goal)))
+    
+def cheapest_cost(grid, start, goal):
+    '''
+    Cost of the cheapest path, found by Dijkstra's algorithm.
+    '''
+    pf = pathfinder.PathFinder(grid.neighbors, grid.move_cost,
+                               lambda node, goal: 0)
+    return path_cost(list(pf.compute_path(start, goal)))
+    
+    
+class TestGridPathFinder(object):
+    def setup(self):
+        self.m = build_rough_map(20, 15, 3)
+        self.pf = pathfinder.GridPathFinder(self.m)
+        
+    def test_path(self):
+        start = self.m.get_node(2, 3)
+        goal = self.m.get_node(17, 12)
+        p = self.pf.compute_path(start, goal)
+        ok_(isinstance(p.next(), ls.Node))
+        path = list(self.pf.compute_path(start, goal))
+        check_path(self.m, path, start, goal)
+        ok_(self.pf.expansions > 0)
+        
+    def test_same_cost_as_generic(self):
+        rand = Random(7)
+        for i in range(20):
+            start = rand.choice(self.m.cells())
+            goal = rand.choice(self.m.cells())
+            path = list(self.pf.compute_path(start, goal))
+            check_path(self.m, path, start, goal)
+            eq_(path_cost(path), generic_cost(self.m, start, goal))
+            
+    def test_start_is_goal(self):
+        n = self.m.get_node(4, 4)
+        eq_(list(self.pf.compute_path(n, n)), [n])
+        
+    def test_terrain_change(self):
+        start = self.m.get_node(0, 0)
+        goal = self.m.get_node(0, 5)
+        for row in self.m.nodes:
+            for node in row:
+                node.move_cost = 1
+        ok_(self.m.get_node(0, 3) in list(self.pf.compute_path(start, goal)))
+        for y in range(15):
+            self.m.get_node(0, y).move_cost = 10
+            self.m.get_node(1, y).move_cost = 10
+        path = list(self.pf.compute_path(start, goal))
+        eq_(path_cost(path), generic_cost(self.m, start, goal))
+        
+        
+class TestJumpPoints(object):
+    def check_optimal(self, grid, queries=40):
+        rand = Random(1)
+        astar = pathfinder.GridPathFinder(grid, heuristic='chebyshev')
+        jps = pathfinder.GridPathFinder(grid, jump_points=True,
+                                        heuristic='chebyshev')
+        for i in range(queries):
+            start = rand.choice(grid.cells())
+            goal = rand.choice(grid.cells())
+            path = list(jps.compute_path(start, goal))
+            check_path(grid, path, start, goal)
+            cost = cheapest_cost(grid, start, goal)
+            eq_(path_cost(path), cost)
+            eq_(path_cost(list(astar.compute_path(start, goal))), cost)
+        return astar, jps
+        
+    def test_open(self):
+        astar, jps = self.check_optimal(ls.Grid(30, 20))
+        ok_(jps.expansions * 10 < astar.expansions)
+        
+    def test_rough(self):
+        self.check_optimal(build_rough_map(30, 20, 5))
+        
+    def test_maze(self):
+        self.check_optimal(build_maze(30, 20, 1))
+        
+    def test_terrain_change(self):
+        m = ls.Grid(10, 10)
+        jps = pathfinder.GridPathFinder(m, jump_points=True)
+        start, goal = m.get_node(0, 5), m.get_node(9, 5)
+        eq_(len(list(jps.compute_path(start, goal))), 10)
+        for y in range(10):
+            if y != 8:
+                m.get_node(5, y).move_cost = 50
+        path = list(jps.compute_path(start, goal))
+        check_path(m, path, start, goal)
+        ok_(m.get_node(5, 8) in path)
+        
+    def test_grid_use_pathfinder(self):
+        m = ls.Grid(10, 10)
+        a, b = m.get_node(0, 0), m.get_node(9, 4)
+        m.pathfind(a, b)
+        m.use_pathfinder(pathfinder.GridPathFinder(m, jump_points=True))
+        eq_(len(m.path_cache), 0)
+        path = list(m.pathfind(a, b))
+        check_path(m, path, a, b)
+        eq_(len(path), 10)
+        
+    def test_bad_heuristic(self):
+        assert_raises(ValueError, pathfinder.GridPathFinder,
+                      ls.Grid(2, 2), heuristic='manhattan')
+        
+        
+class TestBatch(object):
+    def setup(self):
+        self.m = build_rough_map(20, 15, 4)
+        self.pf = pathfinder.GridPathFinder(self.m)
+        rand = Random(9)
+        cells = self.m.cells()
+        self.requests = [(rand.choice(cells), rand.choice(cells))
+                         for i in range(12)]
+        self.requests += self.requests[:4]
+        
+    def teardown(self):
+        self.pf.close()
+        
+    def check_batch(self, paths):
+        eq_(len(paths), len(self.requests))
+        for (start, goal), path in zip(self.requests, paths):
+            check_path(self.m, path, start, goal)
+            eq_(path, list(self.pf.compute_path(start, goal)))
+        
+    def test_serial(self):
+        paths = self.pf.compute_paths(self.requests)
+        self.check_batch(paths)
+        ok_(paths[0] is paths[12])
+        
+    def test_processes(self):
+        paths = self.pf.compute_paths(self.requests, processes=2)
+        self.check_batch(paths)
+        ok_(self.pf.expansions > 0)
+        self.m.get_node(5, 5).move_cost = 50
+        self.check_batch(self.pf.compute_paths(self.requests, processes=2))
+        
+    def test_pool_follows_shape(self):
+        self.check_batch(self.pf.compute_paths(self.requests, processes=2))
+        pool = self.pf._pool
+        self.m.nodes.append([ls.Node(x, 15, self.m) for x in range(20)])
+        start, goal = self.m.get_node(0, 0), self.m.get_node(19, 15)
+        paths = self.pf.compute_paths([(start, goal), (goal, start)],
+                                      processes=2)
+        check_path(self.m, paths[0], start, goal)
+        check_path(self.m, paths[1], goal, start)
+        ok_(self.pf._pool is not pool)
+
+    def test_use_pathfinder_closes(self):
+        self.m.use_pathfinder(self.pf)
+        self.pf.compute_paths(self.requests, processes=2)
+        ok_(self.pf._pool is not None)
+        self.m.use_pathfinder(pathfinder.GridPathFinder(self.m))
+        eq_(self.pf._pool, None)
+
+    def test_grid_pathfind_many(self):
+        start, goal = self.requests[0]
+        self.m.pathfind(start, goal)
+        paths = self.m.pathfind_many(self.requests)
+        eq_([list(path) for path in paths],
+            [list(self.m.pathfind(a, b)) for a, b in self.requests])
+        eq_(len(self.m.path_cache), 12)
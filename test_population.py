@@ -0,0 +1,143 @@
+from nose.tools import *
+import lifesim as ls
+from population import Population
+
+
+def build_desert(w=10, h=10):
+    grid = ls.Grid(w, h, veg_arrays=True)
+    grid.veg.fill(0, 1, 10)
+    return grid
+
+
+class TestPopulation(object):
+    def setup(self):
+        self.grid = build_desert()
+        self.pop = Population(self.grid, capacity=4)
+
+    def test_attach(self):
+        eq_(self.grid.population, self.pop)
+        assert_raises(ValueError, Population, ls.Grid(3, 3))
+
+    def test_add(self):
+        rows = [self.pop.add(self.grid.get_node(i, i)) for i in range(6)]
+        eq_(rows, range(6))
+        eq_(len(self.pop), 6)
+        ok_(self.pop.capacity >= 6)
+        o = self.pop.view(5)
+        eq_(o.location, self.grid.get_node(5, 5))
+        eq_(o.energy, 100)
+        eq_(o.sight_range, 2)
+        ok_(not o.path)
+        ok_(not o.goal)
+
+    def test_decide(self):
+        #the same steps as TestOrg.test_decide with an Organism
+        self.grid.get_node(3, 3).set_plants(2, 1, 10)
+        o = self.pop.view(self.pop.add(self.grid.get_node(5, 5), energy=20))
+        self.grid.update()
+        ok_(o.path)
+        eq_(o.goal, self.grid.get_node(3, 3))
+        eq_(o.energy, 20)
+        self.grid.update()
+        eq_(o.location, self.grid.get_node(5, 5))
+        eq_(o.energy, 19)
+        self.grid.update()
+        eq_(o.location, self.grid.get_node(4, 4))
+        self.grid.update()
+        eq_(o.location, self.grid.get_node(3, 3))
+        eq_(o.energy, 17)
+        self.grid.update()
+        eq_(o.location, self.grid.get_node(3, 3))
+        ok_(not o.path)
+        self.grid.update()
+        eq_(o.energy, 18)
+        eq_(self.grid.get_node(3, 3).plants.amount, 1)
+
+    def test_speed(self):
+        self.grid.get_node(0, 5).set_plants(2, 1, 10)
+        o = self.pop.view(self.pop.add(self.grid.get_node(5, 5), energy=20,
+                                       speed=3, sight_range=6))
+        self.grid.update()
+        eq_(len(o.path), 6)
+        self.grid.update()
+        eq_(o.location, self.grid.get_node(3, 5))
+        self.grid.update()
+        eq_(o.location, self.grid.get_node(0, 5))
+        eq_(o.energy, 14)
+
+    def test_die(self):
+        o = self.pop.view(self.pop.add(self.grid.get_node(5, 5), energy=-1))
+        self.grid.update()
+        ok_(not o.alive)
+        eq_(len(self.pop), 0)
+        eq_(len(self.pop.views()), 0)
+
+    def test_shared_cell(self):
+        node = self.grid.get_node(4, 4)
+        node.set_plants(2, 1, 10)
+        rows = [self.pop.add(node, energy=20) for i in range(3)]
+        self.grid.update()
+        eq_([self.pop.view(row).energy for row in rows], [21, 21, 20])
+        eq_(node.plants.amount, 0)
+
+    def test_wander(self):
+        rows = self.pop.add_many([5] * 50, [5] * 50, energy=20)
+        self.grid.update()
+        goals = set()
+        for row in rows:
+            goal = self.pop.view(row).goal
+            ok_(3 <= goal.x <= 7 and 3 <= goal.y <= 7)
+            goals.add(goal)
+        ok_(len(goals) > 10)
+
+    def test_reproducible(self):
+        def run(seed):
+            grid = build_desert()
+            pop = Population(grid, seed=seed)
+            pop.add_many([1, 5, 8], [1, 5, 8], energy=50)
+            for i in range(10):
+                grid.update()
+            return pop.x[:3].tolist(), pop.y[:3].tolist()
+        eq_(run(1), run(1))
+        ok_(run(1) != run(2))
+
+    def test_detour(self):
+        #a wall of dear cells between the organism and the food
+        for y in range(1, 10):
+            self.grid.get_node(5, y).move_cost = 50
+        self.grid.get_node(8, 8).set_plants(2, 1, 10)
+        self.pop.add(self.grid.get_node(2, 8), energy=80, sight_range=6)
+        o = self.pop.view(0)
+        self.grid.update()
+        eq_(o.goal, self.grid.get_node(8, 8))
+        ok_(all(node.move_cost == 1 for node in o.path))
+        for i in range(20):
+            self.grid.update()
+        eq_(o.location, self.grid.get_node(8, 8))
+
+    def test_long_path(self):
+        grid = build_desert(40, 3)
+        grid.get_node(39, 1).set_plants(2, 1, 10)
+        pop = Population(grid, path_width=8)
+        o = pop.view(pop.add(grid.get_node(0, 1), energy=50, sight_range=40))
+        grid.update()
+        eq_(len(o.path), 8)
+        eq_(o.goal, grid.get_node(7, 1))
+        for i in range(60):
+            grid.update()
+        eq_(o.location, grid.get_node(39, 1))
+
+    def test_compact(self):
+        self.pop.add_many([1, 2, 3], [1, 2, 3], energy=95)
+        self.pop.energy[1] = -1
+        self.grid.update()
+        self.pop.compact()
+        eq_(self.pop.size, 2)
+        eq_(self.pop.x[:2].tolist(), [1, 3])
+
+    def test_occupancy(self):
+        self.pop.add_many([1, 1, 3], [2, 2, 0])
+        counts = self.pop.occupancy()
+        eq_(counts[2, 1], 2)
+        eq_(counts[0, 3], 1)
+        eq_(counts.sum(), 3)
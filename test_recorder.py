@@ -0,0 +1,136 @@
+from nose.tools import *
+import os
+import tempfile
+import numpy as np
+import lifesim as ls
+import recorder
+from population import Population
+from recorder import Recorder, MOVE, GRAZE, BIRTH, DEATH
+
+
+def build_world():
+    grid = ls.Grid(15, 15, seed=2)
+    for row in grid.nodes:
+        for node in row:
+            node.set_plants(grid.random.choice([0, 0, 0, 5]), 1, 10)
+    for i in range(10):
+        o = ls.Organism(grid)
+        o.energy = 50
+        o.set_location(grid.random.choice(grid.cells()))
+    return grid
+
+
+def build_population_world():
+    grid = ls.Grid(20, 20, veg_arrays=True, seed=2)
+    grid.veg.fill(0, 1, 10)
+    for i in range(60):
+        grid.veg.set(grid.random.randrange(20), grid.random.randrange(20),
+                     5, 1, 10)
+    Population(grid, seed=2).add_many(
+        [grid.random.randrange(20) for i in range(80)],
+        [grid.random.randrange(20) for i in range(80)], energy=50.)
+    return grid
+
+
+def temp_path():
+    return os.path.join(tempfile.mkdtemp(), 'run.rec')
+
+
+def read_all(path):
+    return np.concatenate(list(recorder.read_chunks(path)))
+
+
+class TestRecorder(object):
+    def setup(self):
+        self.path = temp_path()
+
+    def teardown(self):
+        if Recorder.active is not None:
+            Recorder.active.close()
+
+    def test_objects(self):
+        grid = build_world()
+        with Recorder(self.path, chunk_size=16) as rec:
+            for i in range(12):
+                grid.update()
+            parent = grid.organisms[0]
+            parent.give_birth()
+            grid.organisms[1].die()
+        events = read_all(self.path)
+        eq_(len(events), rec.written)
+        ok_(np.all(np.diff(events['tick']) >= 0))
+        eq_(events['tick'][-1], 12)
+        ok_(not events['population'].any())
+        ok_((events['event'] == MOVE).any())
+        ok_((events['event'] == GRAZE).any())
+
+        births = events[events['event'] == BIRTH]
+        eq_(len(births), parent.litter_size)
+        ok_(np.all(births['parent'] == rec.ids[parent]))
+        deaths = events[events['event'] == DEATH]
+        eq_(len(deaths), 1)
+
+        #the last move of each organism is where it is now
+        moves = events[events['event'] == MOVE]
+        for org in grid.organisms:
+            mine = moves[moves['id'] == rec.ids.get(org, -1)]
+            if len(mine):
+                eq_((mine['x'][-1], mine['y'][-1]),
+                    (org.location.x, org.location.y))
+
+    def test_population(self):
+        grid = build_population_world()
+        pop = grid.population
+        pop.energy[:5] = -1
+        with Recorder(self.path, chunk_size=50):
+            for i in range(10):
+                grid.update()
+            pop.give_birth(10)
+        events = read_all(self.path)
+        ok_(events['population'].all())
+        deaths = events[events['event'] == DEATH]
+        eq_(sorted(deaths['id']), range(5))
+        births = events[events['event'] == BIRTH]
+        eq_(list(births['id']), range(80, 82))
+        ok_(np.all(births['parent'] == 10))
+        grazes = events[events['event'] == GRAZE]
+        ok_(len(grazes))
+        moves = events[events['event'] == MOVE]
+        for row in np.unique(moves['id']):
+            mine = moves[moves['id'] == row]
+            eq_((mine['x'][-1], mine['y'][-1]), (pop.x[row], pop.y[row]))
+
+    def test_read_ticks(self):
+        grid = build_population_world()
+        with Recorder(self.path, chunk_size=7):
+            for i in range(8):
+                grid.update()
+        #a second run appends to the same file
+        with Recorder(self.path, tick=8):
+            for i in range(4):
+                grid.update()
+        ticks = list(recorder.read_ticks(self.path))
+        numbers = [tick for tick, events in ticks]
+        eq_(numbers, sorted(set(numbers)))
+        eq_(numbers[-1], 11)
+        for tick, events in ticks:
+            ok_(np.all(events['tick'] == tick))
+        ok_(np.array_equal(np.concatenate([e for t, e in ticks]),
+                           read_all(self.path)))
+
+    def test_disable(self):
+        move = ls.Organism.__dict__['move']
+        rec = Recorder(self.path)
+        rec.enable()
+        ok_(ls.Organism.__dict__['move'] is not move)
+        assert_raises(RuntimeError, Recorder(temp_path()).enable)
+        rec.close()
+        ok_(ls.Organism.__dict__['move'] is move)
+        build_world().update()
+        eq_(list(recorder.read_chunks(self.path)), [])
+
+    def test_bad_file(self):
+        with open(self.path, 'wb') as f:
+            f.write('not a recording')
+        assert_raises(ValueError, list, recorder.read_ticks(self.path))
+        assert_raises(ValueError, Recorder(self.path).enable)